@@ -0,0 +1,182 @@
+"""
+memory_service 的本地 WAL（供 memory_service.py 使用）
+
+append-only JSON Lines，每行一条记录：
+  {"op": "enqueue", "episode": {...}}   入队（episode 记录须含 id）
+  {"op": "done", "id": ...}             已写入 graphiti
+
+写入先进入内存缓冲，由后台 flush 任务按时间间隔 / 条数批量 write + fsync
+（group commit），append_enqueue 在 fsync 完成后才返回。文件行数过多时
+重写为仅含未完成记录（压缩）。任何一次 flush / 压缩失败只记录日志并让
+该批等待者收到异常，flush 任务本身继续运行。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class JournalClosed(RuntimeError):
+    """journal 已关闭，不再接受写入。"""
+
+
+class EpisodeJournal:
+    """
+    append-only 本地 WAL。
+
+    replay() 在启动时读取文件并返回未完成的 episode 记录；start() 启动后台 flush；
+    close() 写完缓冲中的记录后停止。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.02,
+        flush_batch: int = 64,
+        compact_threshold: int = 5000,
+    ) -> None:
+        self.path = Path(path)
+        self.flush_interval = flush_interval        # 批量 fsync 间隔（秒）
+        self.flush_batch = flush_batch              # 积累到该条数立即 fsync
+        self.compact_threshold = compact_threshold  # 文件行数超过该值时压缩
+        self._buffer: list[tuple[str, asyncio.Future | None]] = []
+        self._live: dict[str, dict] = {}   # 尚未 done 的 episode 记录，用于压缩
+        self._lines = 0                     # 当前文件行数
+        self._file = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    # ── 启动：重放 + 压缩 ──
+
+    def replay(self) -> list[dict]:
+        """读取 WAL，返回尚未完成的 episode 记录（按原入队顺序），并把文件压缩为仅含这些记录。"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        live: dict[str, dict] = {}
+        if self.path.exists():
+            with self.path.open('r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时可能留下半行，忽略
+                        logger.warning('[journal] skipping corrupt line in %s', self.path)
+                        continue
+                    if entry.get('op') == 'enqueue':
+                        live.setdefault(entry['episode']['id'], entry['episode'])
+                    elif entry.get('op') == 'done':
+                        live.pop(entry.get('id'), None)
+        self._live = live
+        self._rewrite(list(live.values()))
+        return list(live.values())
+
+    def start(self) -> None:
+        self._closing = False
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """停止接受写入，等待后台任务完成最后一次 flush（不取消进行中的 fsync）。"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self._flush()  # 未 start 过时也写完缓冲
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    # ── 写入 ──
+
+    async def append_enqueue(self, record: dict) -> None:
+        """记录入队并等待落盘；落盘失败时抛出异常。"""
+        episode_id = record['id']
+        self._live[episode_id] = record
+        future = asyncio.get_running_loop().create_future()
+        self._submit(json.dumps({'op': 'enqueue', 'episode': record}, ensure_ascii=False), future)
+        try:
+            await future
+        except Exception:
+            self._live.pop(episode_id, None)
+            raise
+
+    def mark_done(self, episode_id: str) -> None:
+        """记录完成；无需等待落盘（丢失 done 只会导致重放时重复写入一次）。"""
+        self._live.pop(episode_id, None)
+        self._submit(json.dumps({'op': 'done', 'id': episode_id}), None)
+
+    def _submit(self, line: str, future: asyncio.Future | None) -> None:
+        if self._closing and self._task is None:
+            if future is not None:
+                future.set_exception(JournalClosed('journal is closed'))
+            return
+        self._buffer.append((line, future))
+        if len(self._buffer) >= self.flush_batch:
+            self._wakeup.set()
+
+    # ── 后台 flush ──
+
+    async def _flush_loop(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self) -> None:
+        """写一批并 fsync；失败时让该批等待者收到异常，不向上抛出。"""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write_lines, [line for line, _ in batch])
+        except Exception as exc:
+            logger.error('[journal] fsync failed (%d records): %s', len(batch), exc)
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+            return
+        for _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+        if self._lines > self.compact_threshold and self._lines > 2 * len(self._live):
+            try:
+                await asyncio.to_thread(self._rewrite, list(self._live.values()))
+            except Exception as exc:
+                # 压缩失败不影响正确性：原文件仍完整，下次 flush 再尝试
+                logger.error('[journal] compaction failed: %s', exc)
+
+    def _write_lines(self, lines: list[str]) -> None:
+        if self._file is None:
+            self._file = self.path.open('a', encoding='utf-8')
+        self._file.write(''.join(line + '\n' for line in lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._lines += len(lines)
+
+    def _rewrite(self, records: list[dict]) -> None:
+        """原子地把 WAL 重写为仅含 live 记录（tmp + fsync + rename）。"""
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with tmp_path.open('w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps({'op': 'enqueue', 'episode': record}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # Windows 上无法替换仍被打开的文件，先关闭；替换失败时重新打开原文件继续追加
+        if self._file:
+            self._file.close()
+            self._file = None
+        try:
+            os.replace(tmp_path, self.path)
+        finally:
+            self._file = self.path.open('a', encoding='utf-8')
+        self._lines = len(records)
+        logger.info('[journal] compacted %s: %d live episodes', self.path, len(records))
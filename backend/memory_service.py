@@ -2,11 +2,21 @@
 Graphiti 记忆层服务 — FIFO Queue 版本
 
 架构：
-  写入：WriteRequest → asyncio.Queue（FIFO）→ 单一 worker 顺序调用 graphiti
+  写入：WriteRequest → 按 group 分片的 FIFO 队列 → N 个 worker 并发调用 graphiti
+        （同一 group 严格顺序，不同 group 之间并发）
   读取：Search = graphiti 已处理 facts  +  队列中尚未处理的 pending 原文
 
   这样无论 graphiti 处理快慢，搜索都能拿到完整的记忆视图。
 
+合并：
+  worker 取出某 group 的队首 episode 时，把紧随其后、reference_time 在合并窗口内的
+  同组 episode 一并取出，拼成一个 episode 调用 add_episode，减少 LLM 抽取次数。
+
+持久化：
+  每个 episode 入队前先追加到本地 WAL（memory_journal.py，JSON Lines，批量 fsync），
+  写入 graphiti 成功后追加 done 标记；服务启动时重放未完成的 episode。add_episode 失败时按
+  指数退避重试，重试期间该 group 暂停出队以保持顺序。
+
 Run: uvicorn memory_service:app --port 8000 --reload
 """
 
@@ -16,14 +26,20 @@ import logging
 import os
 import re
 import sys
+import time
+from collections import Counter, OrderedDict, deque
+from collections.abc import Iterator
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from inspect import signature
+from itertools import islice
 from uuid import uuid4
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -40,6 +56,18 @@ from graphiti_core.llm_client.config import LLMConfig  # noqa: E402
 from graphiti_core.llm_client.openai_generic_client import OpenAIGenericClient  # noqa: E402
 from graphiti_core.nodes import EpisodeType  # noqa: E402
 
+from memory_journal import EpisodeJournal  # noqa: E402
+from text_search import bm25_idf, bm25_term_score, tokenize  # noqa: E402
+
+# 底层 search 支持传入预先计算的 query_vector 时，批量检索可合并 embedding 调用
+try:
+    from graphiti_core.search.search import search as graphiti_search  # noqa: E402
+    from graphiti_core.search.search_config_recipes import EDGE_HYBRID_SEARCH_RRF  # noqa: E402
+    from graphiti_core.search.search_filters import SearchFilters  # noqa: E402
+    QUERY_VECTOR_SEARCH = 'query_vector' in signature(graphiti_search).parameters
+except ImportError:
+    QUERY_VECTOR_SEARCH = False
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
@@ -53,6 +81,49 @@ LLM_MODEL        = os.getenv('LLM_MODEL',            'qwen-plus')
 SMALL_LLM_MODEL  = os.getenv('LLM_SMALL_MODEL',      'qwen-turbo')
 EMBEDDING_MODEL  = os.getenv('LLM_EMBEDDING_MODEL',  'text-embedding-v3')
 
+# 并发 worker 数：不同 group 的 episode 可并发写入 graphiti，同一 group 始终串行
+WORKER_CONCURRENCY = max(1, int(os.getenv('MEMORY_WORKER_CONCURRENCY', '4')))
+
+# 本地 WAL：入队 episode 先落盘，崩溃/重启后重放
+WAL_PATH              = os.getenv('MEMORY_WAL_PATH', './data/memory_wal.jsonl')
+WAL_FLUSH_INTERVAL    = float(os.getenv('MEMORY_WAL_FLUSH_MS', '20')) / 1000   # 批量 fsync 间隔（秒）
+WAL_FLUSH_BATCH       = int(os.getenv('MEMORY_WAL_FLUSH_BATCH', '64'))         # 积累到该条数立即 fsync
+WAL_COMPACT_THRESHOLD = int(os.getenv('MEMORY_WAL_COMPACT_THRESHOLD', '5000')) # 文件行数超过该值时压缩
+
+# pending 检索：每个 group 只对最近 N 条 pending 打分，保证检索开销与积压深度无关
+PENDING_SEARCH_WINDOW = int(os.getenv('MEMORY_PENDING_SEARCH_WINDOW', '200'))
+
+# graphiti 检索结果缓存（LRU + TTL，group 有新 episode 提交时失效）
+SEARCH_CACHE_SIZE = int(os.getenv('MEMORY_SEARCH_CACHE_SIZE', '1024'))
+SEARCH_CACHE_TTL  = float(os.getenv('MEMORY_SEARCH_CACHE_TTL', '30'))
+
+# 批量检索：单次请求的最大 (group, query) 组合数、并发 graphiti 检索数、单次 embedding 批大小
+BATCH_SEARCH_MAX_QUERIES  = int(os.getenv('MEMORY_BATCH_SEARCH_MAX_QUERIES', '50'))
+BATCH_SEARCH_CONCURRENCY  = int(os.getenv('MEMORY_BATCH_SEARCH_CONCURRENCY', '8'))
+EMBEDDING_BATCH_SIZE      = int(os.getenv('LLM_EMBEDDING_BATCH_SIZE', '10'))  # DashScope 单次最多 10 条
+
+# 同组 episode 合并：reference_time 与队首相差不超过窗口的连续 episode 合并写入（窗口为 0 时关闭）
+COALESCE_WINDOW       = float(os.getenv('MEMORY_COALESCE_WINDOW', '120'))      # 秒
+COALESCE_MAX_EPISODES = max(1, int(os.getenv('MEMORY_COALESCE_MAX_EPISODES', '10')))
+COALESCE_MAX_CHARS    = int(os.getenv('MEMORY_COALESCE_MAX_CHARS', '4000'))
+
+# 写入准入控制（backlog = 已入队但尚未写入 graphiti 的 episode 数）
+#   backlog ≥ HIGH_WATERMARK 进入过载状态，拒绝低优先级来源，直到回落到 LOW_WATERMARK 以下；
+#   backlog ≥ HARD_LIMIT 或单个 group 积压 ≥ GROUP_QUOTA 时拒绝所有写入（429 + Retry-After）
+QUEUE_HIGH_WATERMARK = int(os.getenv('MEMORY_QUEUE_HIGH_WATERMARK', '2000'))
+QUEUE_LOW_WATERMARK  = int(os.getenv('MEMORY_QUEUE_LOW_WATERMARK', '1500'))
+QUEUE_HARD_LIMIT     = int(os.getenv('MEMORY_QUEUE_HARD_LIMIT', '5000'))
+GROUP_QUOTA          = int(os.getenv('MEMORY_GROUP_QUOTA', '300'))
+LOW_PRIORITY_SOURCES = frozenset(
+    src.strip() for src in os.getenv('MEMORY_LOW_PRIORITY_SOURCES', 'timed_snapshot,ai_inferred').split(',')
+    if src.strip()
+)
+
+# add_episode 失败重试（指数退避）
+RETRY_MAX_ATTEMPTS = int(os.getenv('MEMORY_RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY   = float(os.getenv('MEMORY_RETRY_BASE_DELAY', '2.0'))
+RETRY_MAX_DELAY    = float(os.getenv('MEMORY_RETRY_MAX_DELAY', '60.0'))
+
 # ---------------------------------------------------------------------------
 # Extraction instructions
 # ---------------------------------------------------------------------------
@@ -109,45 +180,514 @@ class QueuedEpisode:
     reference_time: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
     safe_group_id: str       = ''
     queued_at: datetime      = field(default_factory=lambda: datetime.now(timezone.utc))
+    attempts: int            = 0   # 已失败的 add_episode 次数（不持久化）
+
+    def to_record(self) -> dict:
+        return {
+            'id': self.id,
+            'episode_name': self.episode_name,
+            'content': self.content,
+            'reference_time': self.reference_time.isoformat(),
+            'safe_group_id': self.safe_group_id,
+            'queued_at': self.queued_at.isoformat(),
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'QueuedEpisode':
+        return cls(
+            id=record['id'],
+            episode_name=record['episode_name'],
+            content=record['content'],
+            reference_time=datetime.fromisoformat(record['reference_time']),
+            safe_group_id=record['safe_group_id'],
+            queued_at=datetime.fromisoformat(record['queued_at']),
+        )
+
+
+class GroupedEpisodeQueue:
+    """
+    按 safe_group_id 分片的 FIFO 队列。
+
+    - 同一 group 内严格按入队顺序出队，且同一时刻最多被一个 worker 持有
+      （graphiti 要求同一 group 的 episodes 顺序写入）；
+    - 不同 group 轮流进入 ready 队列，可被多个 worker 并发处理，
+      一个孩子的积压不会阻塞其他孩子的写入。
+    """
+
+    def __init__(self) -> None:
+        self._shards: dict[str, deque[QueuedEpisode]] = {}
+        self._ready: asyncio.Queue[str] = asyncio.Queue()  # 有待处理 episode 且未被持有的 group
+        self._active: set[str] = set()                     # 正被某个 worker 持有的 group
+        self._size = 0
+
+    def put_nowait(self, episode: QueuedEpisode) -> None:
+        group_id = episode.safe_group_id
+        shard = self._shards.get(group_id)
+        if shard is None:
+            shard = self._shards[group_id] = deque()
+        if not shard and group_id not in self._active:
+            self._ready.put_nowait(group_id)
+        shard.append(episode)
+        self._size += 1
+
+    async def acquire(self) -> list[QueuedEpisode]:
+        """
+        取出下一个可处理 group 的队首 episode 及可与之合并的后续 episode，
+        并持有该 group 直到 release。
+        """
+        group_id = await self._ready.get()
+        self._active.add(group_id)
+        shard = self._shards[group_id]
+        batch = [shard.popleft()]
+        chars = len(batch[0].content)
+        while shard and len(batch) < COALESCE_MAX_EPISODES:
+            nxt = shard[0]
+            if abs((nxt.reference_time - batch[0].reference_time).total_seconds()) > COALESCE_WINDOW:
+                break
+            if chars + len(nxt.content) > COALESCE_MAX_CHARS:
+                break
+            batch.append(shard.popleft())
+            chars += len(nxt.content)
+        self._size -= len(batch)
+        return batch
+
+    def release(self, group_id: str) -> None:
+        """释放 group：若仍有积压则排到 ready 队尾（各 group 轮转，保证公平）。"""
+        self._active.discard(group_id)
+        if self._shards.get(group_id):
+            self._ready.put_nowait(group_id)
+        else:
+            self._shards.pop(group_id, None)
+
+    def retry_later(self, batch: list[QueuedEpisode], delay: float) -> None:
+        """
+        把失败的 episodes 按原顺序放回所属 group 的队首，delay 秒后再放行该 group。
+        期间 group 保持持有状态，后续同组 episode 不会越过它们先写入。
+        """
+        group_id = batch[0].safe_group_id
+        self._shards.setdefault(group_id, deque()).extendleft(reversed(batch))
+        self._size += len(batch)
+        asyncio.get_running_loop().call_later(delay, self._reactivate, group_id)
+
+    def _reactivate(self, group_id: str) -> None:
+        self._active.discard(group_id)
+        if self._shards.get(group_id):
+            self._ready.put_nowait(group_id)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def group_size(self, group_id: str) -> int:
+        shard = self._shards.get(group_id)
+        return len(shard) if shard else 0
+
+    def group_sizes(self) -> dict[str, int]:
+        return {gid: len(shard) for gid, shard in self._shards.items() if shard}
+
+
+class PendingStore:
+    """
+    已入队但尚未写入 graphiti 的 episode 索引（供 search 读取）。
+
+    按 episode id 索引，同时按 group 分桶；dict 保持插入顺序，
+    因此增删均为 O(1)，按 group 读取只与该 group 的积压量相关。
+    入库时预先分词，search 用 BM25 对该 group 最近的 pending 打分。
+    """
+
+    def __init__(self) -> None:
+        self._by_id: dict[str, QueuedEpisode] = {}
+        self._by_group: dict[str, dict[str, QueuedEpisode]] = {}
+        self._terms: dict[str, tuple[Counter, int]] = {}   # episode id → (词频, 文档长度)
+
+    def add(self, episode: QueuedEpisode) -> None:
+        self._by_id[episode.id] = episode
+        self._by_group.setdefault(episode.safe_group_id, {})[episode.id] = episode
+        terms = tokenize(episode.content)
+        self._terms[episode.id] = (Counter(terms), len(terms))
+
+    def remove(self, episode_id: str) -> QueuedEpisode | None:
+        episode = self._by_id.pop(episode_id, None)
+        self._terms.pop(episode_id, None)
+        if episode is not None:
+            bucket = self._by_group.get(episode.safe_group_id)
+            if bucket is not None:
+                bucket.pop(episode_id, None)
+                if not bucket:
+                    del self._by_group[episode.safe_group_id]
+        return episode
+
+    def for_group(self, group_id: str) -> list[QueuedEpisode]:
+        """该 group 的 pending episodes（按入队顺序）。"""
+        return list(self._by_group.get(group_id, {}).values())
+
+    def search(self, group_id: str, query: str, limit: int) -> list[QueuedEpisode]:
+        """
+        按 BM25 相关度返回该 group 最相关的 pending episodes（最多 limit 条）。
+
+        只对最近 PENDING_SEARCH_WINDOW 条打分；query 无可用词项时返回最新的 limit 条，
+        与 query 无任何词项重合的 episode 不返回。
+        """
+        bucket = self._by_group.get(group_id)
+        if not bucket or limit <= 0:
+            return []
+        window = list(islice(reversed(bucket.values()), PENDING_SEARCH_WINDOW))  # 新 → 旧
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return window[:limit]
+
+        docs = [(ep, *self._terms[ep.id]) for ep in window]
+        n_docs = len(docs)
+        avg_len = max(sum(length for _, _, length in docs) / n_docs, 1.0)
+        idf = {}
+        for term in query_terms:
+            df = sum(1 for _, tf, _ in docs if term in tf)
+            if df:
+                idf[term] = bm25_idf(n_docs, df)
+
+        scored: list[tuple[float, QueuedEpisode]] = []
+        for ep, tf, length in docs:
+            score = sum(
+                bm25_term_score(weight, tf[term], length, avg_len)
+                for term, weight in idf.items()
+                if term in tf
+            )
+            if score > 0:
+                scored.append((score, ep))
+        # sort 稳定：同分时较新的 episode 在前
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [ep for _, ep in scored[:limit]]
+
+    def group_count(self, group_id: str) -> int:
+        return len(self._by_group.get(group_id, ()))
+
+    def group_counts(self) -> dict[str, int]:
+        return {gid: len(bucket) for gid, bucket in self._by_group.items()}
+
+    def oldest(self) -> QueuedEpisode | None:
+        return next(iter(self._by_id.values()), None)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[QueuedEpisode]:
+        return iter(self._by_id.values())
+
+
+class SearchCache:
+    """
+    graphiti 检索结果的 LRU + TTL 缓存，键为 (group, 规范化 query, num_results)。
+
+    worker 提交某 group 的 episode 后调用 invalidate_group 使该 group 全部条目失效；
+    每个 group 维护一个代号（generation），检索开始前取代号，写回时代号已变化
+    说明期间有新提交，结果丢弃不缓存，避免把旧结果写回。
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, list]] = OrderedDict()
+        self._group_keys: dict[str, set[tuple]] = {}
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(group_id: str, query: str, num_results: int) -> tuple:
+        return group_id, ' '.join(query.lower().split()), num_results
+
+    def generation(self, group_id: str) -> int:
+        return self._generations.get(group_id, 0)
+
+    def get(self, key: tuple) -> list | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, value: list, generation: int) -> None:
+        group_id = key[0]
+        if self.max_size <= 0 or generation != self.generation(group_id):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._group_keys.setdefault(group_id, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate_group(self, group_id: str) -> None:
+        self._generations[group_id] = self.generation(group_id) + 1
+        for key in self._group_keys.pop(group_id, ()):
+            self._entries.pop(key, None)
+
+    def _discard(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+        keys = self._group_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._group_keys[key[0]]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class RateMeter:
+    """滑动窗口计数器：统计最近 window 秒内的事件速率（次/秒）。"""
+
+    def __init__(self, window: float = 60.0) -> None:
+        self.window = window
+        self._events: deque[tuple[float, int]] = deque()
+        self._total = 0
+
+    def add(self, count: int = 1) -> None:
+        now = time.monotonic()
+        self._events.append((now, count))
+        self._total += count
+        self._trim(now)
+
+    def rate(self) -> float:
+        self._trim(time.monotonic())
+        return self._total / self.window
+
+    def _trim(self, now: float) -> None:
+        while self._events and self._events[0][0] < now - self.window:
+            self._total -= self._events.popleft()[1]
+
+
+# 批量写入的逐条结果状态
+ADMIT_ACCEPTED   = 'accepted'
+ADMIT_SHED       = 'shed'
+ADMIT_OVER_QUOTA = 'over_quota'
+
+
+class AdmissionController:
+    """
+    写入准入控制：高/低水位滞回 + 全局硬上限 + 单 group 配额。
+
+    过载（backlog 越过高水位，直到回落到低水位以下）时优先拒绝低优先级来源，
+    普通来源只在达到硬上限或 group 配额时被拒绝。
+    """
+
+    def __init__(self) -> None:
+        self.overloaded = False
+        self.rejected = 0
+        self.shed = 0
+
+    def check(self, backlog: int, group_backlog: int, source: str | None) -> tuple[str, str] | None:
+        """
+        返回 (状态, 原因)；允许写入时返回 None。
+
+        状态为 over_quota（达到硬上限或 group 配额，稍后可重试）
+        或 shed（过载时丢弃的低优先级来源，调用方不应立即重试）。
+        """
+        if backlog >= QUEUE_HIGH_WATERMARK:
+            if not self.overloaded:
+                logger.warning('[admission] backlog %d ≥ high watermark, shedding low-priority writes', backlog)
+            self.overloaded = True
+        elif self.overloaded and backlog <= QUEUE_LOW_WATERMARK:
+            logger.info('[admission] backlog %d ≤ low watermark, accepting all writes', backlog)
+            self.overloaded = False
+
+        if backlog >= QUEUE_HARD_LIMIT:
+            self.rejected += 1
+            return ADMIT_OVER_QUOTA, f'queue full ({backlog} ≥ {QUEUE_HARD_LIMIT})'
+        if group_backlog >= GROUP_QUOTA:
+            self.rejected += 1
+            return ADMIT_OVER_QUOTA, f'group quota exceeded ({group_backlog} ≥ {GROUP_QUOTA})'
+        if self.overloaded and source in LOW_PRIORITY_SOURCES:
+            self.shed += 1
+            return ADMIT_SHED, f'overloaded, shedding low-priority source {source}'
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Prometheus 文本格式指标（无外部依赖的最小实现）
+# ---------------------------------------------------------------------------
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    inner = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    )
+    return '{' + inner + '}'
+
+
+class MetricCounter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for key, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return lines
+
+
+class MetricHistogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}   # labels → [各 bucket 计数, sum, count]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, (bucket_counts, total, count) in self._series.items():
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", repr(bound)),))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+def _render_gauge(name: str, help_text: str, samples: list[tuple[dict, float]]) -> list[str]:
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+    return lines
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_EPISODE_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+_WAIT_BUCKETS    = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+METRIC_ADD_EPISODE_SECONDS = MetricHistogram(
+    'memory_add_episode_duration_seconds', 'graphiti add_episode duration by outcome', _EPISODE_BUCKETS,
+)
+METRIC_EPISODES_TOTAL = MetricCounter(
+    'memory_episodes_total', 'Queued episodes by final outcome (committed / given_up)',
+)
+METRIC_EPISODE_RETRIES_TOTAL = MetricCounter(
+    'memory_episode_retries_total', 'Failed add_episode attempts rescheduled for retry (per episode)',
+)
+METRIC_SEARCH_SECONDS = MetricHistogram(
+    'memory_search_duration_seconds', 'Search latency by backend (graphiti / pending)', _LATENCY_BUCKETS,
+)
+METRIC_QUEUE_WAIT_SECONDS = MetricHistogram(
+    'memory_queue_wait_seconds', 'Time from queued_at to graphiti commit per episode', _WAIT_BUCKETS,
+)
 
 
 # 全局队列状态（asyncio 单线程安全）
-_episode_queue:   asyncio.Queue      = asyncio.Queue()   # 驱动 worker 的任务队列
-_pending_buffer:  list[QueuedEpisode] = []               # 已入队但未写入 graphiti，供 search 读取
-_worker_task:     asyncio.Task | None = None
+_episode_queue:   GroupedEpisodeQueue = GroupedEpisodeQueue()  # 驱动 worker 的分片任务队列
+_pending_buffer:  PendingStore        = PendingStore()          # 已入队但未写入 graphiti，供 search 读取
+_worker_tasks:    list[asyncio.Task]  = []
+_journal:         EpisodeJournal      = EpisodeJournal(
+    WAL_PATH,
+    flush_interval=WAL_FLUSH_INTERVAL,
+    flush_batch=WAL_FLUSH_BATCH,
+    compact_threshold=WAL_COMPACT_THRESHOLD,
+)
+_search_cache:    SearchCache         = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+_admission:       AdmissionController = AdmissionController()
+_reserved:        Counter             = Counter()             # 已通过准入、WAL 尚未落盘的条数（按 group）
+_commit_rate:     RateMeter           = RateMeter()           # 已写入 graphiti 的 episode 速率
 
 # ---------------------------------------------------------------------------
-# Queue Worker — 顺序处理，graphiti 要求 episodes 不能并发写入
+# Queue Worker — 同一 group 顺序处理，graphiti 要求同组 episodes 不能并发写入
 # ---------------------------------------------------------------------------
 
-async def _queue_worker() -> None:
+async def _queue_worker(worker_id: int) -> None:
     """
-    从 _episode_queue 中逐一取出 episode，顺序写入 graphiti。
-    写入完成（无论成功失败）后从 _pending_buffer 移除。
+    从 _episode_queue 中取出 episode（可能已合并多条）写入 graphiti。
+    持有 group 期间其他 worker 不会处理同组 episode，因此同组严格按入队顺序写入。
+
+    - 成功：WAL 标记 done，移出 _pending_buffer；
+    - 失败：指数退避后重试（episodes 留在 group 队首，pending 仍可搜索）；
+    - 超过最大重试次数：移出内存队列，但 WAL 中保留，下次启动时重放。
     """
-    global _pending_buffer
     while True:
-        episode: QueuedEpisode = await _episode_queue.get()
+        batch = await _episode_queue.acquire()
+        head = batch[0]
+        group_id = head.safe_group_id
+        name, body = _coalesce(batch)
+        finished = True
+        started = time.perf_counter()
         try:
-            if graphiti_client is not None:
-                await graphiti_client.add_episode(
-                    name=episode.episode_name,
-                    episode_body=episode.content,
-                    source=EpisodeType.text,
-                    source_description='ASD intervention observation',
-                    reference_time=episode.reference_time,
-                    group_id=episode.safe_group_id,
-                    custom_extraction_instructions=EXTRACT_INSTRUCTION,
+            if graphiti_client is None:
+                raise RuntimeError('graphiti_client is None')
+            await graphiti_client.add_episode(
+                name=name,
+                episode_body=body,
+                source=EpisodeType.text,
+                source_description='ASD intervention observation',
+                reference_time=head.reference_time,
+                group_id=group_id,
+                custom_extraction_instructions=EXTRACT_INSTRUCTION,
+            )
+            METRIC_ADD_EPISODE_SECONDS.observe(time.perf_counter() - started, outcome='success')
+            committed_at = datetime.now(timezone.utc)
+            for episode in batch:
+                _journal.mark_done(episode.id)
+                METRIC_QUEUE_WAIT_SECONDS.observe((committed_at - episode.queued_at).total_seconds())
+            METRIC_EPISODES_TOTAL.inc(len(batch), outcome='committed')
+            _search_cache.invalidate_group(group_id)
+            _commit_rate.add(len(batch))
+            logger.info('[queue_worker#%d] committed: %s (%d episodes)', worker_id, name, len(batch))
+        except Exception as exc:
+            METRIC_ADD_EPISODE_SECONDS.observe(time.perf_counter() - started, outcome='failure')
+            head.attempts += 1
+            if head.attempts < RETRY_MAX_ATTEMPTS:
+                delay = min(RETRY_BASE_DELAY * 2 ** (head.attempts - 1), RETRY_MAX_DELAY)
+                logger.warning(
+                    '[queue_worker#%d] failed [%s] attempt %d/%d, retry in %.1fs: %s',
+                    worker_id, name, head.attempts, RETRY_MAX_ATTEMPTS, delay, exc,
                 )
-                logger.info('[queue_worker] committed: %s', episode.episode_name)
+                _episode_queue.retry_later(batch, delay)
+                METRIC_EPISODE_RETRIES_TOTAL.inc(len(batch))
+                finished = False
             else:
-                logger.warning('[queue_worker] graphiti_client is None, skipping: %s', episode.episode_name)
-        except Exception as exc:
-            logger.error('[queue_worker] failed [%s]: %s', episode.episode_name, exc)
+                logger.error(
+                    '[queue_worker#%d] giving up [%s] after %d attempts (kept in WAL for replay): %s',
+                    worker_id, name, head.attempts, exc,
+                )
+                METRIC_EPISODES_TOTAL.inc(len(batch), outcome='given_up')
         finally:
-            # 无论成功失败，移出 pending buffer（已处理或已失败）
-            _pending_buffer = [e for e in _pending_buffer if e.id != episode.id]
-            _episode_queue.task_done()
+            if finished:
+                for episode in batch:
+                    _pending_buffer.remove(episode.id)
+                _episode_queue.release(group_id)
+
+
+def _coalesce(batch: list[QueuedEpisode]) -> tuple[str, str]:
+    """把同组连续 episodes 合并为一个 (name, body)；单条时原样返回。"""
+    head = batch[0]
+    if len(batch) == 1:
+        return head.episode_name, head.content
+    name = f'{head.episode_name} (+{len(batch) - 1})'
+    body = '\n'.join(episode.content for episode in batch)
+    return name, body
 
 # ---------------------------------------------------------------------------
 # Graphiti singleton + lifespan
@@ -158,7 +698,7 @@ graphiti_client: Graphiti | None = None
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    global graphiti_client, _worker_task
+    global graphiti_client
 
     llm_client = OpenAIGenericClient(
         config=LLMConfig(
@@ -190,20 +730,29 @@ async def lifespan(_: FastAPI):
     )
     await graphiti_client.build_indices_and_constraints()
 
-    # 启动 FIFO worker
-    _worker_task = asyncio.create_task(_queue_worker())
-    logger.info('[lifespan] FIFO queue worker started')
+    # 重放 WAL 中未完成的 episode（崩溃 / 重启前已入队但未写入 graphiti）
+    replayed = [QueuedEpisode.from_record(record) for record in _journal.replay()]
+    for episode in replayed:
+        _pending_buffer.add(episode)
+        _episode_queue.put_nowait(episode)
+    _journal.start()
+    logger.info('[lifespan] replayed %d episodes from %s', len(replayed), WAL_PATH)
+
+    # 启动 FIFO workers
+    _worker_tasks[:] = [
+        asyncio.create_task(_queue_worker(i)) for i in range(WORKER_CONCURRENCY)
+    ]
+    logger.info('[lifespan] %d FIFO queue workers started', len(_worker_tasks))
 
     yield
 
-    # 关闭：取消 worker
-    if _worker_task:
-        _worker_task.cancel()
-        try:
-            await _worker_task
-        except asyncio.CancelledError:
-            pass
-    logger.info('[lifespan] FIFO queue worker stopped')
+    # 关闭：取消 workers
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    await _journal.close()
+    logger.info('[lifespan] FIFO queue workers stopped')
 
 
 # ---------------------------------------------------------------------------
@@ -241,6 +790,11 @@ class WriteRequest(BaseModel):
     group_id: str
     content: str
     reference_time: str  # ISO 8601
+    source: str | None = None  # 事件来源（EventSource 值），用于过载时按优先级丢弃
+
+
+class BatchWriteRequest(BaseModel):
+    episodes: list[WriteRequest]
 
 
 class SearchRequest(BaseModel):
@@ -260,6 +814,22 @@ class SearchResponse(BaseModel):
     facts: list[FactItem]
 
 
+class BatchSearchRequest(BaseModel):
+    group_ids: list[str]
+    queries: list[str]
+    num_results: int = 10
+
+
+class BatchSearchResult(BaseModel):
+    group_id: str
+    query: str
+    facts: list[FactItem]
+
+
+class BatchSearchResponse(BaseModel):
+    results: list[BatchSearchResult]   # 按 group_ids × queries 的顺序排列
+
+
 # ---------------------------------------------------------------------------
 # Endpoints
 # ---------------------------------------------------------------------------
@@ -271,14 +841,67 @@ async def healthcheck():
         'status': 'healthy',
         'queue_pending': _episode_queue.qsize(),
         'buffer_size': len(_pending_buffer),
+        'workers': len(_worker_tasks),
+        'search_cache': _search_cache.stats(),
+        'backpressure': _backpressure_stats(),
     }
 
 
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式指标：写入耗时、检索耗时、排队时间、积压与准入统计。"""
+    oldest = _pending_buffer.oldest()
+    oldest_age = (datetime.now(timezone.utc) - oldest.queued_at).total_seconds() if oldest else 0.0
+    lines: list[str] = []
+    for metric in (
+        METRIC_ADD_EPISODE_SECONDS,
+        METRIC_EPISODES_TOTAL,
+        METRIC_EPISODE_RETRIES_TOTAL,
+        METRIC_SEARCH_SECONDS,
+        METRIC_QUEUE_WAIT_SECONDS,
+    ):
+        lines += metric.render()
+    lines += _render_gauge('memory_backlog', 'Episodes queued but not yet committed to graphiti',
+                           [({}, len(_pending_buffer))])
+    lines += _render_gauge('memory_group_backlog', 'Per-group episodes queued but not yet committed',
+                           [({'group_id': gid}, n) for gid, n in _pending_buffer.group_counts().items()])
+    lines += _render_gauge('memory_oldest_pending_age_seconds', 'Age of the oldest uncommitted episode',
+                           [({}, oldest_age)])
+    lines += _render_gauge('memory_commit_rate_per_second', 'Episodes committed per second (last 60s)',
+                           [({}, _commit_rate.rate())])
+    lines += _render_gauge('memory_workers', 'Running queue workers', [({}, len(_worker_tasks))])
+    lines += _render_gauge('memory_overloaded', '1 while low-priority writes are being shed',
+                           [({}, int(_admission.overloaded))])
+    lines += [
+        '# HELP memory_admission_rejected_total Writes rejected by admission control',
+        '# TYPE memory_admission_rejected_total counter',
+        f'memory_admission_rejected_total{{reason="limit"}} {_admission.rejected}',
+        f'memory_admission_rejected_total{{reason="shed"}} {_admission.shed}',
+        '# HELP memory_search_cache_requests_total Graphiti search cache lookups',
+        '# TYPE memory_search_cache_requests_total counter',
+        f'memory_search_cache_requests_total{{result="hit"}} {_search_cache.hits}',
+        f'memory_search_cache_requests_total{{result="miss"}} {_search_cache.misses}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
 @app.get('/api/memory/queue/status')
-async def queue_status():
-    """调试接口：查看当前队列状态。"""
+async def queue_status(group_id: str | None = None, limit: int = 50):
+    """
+    调试接口：查看当前队列状态。
+
+    默认只返回每个 group 的积压计数和最多 limit 条 pending 预览；
+    传 group_id 时只列出该 group 的 pending 条目。
+    """
+    if group_id is not None:
+        episodes = _pending_buffer.for_group(sanitize_group_id(group_id))
+    else:
+        episodes = _pending_buffer
     return {
         'queue_size': _episode_queue.qsize(),
+        'buffer_size': len(_pending_buffer),
+        'group_queue_sizes': _episode_queue.group_sizes(),
+        'group_pending_counts': _pending_buffer.group_counts(),
         'pending_buffer': [
             {
                 'id': e.id,
@@ -288,7 +911,7 @@ async def queue_status():
                 'queued_at': e.queued_at.isoformat(),
                 'content_preview': e.content[:80] + ('...' if len(e.content) > 80 else ''),
             }
-            for e in _pending_buffer
+            for e in islice(episodes, max(limit, 0))
         ],
     }
 
@@ -296,12 +919,142 @@ async def queue_status():
 @app.post('/api/memory/write', status_code=202)
 async def write_memory(req: WriteRequest):
     """
-    将 episode 推入 FIFO 队列，立即返回 202。
-    worker 按入队顺序逐一写入 graphiti（保证 graphiti 的顺序性要求）。
+    将 episode 推入所属 group 的 FIFO 队列，立即返回 202。
+    同一 group 按入队顺序逐一写入 graphiti（保证 graphiti 的顺序性要求）。
+    """
+    if graphiti_client is None:
+        raise HTTPException(status_code=503, detail='Graphiti not initialised')
+
+    rejection = _admit([req])[0]
+    if rejection is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=f'Memory service overloaded: {rejection[1]}',
+            headers={'Retry-After': str(_retry_after_seconds(len(_pending_buffer)))},
+        )
+    episode = _build_episode(req)
+    await _enqueue([episode])
+
+    logger.info('[write] queued: %s (queue_size=%d)', episode.episode_name, _episode_queue.qsize())
+    return {
+        'success': True,
+        'status': 'queued',
+        'episode_id': episode.id,
+        'queue_position': _episode_queue.group_size(episode.safe_group_id),
+    }
+
+
+@app.post('/api/memory/write/batch', status_code=202)
+async def write_memory_batch(req: BatchWriteRequest):
+    """
+    批量写入：一次请求入队多条 episode（共用一次 WAL fsync），立即返回 202。
+    同组 episodes 保持请求内顺序，并可在 worker 中合并为一次 add_episode。
+
+    准入检查逐条进行，results 与请求中的 episodes 一一对应：
+      accepted   已入队
+      shed       过载时丢弃的低优先级来源，不应立即重试
+      over_quota 达到硬上限或 group 配额，可在 retry_after 秒后重试
+    全部被拒绝时返回 429（响应体相同，并带 Retry-After 头）。
     """
     if graphiti_client is None:
         raise HTTPException(status_code=503, detail='Graphiti not initialised')
 
+    rejections = _admit(req.episodes)
+    accepted = [i for i, rejection in enumerate(rejections) if rejection is None]
+    episodes = [_build_episode(req.episodes[i]) for i in accepted]
+    await _enqueue(episodes)
+
+    retry_after = _retry_after_seconds(len(_pending_buffer))
+    episode_ids = dict(zip(accepted, (episode.id for episode in episodes)))
+    results = []
+    for i, rejection in enumerate(rejections):
+        if rejection is None:
+            results.append({'status': ADMIT_ACCEPTED, 'episode_id': episode_ids[i]})
+        elif rejection[0] == ADMIT_OVER_QUOTA:
+            results.append({'status': ADMIT_OVER_QUOTA, 'reason': rejection[1], 'retry_after': retry_after})
+        else:
+            results.append({'status': rejection[0], 'reason': rejection[1]})
+
+    logger.info(
+        '[write_batch] queued %d/%d episodes (queue_size=%d)',
+        len(episodes), len(req.episodes), _episode_queue.qsize(),
+    )
+    body = {
+        'success': bool(episodes) or not req.episodes,
+        'status': 'queued' if len(episodes) == len(req.episodes) else 'partial',
+        'episode_ids': [episode.id for episode in episodes],
+        'queue_size': _episode_queue.qsize(),
+        'results': results,
+    }
+    if req.episodes and not episodes:
+        return JSONResponse(status_code=429, content=body, headers={'Retry-After': str(retry_after)})
+    return body
+
+
+def _admit(requests: list[WriteRequest]) -> list[tuple[str, str] | None]:
+    """
+    逐条准入检查，返回与 requests 对应的 (状态, 原因)，通过的条目为 None。
+
+    通过的条目在返回前同步计入 _reserved：之后 _enqueue 等待 WAL 落盘期间，
+    并发请求的准入检查也会把这些名额算进积压，不会越过硬上限或 group 配额。
+    名额由 _enqueue 在写入 pending_buffer 或落盘失败时归还。
+    """
+    backlog = len(_pending_buffer) + _reserved.total()
+    added: Counter = Counter()
+    admitted = 0
+    results: list[tuple[str, str] | None] = []
+    for req in requests:
+        safe_group_id = sanitize_group_id(req.group_id)
+        rejection = _admission.check(
+            backlog + admitted,
+            _pending_buffer.group_count(safe_group_id) + _reserved[safe_group_id] + added[safe_group_id],
+            req.source,
+        )
+        if rejection is not None:
+            logger.warning('[admission] rejected write for %s: %s', safe_group_id, rejection[1])
+        else:
+            added[safe_group_id] += 1
+            admitted += 1
+        results.append(rejection)
+    _reserved.update(added)
+    return results
+
+
+def _release_reserved(episodes: list[QueuedEpisode]) -> None:
+    """归还 _admit 为这些 episodes 预留的名额。"""
+    _reserved.subtract(episode.safe_group_id for episode in episodes)
+    for group_id in [gid for gid, count in _reserved.items() if count <= 0]:
+        del _reserved[group_id]
+
+
+def _retry_after_seconds(backlog: int) -> int:
+    """预计积压回落到低水位所需时间（秒），限制在 [1, 300]。"""
+    rate = _commit_rate.rate()
+    excess = max(backlog - QUEUE_LOW_WATERMARK, 1)
+    if rate <= 0:
+        return 60
+    return int(min(max(excess / rate, 1), 300))
+
+
+def _backpressure_stats() -> dict:
+    oldest = _pending_buffer.oldest()
+    return {
+        'backlog': len(_pending_buffer),
+        'oldest_age_seconds': (
+            round((datetime.now(timezone.utc) - oldest.queued_at).total_seconds(), 1) if oldest else 0.0
+        ),
+        'commit_rate_per_second': round(_commit_rate.rate(), 3),
+        'overloaded': _admission.overloaded,
+        'rejected_total': _admission.rejected,
+        'shed_total': _admission.shed,
+        'high_watermark': QUEUE_HIGH_WATERMARK,
+        'low_watermark': QUEUE_LOW_WATERMARK,
+        'hard_limit': QUEUE_HARD_LIMIT,
+        'group_quota': GROUP_QUOTA,
+    }
+
+
+def _build_episode(req: WriteRequest) -> QueuedEpisode:
     try:
         reference_time = datetime.fromisoformat(req.reference_time)
         if reference_time.tzinfo is None:
@@ -309,25 +1062,29 @@ async def write_memory(req: WriteRequest):
     except ValueError:
         reference_time = datetime.now(timezone.utc)
 
-    safe_group_id = sanitize_group_id(req.group_id)
-    episode = QueuedEpisode(
+    return QueuedEpisode(
         episode_name=f'memory-{req.reference_time}',
         content=req.content,
         reference_time=reference_time,
-        safe_group_id=safe_group_id,
+        safe_group_id=sanitize_group_id(req.group_id),
     )
 
-    # 先写入 pending_buffer（立即对 search 可见），再放入 worker 队列
-    _pending_buffer.append(episode)
-    await _episode_queue.put(episode)
 
-    logger.info('[write] queued: %s (queue_size=%d)', episode.episode_name, _episode_queue.qsize())
-    return {
-        'success': True,
-        'status': 'queued',
-        'episode_id': episode.id,
-        'queue_position': _episode_queue.qsize(),
-    }
+async def _enqueue(episodes: list[QueuedEpisode]) -> None:
+    """
+    先落盘 WAL，再写入 pending_buffer（立即对 search 可见），最后放入 worker 队列。
+
+    episodes 须已经过 _admit；无论落盘成功与否都归还其预留名额（成功时改由 pending_buffer 计数）。
+    """
+    try:
+        await asyncio.gather(*(_journal.append_enqueue(episode.to_record()) for episode in episodes))
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f'Memory journal unavailable: {exc}') from exc
+    finally:
+        _release_reserved(episodes)
+    for episode in episodes:
+        _pending_buffer.add(episode)
+        _episode_queue.put_nowait(episode)
 
 
 @app.post('/api/memory/search', response_model=SearchResponse)
@@ -335,41 +1092,190 @@ async def search_memory(req: SearchRequest):
     """
     搜索记忆 = graphiti 已处理 facts（精炼） + pending buffer 原文（完整但未提取）。
 
-    pending 在前：代表最新的、尚未被 graphiti 提炼的原始观察。
-    graphiti 在后：代表经过实体提取、去重、时序建模的精炼事实。
+    pending：尚未被 graphiti 提炼的原始观察，本地 BM25 按 query 排序取 top-k。
+    graphiti：经过实体提取、去重、时序建模的精炼事实，按 graphiti 排序取 top-k。
+    两路按名次融合，总数不超过 num_results。
     """
     if graphiti_client is None:
         raise HTTPException(status_code=503, detail='Graphiti not initialised')
 
     safe_group_id = sanitize_group_id(req.group_id)
 
-    # ── 1. graphiti 已处理 facts ──
-    edges = await graphiti_client.search(
-        req.query,
-        group_ids=[safe_group_id],
-        num_results=req.num_results,
-    )
-    graphiti_facts = [
-        FactItem(
-            text=edge.fact,
-            valid_at=edge.valid_at.isoformat() if edge.valid_at else None,
-            invalid_at=edge.invalid_at.isoformat() if edge.invalid_at else None,
-            pending=False,
+    # ── 1. graphiti 已处理 facts（带缓存）──
+    graphiti_facts = await _search_graphiti(safe_group_id, req.query, req.num_results)
+
+    # ── 2. pending buffer — 本 group 内与 query 最相关的条目 ──
+    pending_facts = _search_pending(safe_group_id, req.query, req.num_results)
+
+    return SearchResponse(facts=_merge_ranked(pending_facts, graphiti_facts, req.num_results))
+
+
+@app.post('/api/memory/search/batch', response_model=BatchSearchResponse)
+async def search_memory_batch(req: BatchSearchRequest):
+    """
+    批量搜索：对 group_ids × queries 的每个组合返回与 /api/memory/search 相同的结果。
+
+    未命中缓存的 query 先合并为一次（分批的）embedding 调用，再并发执行 graphiti 检索，
+    省去 N 次往返和 N 次 embedding 请求。
+    """
+    if graphiti_client is None:
+        raise HTTPException(status_code=503, detail='Graphiti not initialised')
+
+    pairs = [(group_id, query) for group_id in req.group_ids for query in req.queries]
+    if len(pairs) > BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f'Too many queries: {len(pairs)} > {BATCH_SEARCH_MAX_QUERIES}',
         )
-        for edge in edges
-    ]
 
-    # ── 2. pending buffer — 仅属于本 group 的条目 ──
-    pending_facts = [
+    # ── 1. 查缓存，收集未命中的组合（规范化后相同的组合只检索一次）──
+    graphiti_results: dict[tuple, list[FactItem]] = {}
+    missing: dict[tuple, tuple[str, str]] = {}
+    for group_id, query in pairs:
+        safe_group_id = sanitize_group_id(group_id)
+        key = SearchCache.make_key(safe_group_id, query, req.num_results)
+        if key in graphiti_results or key in missing:
+            continue
+        cached = _search_cache.get(key)
+        if cached is not None:
+            graphiti_results[key] = cached
+        else:
+            missing[key] = (safe_group_id, query)
+
+    # ── 2. 一次性计算未命中 query 的 embedding，并发检索 graphiti ──
+    if missing:
+        vectors = await _embed_queries({query for _, query in missing.values()})
+        semaphore = asyncio.Semaphore(BATCH_SEARCH_CONCURRENCY)
+
+        async def run(key: tuple, safe_group_id: str, query: str) -> None:
+            async with semaphore:
+                generation = _search_cache.generation(safe_group_id)
+                facts = await _fetch_graphiti_facts(
+                    safe_group_id, query, req.num_results, vectors.get(query),
+                )
+            _search_cache.put(key, facts, generation)
+            graphiti_results[key] = facts
+
+        await asyncio.gather(*(run(key, gid, query) for key, (gid, query) in missing.items()))
+
+    # ── 3. 合并 pending ──
+    results = []
+    for group_id, query in pairs:
+        safe_group_id = sanitize_group_id(group_id)
+        key = SearchCache.make_key(safe_group_id, query, req.num_results)
+        pending_facts = _search_pending(safe_group_id, query, req.num_results)
+        results.append(BatchSearchResult(
+            group_id=group_id,
+            query=query,
+            facts=_merge_ranked(pending_facts, graphiti_results[key], req.num_results),
+        ))
+    return BatchSearchResponse(results=results)
+
+
+def _search_pending(safe_group_id: str, query: str, num_results: int) -> list[FactItem]:
+    started = time.perf_counter()
+    facts = [
         FactItem(
             text=ep.content,
             valid_at=ep.reference_time.isoformat(),
             invalid_at=None,
             pending=True,
         )
-        for ep in _pending_buffer
-        if ep.safe_group_id == safe_group_id
+        for ep in _pending_buffer.search(safe_group_id, query, num_results)
     ]
+    METRIC_SEARCH_SECONDS.observe(time.perf_counter() - started, backend='pending')
+    return facts
+
+
+async def _search_graphiti(safe_group_id: str, query: str, num_results: int) -> list[FactItem]:
+    """graphiti 混合检索；命中缓存时不访问 graphiti。"""
+    key = SearchCache.make_key(safe_group_id, query, num_results)
+    cached = _search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation = _search_cache.generation(safe_group_id)
+    facts = await _fetch_graphiti_facts(safe_group_id, query, num_results)
+    _search_cache.put(key, facts, generation)
+    return facts
+
+
+async def _fetch_graphiti_facts(
+    safe_group_id: str,
+    query: str,
+    num_results: int,
+    query_vector: list[float] | None = None,
+) -> list[FactItem]:
+    """执行一次 graphiti 边检索；给定 query_vector 时跳过内部的 embedding 调用。"""
+    started = time.perf_counter()
+    if query_vector is not None and QUERY_VECTOR_SEARCH:
+        config = EDGE_HYBRID_SEARCH_RRF.model_copy(deep=True)
+        config.limit = num_results
+        results = await graphiti_search(
+            graphiti_client.clients,
+            query,
+            [safe_group_id],
+            config,
+            SearchFilters(),
+            query_vector=query_vector,
+        )
+        edges = results.edges
+    else:
+        edges = await graphiti_client.search(
+            query,
+            group_ids=[safe_group_id],
+            num_results=num_results,
+        )
+    METRIC_SEARCH_SECONDS.observe(time.perf_counter() - started, backend='graphiti')
+    return [
+        FactItem(
+            text=edge.fact,
+            valid_at=edge.valid_at.isoformat() if edge.valid_at else None,
+            invalid_at=edge.invalid_at.isoformat() if edge.invalid_at else None,
+            pending=False,
+        )
+        for edge in edges
+    ]
+
 
-    # pending 在前（最新原始观察），graphiti 在后（历史精炼事实）
-    return SearchResponse(facts=pending_facts + graphiti_facts)
+async def _embed_queries(queries: set[str]) -> dict[str, list[float]]:
+    """批量计算 query embedding；不支持或失败时返回空 dict，由 graphiti 逐条计算。"""
+    if not QUERY_VECTOR_SEARCH:
+        return {}
+    texts = [q for q in queries if q.strip()]
+    try:
+        vectors: dict[str, list[float]] = {}
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            chunk = texts[start:start + EMBEDDING_BATCH_SIZE]
+            embeddings = await graphiti_client.embedder.create_batch(
+                [q.replace('\n', ' ') for q in chunk]
+            )
+            vectors.update(zip(chunk, embeddings))
+        return vectors
+    except Exception as exc:
+        logger.warning('[search_batch] batch embedding failed, falling back to per-query: %s', exc)
+        return {}
+
+
+# pending 与 graphiti 两路结果的分数不可比，用 Reciprocal Rank Fusion 按名次合并
+RRF_K = 60
+
+
+def _merge_ranked(pending: list[FactItem], graphiti: list[FactItem], limit: int) -> list[FactItem]:
+    """按名次融合两路结果并按文本去重后取 top-k；同名次时 pending（最新原始观察）在前。"""
+    fused = [
+        (1 / (RRF_K + rank), order, fact)
+        for order, facts in enumerate((pending, graphiti))
+        for rank, fact in enumerate(facts, 1)
+    ]
+    fused.sort(key=lambda item: (-item[0], item[1]))
+    merged: list[FactItem] = []
+    seen: set[str] = set()
+    for _, _, fact in fused:
+        if fact.text in seen:
+            continue
+        seen.add(fact.text)
+        merged.append(fact)
+        if len(merged) >= limit:
+            break
+    return merged
@@ -1,10 +1,28 @@
 """
 Qwen-Omni-Realtime WebSocket 服务器
 使用官方 Python SDK，通过 WebSocket 暴露给前端
+
+视频帧经 realtime_media.VideoFramePipeline 去重、缩放、重新编码后再上行，
+发送间隔随实测上行带宽自适应：REALTIME_UPLINK_BUDGET_KB 扣除正在上行的音频后
+剩余的带宽分给视频，间隔在 REALTIME_VIDEO_INTERVAL 与 REALTIME_VIDEO_MAX_INTERVAL 之间。
+
+音频 / 视频帧走二进制 WebSocket 消息（帧格式见 realtime_media），
+JSON 文本只用于控制消息；旧版 JSON 格式的 audio / image 消息仍兼容。
+
+上行音频先经过本地 VAD（realtime_media.VoiceActivityDetector）：静音不上行，
+一段话结束时自动 commit 并创建响应，不再依赖前端的 speech_end / commit。
+
+并发会话数由 realtime_session.SessionManager 限制（超出上限排队准入），
+每个会话的字节数与延迟统计在同一端口的 HTTP GET /stats 查看（/healthcheck 返回服务状态），
+由 websockets 的 process_request 钩子在握手前直接响应。
+
+系统提示词由 realtime_prompt 按节渲染并缓存；会话中可发送 update 消息
+更新游戏进度 / 历史，只有提示词实际变化时才调用 update_session。
 """
 
 import asyncio
 import websockets
+from websockets.protocol import State
 import json
 import base64
 import os
@@ -13,6 +31,18 @@ from dashscope.audio.qwen_omni import *
 import dashscope
 from dotenv import load_dotenv
 
+from realtime_media import (
+    FRAME_AUDIO_IN,
+    FRAME_VIDEO_IN,
+    NUMPY_AVAILABLE,
+    SequenceTracker,
+    VideoFramePipeline,
+    VoiceActivityDetector,
+    unpack_frame,
+)
+from realtime_prompt import PromptCache, diff_sections
+from realtime_session import OutboundItem, OutboundQueue, SessionManager, SessionRejected
+
 # 加载 .env 文件
 load_dotenv()
 
@@ -23,183 +53,267 @@ if not dashscope.api_key:
     raise ValueError('DASHSCOPE_API_KEY environment variable is not set')
 
 PORT = 8766
-
-
-def build_system_prompt(child_info: dict, game_info: dict, history_info: dict = None) -> str:
-    """构建简化的系统提示词（专注处理孩子分心）"""
-    
-    child_name = child_info.get('name', '孩子')
-    game_title = game_info.get('title', '游戏')
-    game_goal = game_info.get('goal', '')
-    game_steps = game_info.get('steps', [])
-    game_materials = game_info.get('materials', [])
-    
-    prompt = f"""# 角色：地板时光引导师
-
-你通过视频通话观察孩子，当孩子注意力分散时，引导家长用地板时光的方式处理。
-
-## 当前情况
-- 孩子：{child_name}
-- 游戏：{game_title}
-- 目标：{game_goal}"""
-    
-    if game_materials:
-        prompt += f"\n- 材料：{', '.join(game_materials)}"
-    
-    if game_steps:
-        prompt += "\n\n**游戏步骤（了解这些，才能在孩子分心时找到回归的桥梁）：**"
-        for i, step in enumerate(game_steps, 1):
-            step_title = step.get('stepTitle', f'第{i}步')
-            instruction = step.get('instruction', '')
-            prompt += f"\n{i}. {step_title}：{instruction}"
-    
-    prompt += """
-
-## 你的任务
-
-**只在孩子注意力分散时说话**
-
-当你看到孩子：
-- 不看游戏材料，看别的东西
-- 拿起其他物品
-- 走开或转身
-- 对游戏失去兴趣
-
-**立即引导家长：**
-
-### 四步法（Follow the Child's Lead）
-
-**1. 观察**
-看清孩子在做什么、看什么
-
-**2. 跟随**
-"你也[拿/看/做]一个，坐他旁边"
-
-**3. 互动**
-"[轻轻碰/慢慢靠近]，等他看你"
-
-**4. 桥梁（关键！）**
-结合游戏步骤和孩子当前兴趣，找到连接点：
-- 如果孩子在玩车，游戏是积木 → "把积木当车库/停车场"
-- 如果孩子在看窗外，游戏是认颜色 → "指外面的[颜色]，再指[游戏材料]"
-- 如果孩子在排列物品，游戏是分类 → "你也排一个，按[游戏目标]排"
-
-**核心思路：在孩子的兴趣中实现游戏目标**
-
-### 回复格式
-
-[孩子在做什么] 1句
-[家长怎么做] 1-2句
-[如何连接游戏] 1句（如果可能）
-
-**示例：**
-
-场景：游戏是"积木搭高塔"，孩子拿起小车
-"他拿车了。你也拿一辆，推到他面前。等他看你，把积木当车库，'车开进去'"
-
-场景：游戏是"认识颜色"，孩子看窗外的树
-"他在看树。你也看，'绿色的树'。指指绿色的[游戏材料]，'这个也是绿色'"
-
-场景：游戏是"物品分类"，孩子在排列玩具
-"他在排玩具。你也排一个，慢慢按[大小/颜色]排，看他会不会跟着分"
-
-场景：游戏是"角色扮演"，孩子趴在地上看蚂蚁
-"他在看蚂蚁。蹲下来一起看。'小蚂蚁在搬家'，拿[游戏材料]，'我们也搬家'"
-
-## 核心原则
-
-✅ 跟随孩子的兴趣
-✅ 在他的世界里建立连接
-✅ 用他感兴趣的方式实现游戏目标
-✅ 慢慢搭桥回到游戏步骤
-
-❌ 不要强拉回游戏
-❌ 不要说"回来""别走神"
-❌ 不要打断孩子
-❌ 不要放弃游戏目标（要巧妙融入）
-
-## 何时说话
-
-**说话：**
-- 孩子明显分心超过5秒
-- 家长不知道怎么办
-- 家长试图强拉孩子
-
-**不说话：**
-- 孩子在玩游戏
-- 家长正在互动
-- 家长在哄孩子
-
-## 语言要求
-
-- 20-35字
-- 口语化
-- 具体动作
-- 温和语气
-
-开始观察！"""
-    
-    return prompt
+HOST = os.getenv('REALTIME_HOST', 'localhost')
+
+# 会话容量：最大并发会话数、排队等待上限（秒）
+MAX_SESSIONS = int(os.getenv('REALTIME_MAX_SESSIONS', '20'))
+QUEUE_TIMEOUT = float(os.getenv('REALTIME_QUEUE_TIMEOUT', '30'))
+
+# 下行队列：每连接最多积压的音频增量数、音频合并窗口（秒）、队列满时的策略
+# （drop_oldest 丢最旧的音频 / block 阻塞 SDK 回调线程，对上游施加背压）
+OUTBOUND_MAX_ITEMS = int(os.getenv('REALTIME_OUTBOUND_MAX_ITEMS', '256'))
+OUTBOUND_MERGE_WINDOW = float(os.getenv('REALTIME_OUTBOUND_MERGE_WINDOW', '0.02'))
+OUTBOUND_POLICY = os.getenv('REALTIME_OUTBOUND_POLICY', 'drop_oldest')
+
+# 渲染后系统提示词的缓存条数
+PROMPT_CACHE_SIZE = int(os.getenv('REALTIME_PROMPT_CACHE_SIZE', '128'))
+
+# 视频帧管线：最长边（像素）、JPEG 质量、重复帧阈值（dHash 汉明距离）、
+# 静止画面保活间隔、最小 / 最大发送间隔（秒）、每会话音视频上行预算（KB/s，0 表示固定间隔）
+VIDEO_MAX_SIDE = int(os.getenv('REALTIME_VIDEO_MAX_SIDE', '640'))
+VIDEO_JPEG_QUALITY = int(os.getenv('REALTIME_VIDEO_JPEG_QUALITY', '70'))
+VIDEO_DEDUPE_DISTANCE = int(os.getenv('REALTIME_VIDEO_DEDUPE_DISTANCE', '4'))
+VIDEO_KEEPALIVE = float(os.getenv('REALTIME_VIDEO_KEEPALIVE', '5'))
+VIDEO_INTERVAL = float(os.getenv('REALTIME_VIDEO_INTERVAL', '0.5'))
+VIDEO_MAX_INTERVAL = float(os.getenv('REALTIME_VIDEO_MAX_INTERVAL', '5'))
+UPLINK_BUDGET_KB = float(os.getenv('REALTIME_UPLINK_BUDGET_KB', '96'))
+
+
+# 本地 VAD：开关、严格程度（0-3）、一段话结束前允许的静音时长、
+# 开口前补发的音频时长、判定开口所需的最短语音时长、一段话的最长时长、
+# 噪声底统计窗口（毫秒）
+SERVER_VAD = os.getenv('REALTIME_SERVER_VAD', 'true').lower() == 'true'
+VAD_AGGRESSIVENESS = int(os.getenv('REALTIME_VAD_AGGRESSIVENESS', '2'))
+VAD_HANGOVER_MS = int(os.getenv('REALTIME_VAD_HANGOVER_MS', '600'))
+VAD_PREROLL_MS = int(os.getenv('REALTIME_VAD_PREROLL_MS', '300'))
+VAD_MIN_SPEECH_MS = int(os.getenv('REALTIME_VAD_MIN_SPEECH_MS', '100'))
+VAD_MAX_UTTERANCE_MS = int(os.getenv('REALTIME_VAD_MAX_UTTERANCE_MS', '15000'))
+VAD_NOISE_WINDOW_MS = int(os.getenv('REALTIME_VAD_NOISE_WINDOW_MS', '3000'))
+
+if SERVER_VAD and not NUMPY_AVAILABLE:
+    print('⚠️  numpy 未安装，本地 VAD 已关闭（pip install numpy）')
+    SERVER_VAD = False
+
+
+def create_vad():
+    """本地 VAD 关闭时返回 None，音频原样上行。"""
+    if not SERVER_VAD:
+        return None
+    return VoiceActivityDetector(
+        aggressiveness=VAD_AGGRESSIVENESS,
+        hangover_ms=VAD_HANGOVER_MS,
+        preroll_ms=VAD_PREROLL_MS,
+        min_speech_ms=VAD_MIN_SPEECH_MS,
+        max_utterance_ms=VAD_MAX_UTTERANCE_MS,
+        noise_window_ms=VAD_NOISE_WINDOW_MS,
+    )
+
+
+def create_video_pipeline() -> VideoFramePipeline:
+    return VideoFramePipeline(
+        max_side=VIDEO_MAX_SIDE,
+        quality=VIDEO_JPEG_QUALITY,
+        dedupe_distance=VIDEO_DEDUPE_DISTANCE,
+        keepalive=VIDEO_KEEPALIVE,
+        interval=VIDEO_INTERVAL,
+        max_interval=VIDEO_MAX_INTERVAL,
+        uplink_budget=UPLINK_BUDGET_KB * 1024,
+    )
+
+
+sessions = SessionManager(MAX_SESSIONS, QUEUE_TIMEOUT)
+prompt_cache = PromptCache(PROMPT_CACHE_SIZE)
+
+
+def session_config(instructions: str) -> dict:
+    """update_session 参数：SDK 每次都会下发完整配置，局部更新也必须带上全部字段"""
+    return dict(
+        output_modalities=[MultiModality.AUDIO, MultiModality.TEXT],
+        voice='Cherry',
+        input_audio_format=AudioFormat.PCM_16000HZ_MONO_16BIT,
+        output_audio_format=AudioFormat.PCM_24000HZ_MONO_16BIT,
+        enable_input_audio_transcription=True,
+        input_audio_transcription_model='gummy-realtime-v1',
+        enable_turn_detection=False,  # 关闭 server_vad，使用手动控制
+        instructions=instructions
+    )
 
 
 class RealtimeCallback(OmniRealtimeCallback):
-    """回调处理器"""
+    """回调处理器（运行在 SDK 线程，只负责把事件放入下行队列）"""
     
-    def __init__(self, websocket):
-        self.websocket = websocket
-        self.loop = asyncio.get_event_loop()
+    def __init__(self, outbound: OutboundQueue, session):
+        self.outbound = outbound
+        self.session = session  # SessionStats，记录上游事件与延迟
     
     def on_open(self):
         print('[Callback] Connection opened')
         # 通知前端连接已建立
-        asyncio.run_coroutine_threadsafe(
-            self.websocket.send(json.dumps({
-                'type': 'connection.opened'
-            })),
-            self.loop
-        )
+        self.outbound.put_threadsafe(OutboundItem({
+            'type': 'connection.opened'
+        }))
     
     def on_close(self, close_status_code, close_msg):
         print(f'[Callback] Connection closed: {close_status_code} - {close_msg}')
         # 通知前端连接已关闭
-        asyncio.run_coroutine_threadsafe(
-            self.websocket.send(json.dumps({
-                'type': 'connection.closed',
-                'code': close_status_code,
-                'message': close_msg
-            })),
-            self.loop
-        )
+        self.outbound.put_threadsafe(OutboundItem({
+            'type': 'connection.closed',
+            'code': close_status_code,
+            'message': close_msg
+        }))
     
     def on_event(self, response):
         """处理所有事件"""
+        received_at = time.monotonic()
         event_type = response.get('type')
+        self.session.on_upstream_event(event_type)
         
-        # 如果是错误事件，打印完整信息
+        # 如果是错误事件，打印完整信息；高频的增量事件不逐条打印
         if event_type == 'error':
             print(f'[Callback] ⚠️  Error event: {response}')
-        else:
+        elif event_type and not event_type.endswith('.delta'):
             print(f'[Callback] Event: {event_type}')
         
-        # 转发所有事件到前端
-        asyncio.run_coroutine_threadsafe(
-            self.websocket.send(json.dumps(response)),
-            self.loop
-        )
+        # 转发所有事件到前端；音频增量解码为 PCM，由发送 task 合并后下发
+        pcm = None
+        if event_type == 'response.audio.delta':
+            pcm = base64.b64decode(response.get('delta') or '')
+        self.outbound.put_threadsafe(OutboundItem(response, pcm, received_at))
+
+
+async def admit_while_connected(websocket):
+    """
+    排队等待会话名额，同时监听连接关闭：排队期间客户端断开则放弃排队，
+    拿到名额时连接已断开则立即归还，均返回 None。超时仍抛 SessionRejected。
+    """
+    admit = asyncio.ensure_future(sessions.admit(str(websocket.remote_address)))
+    closed = asyncio.ensure_future(websocket.wait_closed())
+    try:
+        await asyncio.wait({admit, closed}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        closed.cancel()
+        if not admit.done():
+            admit.cancel()
+            await asyncio.wait({admit})
+    if admit.cancelled():
+        return None
+    session = admit.result()
+    if websocket.state is not State.OPEN:
+        sessions.release(session)
+        return None
+    return session
 
 
 async def handle_client(websocket):
     """处理客户端连接"""
     print(f'[Server] Client connected from {websocket.remote_address}')
     
+    # 准入：会话数已满时排队，超时拒绝
+    if sessions.is_full():
+        await websocket.send(json.dumps({
+            'type': 'session.queued',
+            'waiting': sessions.waiting + 1
+        }))
+    try:
+        session = await admit_while_connected(websocket)
+    except SessionRejected as e:
+        print(f'[Server] ⚠️  会话已满，拒绝连接: {e}')
+        await websocket.send(json.dumps({
+            'type': 'error',
+            'message': f'服务繁忙，请稍后重试（{e}）'
+        }))
+        await websocket.close(code=1013, reason='server busy')
+        return
+    if session is None:
+        print(f'[Server] 客户端在排队期间断开: {websocket.remote_address}')
+        return
+    
     conversation = None
-    callback = RealtimeCallback(websocket)
-    last_video_time = 0  # 记录上次发送视频帧的时间
-    pending_video_frame = None  # 缓存待发送的视频帧
+    video_task = None
+    outbound = OutboundQueue(
+        websocket.send,
+        session,
+        asyncio.get_running_loop(),
+        max_items=OUTBOUND_MAX_ITEMS,
+        merge_window=OUTBOUND_MERGE_WINDOW,
+        policy=OUTBOUND_POLICY,
+    )
+    sender_task = asyncio.create_task(outbound.run())  # 该连接唯一的下行发送者
+    
+    def on_sender_done(task: asyncio.Task):
+        """下行发送失败时关闭连接，结束消息循环并进入清理。"""
+        if task.cancelled() or outbound.error is None:
+            return
+        print(f'[Server] ⚠️  下行发送失败，关闭连接: {type(outbound.error).__name__}: {outbound.error}')
+        asyncio.ensure_future(websocket.close(code=1011, reason='outbound send failed'))
+    
+    sender_task.add_done_callback(on_sender_done)
+    callback = RealtimeCallback(outbound, session)
+    video = create_video_pipeline()  # 视频帧去重 / 缩放 / 限速
+    sequences = SequenceTracker()  # 二进制帧的丢帧 / 乱序统计
+    vad = create_vad()  # 本地 VAD（关闭时为 None）
+    audio_pending = False  # 上次提交后是否上行过音频
+    audio_started = False  # 本会话是否上行过音频（上游要求先有音频才能追加图片）
     session_initialized = False  # 标记会话是否已初始化
+    context = {}  # 当前的 childInfo / gameInfo / historyInfo，供 update 消息合并
+    current_sections = {}  # 当前生效的提示词各节
     is_speaking = False  # 是否正在说话
     silence_start_time = None  # 静音开始时间
     
+    def append_audio(pcm: bytes):
+        """上行一段音频。"""
+        nonlocal audio_pending, audio_started
+        encoded = base64.b64encode(pcm).decode('ascii')
+        conversation.append_audio(encoded)
+        video.record_audio(len(encoded))
+        audio_pending = True
+        audio_started = True
+    
+    def send_due_video():
+        """有到期的视频帧时上行；与音频是否上行无关（VAD 过滤掉静音时画面照常更新）。"""
+        if not audio_started:
+            return
+        frame = video.take_due()
+        if frame:
+            try:
+                conversation.append_video(frame)
+                video.record_sent(len(frame))
+            except Exception as e:
+                print(f'[Server] ⚠️  发送视频帧失败: {type(e).__name__}: {e}')
+    
+    async def pump_video():
+        """按最小间隔定时检查：收帧时未到间隔、之后又没有新帧的待发送帧由这里发出。"""
+        while True:
+            await asyncio.sleep(video.min_interval)
+            if session_initialized:
+                send_due_video()
+    
+    def commit_turn() -> bool:
+        """提交已上行的音频并创建响应；没有新音频时不提交（避免 VAD 与前端重复提交）。"""
+        nonlocal audio_pending
+        if not audio_pending:
+            return False
+        session.mark_commit()
+        conversation.commit()
+        conversation.create_response()
+        audio_pending = False
+        return True
+    
+    async def forward_audio(pcm: bytes):
+        """音频经 VAD 过滤后上行；VAD 判定一段话结束时自动提交。"""
+        if vad is None:
+            append_audio(pcm)
+            return
+        for event, chunk in vad.process(pcm):
+            if event == 'audio':
+                append_audio(chunk)
+            elif event == 'start':
+                outbound.put({'type': 'input_audio_buffer.speech_started'})
+            else:
+                outbound.put({'type': 'input_audio_buffer.speech_stopped'})
+                if commit_turn():
+                    print('[Server] 📤 VAD 检测到一段话结束，自动提交')
+    
     try:
         # 创建会话（使用最新的 turbo 模型，支持视频）
         conversation = OmniRealtimeConversation(
@@ -215,10 +329,29 @@ async def handle_client(websocket):
         await asyncio.sleep(0.5)
         
         print('[Server] Connection established, waiting for init message...')
+        video_task = asyncio.create_task(pump_video())
         
         # 处理客户端消息
         async for message in websocket:
             try:
+                # 二进制消息：音频 / 视频帧
+                if isinstance(message, bytes):
+                    if not session_initialized:
+                        continue
+                    kind, seq, payload = unpack_frame(message)
+                    if not sequences.observe(kind, seq):
+                        continue
+                    if kind == FRAME_AUDIO_IN:
+                        session.audio_bytes_in += len(payload)
+                        await forward_audio(payload)
+                    elif kind == FRAME_VIDEO_IN:
+                        session.video_bytes_in += len(payload)
+                        await asyncio.to_thread(video.submit, payload)
+                        send_due_video()
+                    else:
+                        print(f'[Server] Unknown binary frame kind: {kind}')
+                    continue
+                
                 data = json.loads(message)
                 msg_type = data.get('type')
                 
@@ -227,35 +360,28 @@ async def handle_client(websocket):
                     child_info = data.get('childInfo', {})
                     game_info = data.get('gameInfo', {})
                     history_info = data.get('historyInfo', {})
+                    outbound.binary = bool(data.get('binary'))
                     
                     print(f'[Server] 收到初始化信息:')
                     print(f'  - 孩子: {child_info.get("name", "未知")}')
                     print(f'  - 游戏: {game_info.get("title", "未知")}')
                     print(f'  - 历史记录: {len(history_info.get("recentGames", []))} 个游戏')
                     
-                    # 构建增强的系统提示词
-                    system_prompt = build_system_prompt(child_info, game_info, history_info)
+                    # 构建增强的系统提示词（相同孩子 / 游戏 / 历史直接命中缓存）
+                    context = {'child': child_info, 'game': game_info, 'history': history_info}
+                    current_sections, system_prompt = prompt_cache.render(child_info, game_info, history_info)
                     
                     # 更新会话配置（使用非 server_vad 模式，更稳定）
                     print('[Server] Updating session with enhanced system prompt...')
-                    conversation.update_session(
-                        output_modalities=[MultiModality.AUDIO, MultiModality.TEXT],
-                        voice='Cherry',
-                        input_audio_format=AudioFormat.PCM_16000HZ_MONO_16BIT,
-                        output_audio_format=AudioFormat.PCM_24000HZ_MONO_16BIT,
-                        enable_input_audio_transcription=True,
-                        input_audio_transcription_model='gummy-realtime-v1',
-                        enable_turn_detection=False,  # 关闭 server_vad，使用手动控制
-                        instructions=system_prompt
-                    )
+                    conversation.update_session(**session_config(system_prompt))
                     
                     session_initialized = True
                     print('[Server] Session initialized, ready for audio/video...')
                     
                     # 通知前端初始化完成
-                    await websocket.send(json.dumps({
+                    outbound.put({
                         'type': 'session.initialized'
-                    }))
+                    })
                     continue
                 
                 # 如果会话未初始化，忽略其他消息
@@ -264,21 +390,12 @@ async def handle_client(websocket):
                     continue
                 
                 if msg_type == 'audio':
-                    # 接收音频数据（已经是 base64 编码）
+                    # 旧版 JSON 音频消息（已经是 base64 编码）
                     audio_b64 = data.get('audio')
                     if audio_b64:
-                        conversation.append_audio(audio_b64)
-                        
-                        # 在发送音频后，如果有待发送的视频帧，每 500ms 发送一次
-                        if pending_video_frame:
-                            try:
-                                current_time = time.time()
-                                if current_time - last_video_time >= 0.5:  # 改为 500ms
-                                    conversation.append_video(pending_video_frame)
-                                    last_video_time = current_time
-                                    pending_video_frame = None
-                            except Exception as e:
-                                print(f'[Server] ⚠️  发送视频帧失败: {type(e).__name__}: {e}')
+                        pcm = base64.b64decode(audio_b64)
+                        session.audio_bytes_in += len(pcm)
+                        await forward_audio(pcm)
                 
                 elif msg_type == 'speech_start':
                     # 前端检测到语音开始
@@ -294,28 +411,54 @@ async def handle_client(websocket):
                 
                 elif msg_type == 'commit':
                     # 前端主动请求提交（例如用户点击了"发送"按钮）
-                    print('[Server] 📤 收到提交请求，创建响应')
-                    conversation.commit()
-                    conversation.create_response()
+                    # 本地 VAD 认为用户仍在说话时由 VAD 负责提交，避免一段话被切成两次响应
+                    if vad is not None and vad.speaking:
+                        print('[Server] 用户仍在说话，提交请求交由 VAD 处理')
+                    elif commit_turn():
+                        print('[Server] 📤 收到提交请求，创建响应')
                     is_speaking = False
                     silence_start_time = None
                 
                 elif msg_type == 'image':
-                    # 接收视频帧（base64 编码的 JPEG）
-                    # 不立即发送，而是缓存起来，等待下次发送音频时一起发送
+                    # 旧版 JSON 视频帧（base64 编码的 JPEG）
+                    # 经管线处理后缓存为待发送帧，到达发送间隔时上行
                     image_b64 = data.get('image')
                     if image_b64:
                         # 移除 data:image/jpeg;base64, 前缀（如果有）
                         if image_b64.startswith('data:'):
                             image_b64 = image_b64.split(',', 1)[1]
                         
-                        # 缓存视频帧
-                        pending_video_frame = image_b64
-                        print(f'[Server] 缓存视频帧，大小: {len(image_b64)} 字符')
+                        try:
+                            jpeg = base64.b64decode(image_b64)
+                        except ValueError:
+                            print('[Server] ⚠️  视频帧 base64 无效，已丢弃')
+                            continue
+                        session.video_bytes_in += len(jpeg)
+                        # 解码 / 缩放在线程中执行，不阻塞其他会话
+                        await asyncio.to_thread(video.submit, jpeg)
+                        send_due_video()
                         
+                elif msg_type == 'update':
+                    # 会话中途更新（如游戏进行到下一步）：字段浅合并，只有提示词变化时才下发
+                    for key, name in (('childInfo', 'child'), ('gameInfo', 'game'), ('historyInfo', 'history')):
+                        if isinstance(data.get(key), dict):
+                            context[name] = {**context[name], **data[key]}
+                    sections, system_prompt = prompt_cache.render(
+                        context['child'], context['game'], context['history']
+                    )
+                    changed = diff_sections(current_sections, sections)
+                    if changed:
+                        conversation.update_session(**session_config(system_prompt))
+                        current_sections = sections
+                        print(f'[Server] 会话提示词已更新: {", ".join(changed)}')
+                    outbound.put({
+                        'type': 'session.context_updated',
+                        'changed_sections': changed
+                    })
+                
                 elif msg_type == 'ping':
                     # 心跳
-                    await websocket.send(json.dumps({'type': 'pong'}))
+                    outbound.put({'type': 'pong'})
                 
                 else:
                     print(f'[Server] Unknown message type: {msg_type}')
@@ -327,16 +470,49 @@ async def handle_client(websocket):
     
     except Exception as e:
         print(f'[Server] Error: {e}')
-        await websocket.send(json.dumps({
+        # 经下行队列发送，保持与其他下行消息的顺序（不与发送 task 并发写 WebSocket）
+        outbound.put({
             'type': 'error',
             'message': str(e)
-        }))
+        })
     
     finally:
         if conversation:
             print('[Server] Closing conversation...')
             conversation.close()
-        print(f'[Server] Client disconnected')
+        if video_task:
+            video_task.cancel()
+        await outbound.drain(timeout=1.0)  # 最多等 1 秒把积压（含 error 消息）发完
+        sender_task.cancel()
+        sessions.release(session)
+        print(
+            f'[Server] Client disconnected, session: {session.summary()}, '
+            f'video: {video.stats()}, '
+            f'frame gaps: {sequences.gaps}, reordered: {sequences.reordered}, '
+            f'vad: {vad.stats() if vad else None}'
+        )
+
+
+def json_response(connection, body: dict, status: int = 200):
+    response = connection.respond(status, json.dumps(body, ensure_ascii=False))
+    del response.headers['Content-Type']
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    return response
+
+
+def process_request(connection, request):
+    """握手前的 HTTP 钩子：GET /stats 返回会话统计，GET /healthcheck 返回服务状态；其余路径照常握手。"""
+    path = request.path.split('?', 1)[0]
+    if path == '/stats':
+        return json_response(connection, {**sessions.stats(), 'prompt_cache': prompt_cache.stats()})
+    if path == '/healthcheck':
+        return json_response(connection, {
+            'status': 'healthy',
+            'active': len(sessions.active),
+            'waiting': sessions.waiting,
+            'max_sessions': sessions.max_sessions,
+        })
+    return None
 
 
 async def main():
@@ -344,8 +520,9 @@ async def main():
     print(f'🚀 Starting Qwen Realtime WebSocket Server on port {PORT}...')
     print(f'📡 Using API Key: {dashscope.api_key[:10]}...')
     
-    async with websockets.serve(handle_client, 'localhost', PORT):
-        print(f'✅ Server running on ws://localhost:{PORT}')
+    async with websockets.serve(handle_client, HOST, PORT, process_request=process_request):
+        print(f'✅ Server running on ws://{HOST}:{PORT} (max {MAX_SESSIONS} sessions)')
+        print(f'📊 Stats on http://{HOST}:{PORT}/stats')
         print('Press Ctrl+C to stop')
         await asyncio.Future()  # run forever
 
@@ -0,0 +1,389 @@
+"""
+本地嵌入式向量索引（rag_service 的离线检索后端）
+
+从目录读取文档（.txt / .md，装了 pypdf 时也读 .pdf），切块后构建：
+  - 稠密向量矩阵：float32 [N, DIM]，存为 .npy，按 mmap 只读加载，不占常驻内存
+  - 稀疏关键词索引：倒排表 + BM25（分词与参数来自 text_search，与 memory_service 的 pending 检索共用）
+检索时两路各取候选，按 dense_weight 线性融合：cosine 与归一化后的 BM25 分数。
+
+向量由可替换的 embedder 生成：callable(texts, dim) -> [len(texts), dim] 矩阵，
+可通过 load_embedder('package.module:function') 加载。默认（或加载失败时）
+使用特征哈希（词项 → 有符号哈希桶，对数词频，L2 归一化），
+不依赖任何模型或网络，同样的文档在任何机器上得到同样的索引。
+
+索引目录内容：
+  manifest.json              文档指纹（相对路径 / 大小 / mtime）、embedder 与构建参数，变化时自动重建
+  chunks.jsonl               每行一个切块：{"text": ..., "metadata": {...}}
+  vectors-<构建时间>.npy     稠密向量矩阵；每次构建写新文件，不覆盖仍被 mmap 的旧文件
+                             （Windows 上无法替换已映射的文件），旧文件在下次构建时清理
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from text_search import bm25_idf, bm25_term_score, tokenize
+
+try:
+    from pypdf import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 2
+TEXT_SUFFIXES = {'.txt', '.md'}
+
+Embedder = Callable[[list[str], int], np.ndarray]
+
+
+def _hash_term(term: str) -> int:
+    # 不用内置 hash()：它按进程加盐，索引需要跨进程稳定
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def hash_embed(texts: list[str], dim: int) -> np.ndarray:
+    """特征哈希向量：每个词项落到一个有符号桶，权重 1 + log(tf)，整体 L2 归一化。"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for term, tf in Counter(tokenize(text)).items():
+            h = _hash_term(term)
+            sign = 1.0 if (h >> 63) & 1 else -1.0
+            vectors[row, h % dim] += sign * (1.0 + math.log(tf))
+    return _l2_normalize(vectors)
+
+
+def _l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def load_embedder(spec: str) -> tuple[Embedder, str]:
+    """
+    按 'package.module:function' 加载 embedder，返回 (embedder, 名称)；
+    spec 为空或加载失败时回退到特征哈希。名称参与索引指纹，换 embedder 会触发重建。
+    """
+    if spec:
+        module_name, _, attr = spec.partition(':')
+        try:
+            embedder = getattr(importlib.import_module(module_name), attr)
+            if callable(embedder):
+                return embedder, spec
+            logger.warning('[LocalIndex] embedder %s 不可调用，使用特征哈希', spec)
+        except (ImportError, AttributeError, ValueError) as e:
+            logger.warning('[LocalIndex] 加载 embedder %s 失败，使用特征哈希: %s', spec, e)
+    return hash_embed, 'hash'
+
+
+def chunk_text(text: str, size: int, overlap: int) -> list[str]:
+    """
+    按段落切块：相邻段落合并到不超过 size 字符；
+    单个超长段落按 size 滑窗切开，相邻窗口重叠 overlap 字符。
+    """
+    paragraphs = [' '.join(p.split()) for p in re.split(r'\n\s*\n', text)]
+    chunks: list[str] = []
+    current = ''
+    for para in paragraphs:
+        if not para:
+            continue
+        if len(para) > size:
+            if current:
+                chunks.append(current)
+                current = ''
+            step = max(size - overlap, 1)
+            for start in range(0, len(para), step):
+                chunks.append(para[start:start + size])
+                if start + size >= len(para):
+                    break
+        elif current and len(current) + 1 + len(para) > size:
+            chunks.append(current)
+            current = para
+        else:
+            current = f'{current}\n{para}' if current else para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _read_document(path: Path) -> str:
+    if path.suffix.lower() == '.pdf':
+        reader = PdfReader(str(path))
+        return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+    return path.read_text(encoding='utf-8', errors='ignore')
+
+
+@dataclass(frozen=True)
+class _IndexSnapshot:
+    """一次构建 / 加载的完整索引状态；构建完成后整体替换，不做原地修改。"""
+
+    chunks: list[dict[str, Any]]
+    vectors: np.ndarray
+    postings: dict[str, list[tuple[int, int]]]   # 词项 → [(切块下标, 词频)]
+    lengths: list[int]
+    avg_len: float
+    fingerprint: str
+    built_at: float | None
+
+
+class LocalIndex:
+    """
+    单目录文档的混合检索索引。
+
+    load_or_build() 与 search() 都是同步 CPU 调用，调用方应放到线程里执行；
+    构建过程在锁内完成，完成后用一次赋值替换 _snapshot。search() 开始时只读取一次
+    该引用，整个检索都基于同一份快照，重建期间的检索不会混用新旧数据。
+    """
+
+    def __init__(
+        self,
+        docs_dir: str,
+        index_dir: str,
+        dim: int = 512,
+        chunk_size: int = 500,
+        chunk_overlap: int = 100,
+        embedder: Embedder | None = None,
+        embedder_name: str = 'hash',
+    ):
+        self.docs_dir = Path(docs_dir)
+        self.index_dir = Path(index_dir)
+        self.dim = dim
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embedder = embedder or hash_embed
+        self.embedder_name = embedder_name if embedder else 'hash'
+        self._build_lock = threading.Lock()
+
+        self._snapshot: _IndexSnapshot | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def built_at(self) -> float | None:
+        snapshot = self._snapshot
+        return snapshot.built_at if snapshot else None
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return len(snapshot.chunks) if snapshot else 0
+
+    # ------------------------------------------------------------------ build
+
+    def _source_files(self) -> list[Path]:
+        suffixes = TEXT_SUFFIXES | ({'.pdf'} if PDF_AVAILABLE else set())
+        if not self.docs_dir.is_dir():
+            return []
+        return sorted(
+            p for p in self.docs_dir.rglob('*')
+            if p.is_file() and p.suffix.lower() in suffixes
+        )
+
+    def _compute_fingerprint(self, files: list[Path]) -> str:
+        digest = hashlib.sha1()
+        digest.update(json.dumps(
+            [INDEX_FORMAT_VERSION, self.embedder_name, self.dim, self.chunk_size, self.chunk_overlap]
+        ).encode())
+        for path in files:
+            st = path.stat()
+            digest.update(f'{path.relative_to(self.docs_dir)}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+        return digest.hexdigest()
+
+    def load_or_build(self, force: bool = False) -> None:
+        """文档指纹与磁盘上的索引一致时直接加载，否则（或 force）重建。"""
+        with self._build_lock:
+            files = self._source_files()
+            fingerprint = self._compute_fingerprint(files)
+            if not force and self._snapshot is not None and self._snapshot.fingerprint == fingerprint:
+                return
+            manifest_path = self.index_dir / 'manifest.json'
+            if not force and manifest_path.exists():
+                try:
+                    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+                    if manifest.get('fingerprint') == fingerprint:
+                        self._load(fingerprint, manifest['vectors'], manifest.get('built_at'))
+                        return
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning('[LocalIndex] 索引文件损坏，重建: %s', e)
+            self._build(files, fingerprint)
+
+    def _build(self, files: list[Path], fingerprint: str) -> None:
+        started = time.perf_counter()
+        chunks: list[dict[str, Any]] = []
+        for path in files:
+            try:
+                text = _read_document(path)
+            except Exception as e:
+                logger.warning('[LocalIndex] 读取文档失败 %s: %s', path, e)
+                continue
+            source = str(path.relative_to(self.docs_dir))
+            for i, chunk in enumerate(chunk_text(text, self.chunk_size, self.chunk_overlap)):
+                chunks.append({'text': chunk, 'metadata': {'source': source, 'chunk_index': i}})
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        vectors = self._embed([c['text'] for c in chunks])
+        # 向量写到新文件名（manifest 指向它），不替换当前仍被 mmap 的旧文件
+        built_at = time.time()
+        vectors_name = f'vectors-{time.time_ns()}.npy'
+        np.save(self.index_dir / vectors_name, vectors)
+        # manifest 最后写：崩溃时旧 manifest 的指纹或形状对不上，下次启动重建
+        tmp_chunks = self.index_dir / 'chunks.jsonl.tmp'
+        with tmp_chunks.open('w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+        os.replace(tmp_chunks, self.index_dir / 'chunks.jsonl')
+        tmp_manifest = self.index_dir / 'manifest.json.tmp'
+        tmp_manifest.write_text(json.dumps({
+            'fingerprint': fingerprint,
+            'built_at': built_at,
+            'documents': len(files),
+            'chunks': len(chunks),
+            'dim': self.dim,
+            'embedder': self.embedder_name,
+            'vectors': vectors_name,
+        }), encoding='utf-8')
+        os.replace(tmp_manifest, self.index_dir / 'manifest.json')
+
+        self._load(fingerprint, vectors_name, built_at)
+        self._remove_stale_vectors(vectors_name)
+        logger.info(
+            '[LocalIndex] 索引构建完成: %d 个文档, %d 个切块, %.2fs',
+            len(files), len(chunks), time.perf_counter() - started,
+        )
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        """调用 embedder 并校验形状；结果统一转 float32 并 L2 归一化（检索用点积即 cosine）。"""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = np.array(self.embedder(texts, self.dim), dtype=np.float32)
+        if vectors.shape != (len(texts), self.dim):
+            raise ValueError(
+                f'embedder {self.embedder_name} 返回形状 {vectors.shape}，应为 {(len(texts), self.dim)}'
+            )
+        return _l2_normalize(vectors)
+
+    def _remove_stale_vectors(self, current: str) -> None:
+        for path in self.index_dir.glob('vectors*.npy'):
+            if path.name == current:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass  # Windows 上仍被旧 mmap 占用，下次构建再清理
+
+    def _load(self, fingerprint: str, vectors_name: str, built_at: float | None) -> None:
+        chunks = []
+        with (self.index_dir / 'chunks.jsonl').open(encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    chunks.append(json.loads(line))
+        vectors = np.load(self.index_dir / vectors_name, mmap_mode='r') if chunks else \
+            np.zeros((0, self.dim), dtype=np.float32)
+        if vectors.shape != (len(chunks), self.dim):
+            raise ValueError(f'向量矩阵形状 {vectors.shape} 与切块数 {len(chunks)} 不一致')
+
+        postings: dict[str, list[tuple[int, int]]] = {}
+        lengths: list[int] = []
+        for i, chunk in enumerate(chunks):
+            terms = tokenize(chunk['text'])
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((i, tf))
+
+        self._snapshot = _IndexSnapshot(
+            chunks=chunks,
+            vectors=vectors,
+            postings=postings,
+            lengths=lengths,
+            avg_len=max(sum(lengths) / len(lengths), 1.0) if lengths else 1.0,
+            fingerprint=fingerprint,
+            built_at=built_at,
+        )
+
+    # ----------------------------------------------------------------- search
+
+    @staticmethod
+    def _sparse_scores(snapshot: _IndexSnapshot, query_terms: list[str]) -> dict[int, float]:
+        n_docs = len(snapshot.chunks)
+        scores: dict[int, float] = {}
+        for term in set(query_terms):
+            postings = snapshot.postings.get(term)
+            if not postings:
+                continue
+            idf = bm25_idf(n_docs, len(postings))
+            for doc, tf in postings:
+                score = bm25_term_score(idf, tf, snapshot.lengths[doc], snapshot.avg_len)
+                scores[doc] = scores.get(doc, 0.0) + score
+        return scores
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        dense_top_k: int = 50,
+        sparse_top_k: int = 50,
+        dense_weight: float = 0.5,
+        min_score: float | None = None,
+    ) -> list[tuple[str, float, dict[str, Any]]]:
+        """
+        混合检索，返回 [(text, score, metadata)]，score 在 [0, 1] 附近，越大越相关。
+
+        稠密路取 cosine 最高的 dense_top_k 个、稀疏路取 BM25 最高的 sparse_top_k 个作为候选；
+        候选的最终分数 = dense_weight * cosine + (1 - dense_weight) * BM25 / 候选内最高 BM25。
+        """
+        snapshot = self._snapshot  # 只读一次：重建随时可能替换 _snapshot
+        if snapshot is None or not snapshot.chunks or top_k <= 0:
+            return []
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+
+        dense = snapshot.vectors @ self._embed([query])[0]
+        candidates: set[int] = set()
+        if dense_top_k > 0:
+            k = min(dense_top_k, len(dense))
+            candidates.update(np.argpartition(-dense, k - 1)[:k].tolist())
+
+        sparse = self._sparse_scores(snapshot, query_terms)
+        if sparse_top_k > 0 and sparse:
+            candidates.update(sorted(sparse, key=sparse.__getitem__, reverse=True)[:sparse_top_k])
+        sparse_max = max((sparse.get(i, 0.0) for i in candidates), default=0.0) or 1.0
+
+        scored = []
+        for i in candidates:
+            score = dense_weight * float(dense[i]) + (1 - dense_weight) * sparse.get(i, 0.0) / sparse_max
+            if score > 0 and (min_score is None or score >= min_score):
+                scored.append((score, i))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            (snapshot.chunks[i]['text'], round(score, 6), dict(snapshot.chunks[i]['metadata']))
+            for score, i in scored[:top_k]
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'ready': snapshot is not None,
+            'docs_dir': str(self.docs_dir),
+            'chunks': len(snapshot.chunks) if snapshot else 0,
+            'dim': self.dim,
+            'embedder': self.embedder_name,
+            'terms': len(snapshot.postings) if snapshot else 0,
+            'built_at': snapshot.built_at if snapshot else None,
+        }
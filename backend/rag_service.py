@@ -4,13 +4,30 @@
 提供知识库检索 API，供前端调用。
 使用阿里云百炼 SDK 的 Retrieve 接口检索文档搜索类知识库。
 
+检索走 SDK 的异步接口（旧版 SDK 无异步接口时退化为有界线程池），
+并发数与单次超时可配置，不阻塞事件循环，并发请求可以重叠执行。
+成功的检索结果按 (index_id, 规范化 query, top_k, 重排序参数) 做 LRU + TTL 缓存，
+相同的在途请求合并为一次上游调用。
+
+另有本地检索后端（rag_local_index.py）：从 RAG_LOCAL_DOCS_DIR 读取文档建立
+mmap 向量矩阵 + BM25 关键词索引，做稠密/稀疏混合打分，无需 SDK 与网络；
+文档变化后在 RAG_LOCAL_CHECK_INTERVAL 秒内自动重建。
+请求里 backend='local' | 'bailian' 逐次选择，不传时用 RAG_DEFAULT_BACKEND。
+
+/search/batch 一次接收多个 query，与单条检索共用缓存和并发上限并发执行，
+按 query 分组返回；每组都是该 query 的完整结果，dedupe=True 时才去掉跨 query 重复的切片。
+
 Run: uvicorn rag_service:app --port 8001 --reload
 或集成到 memory_service.py 中复用端口 8000
 """
 
+import asyncio
 import logging
 import os
-from typing import Any, Dict, List, Optional
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
@@ -35,6 +52,14 @@ except ImportError:
     )
     SDK_AVAILABLE = False
 
+# 本地索引依赖 numpy
+try:
+    from rag_local_index import LocalIndex, load_embedder
+    LOCAL_INDEX_AVAILABLE = True
+except ImportError:
+    logger.warning("numpy 未安装，本地检索后端不可用。请运行: pip install numpy")
+    LOCAL_INDEX_AVAILABLE = False
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
@@ -42,6 +67,32 @@ except ImportError:
 WORKSPACE_ID = os.getenv('ALIBABA_WORKSPACE_ID', '')
 DEFAULT_INDEX_ID = os.getenv('ALIBABA_INDEX_ID', '')
 
+# 并发检索上限（同时也是 HTTP 连接池大小）与单次检索超时（秒）
+MAX_CONCURRENT_RETRIEVES = int(os.getenv('RAG_MAX_CONCURRENCY', '16'))
+RETRIEVE_TIMEOUT = float(os.getenv('RAG_RETRIEVE_TIMEOUT', '10'))
+
+# 检索结果缓存（条数为 0 时关闭）
+CACHE_MAX_SIZE = int(os.getenv('RAG_CACHE_SIZE', '512'))
+CACHE_TTL = float(os.getenv('RAG_CACHE_TTL', '600'))
+
+# 检索后端：bailian（远程百炼知识库）或 local（本地嵌入式索引）
+DEFAULT_BACKEND = os.getenv('RAG_DEFAULT_BACKEND', 'bailian')
+
+# 本地索引：文档目录、索引文件目录、向量维度、切块参数、稠密分数权重
+LOCAL_DOCS_DIR = os.getenv('RAG_LOCAL_DOCS_DIR', './data/rag_docs')
+LOCAL_INDEX_DIR = os.getenv('RAG_LOCAL_INDEX_DIR', './data/rag_local_index')
+LOCAL_EMBEDDING_DIM = int(os.getenv('RAG_LOCAL_EMBEDDING_DIM', '512'))
+LOCAL_CHUNK_SIZE = int(os.getenv('RAG_LOCAL_CHUNK_SIZE', '500'))
+LOCAL_CHUNK_OVERLAP = int(os.getenv('RAG_LOCAL_CHUNK_OVERLAP', '100'))
+LOCAL_DENSE_WEIGHT = float(os.getenv('RAG_LOCAL_DENSE_WEIGHT', '0.5'))
+# 稠密向量 embedder（'package.module:function'，签名 (texts, dim) -> 矩阵），为空时用特征哈希
+LOCAL_EMBEDDER = os.getenv('RAG_LOCAL_EMBEDDER', '')
+# 检索时至少间隔多少秒重新检查一次文档指纹（文档变化则重建），0 表示每次都检查
+LOCAL_CHECK_INTERVAL = float(os.getenv('RAG_LOCAL_CHECK_INTERVAL', '30'))
+
+# 单次 /search/batch 允许的 query 数
+BATCH_MAX_QUERIES = int(os.getenv('RAG_BATCH_MAX_QUERIES', '20'))
+
 # ---------------------------------------------------------------------------
 # Bailian Client
 # ---------------------------------------------------------------------------
@@ -60,7 +111,10 @@ def create_bailian_client() -> Optional[Any]:
         credential = CredentialClient()
         config = open_api_models.Config(
             credential=credential,
-            endpoint='bailian.cn-beijing.aliyuncs.com'
+            endpoint='bailian.cn-beijing.aliyuncs.com',
+            read_timeout=int(RETRIEVE_TIMEOUT * 1000),
+            connect_timeout=5000,
+            max_idle_conns=MAX_CONCURRENT_RETRIEVES,
         )
         client = BailianClient(config)
         logger.info("阿里云百炼客户端初始化成功")
@@ -73,6 +127,83 @@ def create_bailian_client() -> Optional[Any]:
 # 初始化客户端
 bailian_client = create_bailian_client()
 
+# 并发控制：信号量限制同时在途的检索数；SDK 无异步接口时用同样大小的线程池执行同步调用
+_retrieve_semaphore = asyncio.Semaphore(MAX_CONCURRENT_RETRIEVES)
+_retrieve_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_RETRIEVES, thread_name_prefix='bailian-retrieve'
+)
+
+
+def _release_retrieve_slot(future: asyncio.Future) -> None:
+    """线程池里的同步调用真正结束时归还名额（调用方可能早已超时返回）。"""
+    if not future.cancelled():
+        future.exception()  # 超时后才失败的调用不再有人等待，标记为已读取，避免未取回异常的告警
+    _retrieve_semaphore.release()
+
+
+async def retrieve_async(retrieve_request: Any) -> Any:
+    """
+    非阻塞地调用 Retrieve 接口；超过 RETRIEVE_TIMEOUT 抛出 asyncio.TimeoutError。
+
+    同步 SDK 走线程池时，超时无法中断线程里的调用：名额在该调用真正结束后才归还，
+    慢后端下实际在途的调用数也不会超过 MAX_CONCURRENT_RETRIEVES。
+    """
+    await _retrieve_semaphore.acquire()
+    if hasattr(bailian_client, 'retrieve_async'):
+        try:
+            call = bailian_client.retrieve_async(WORKSPACE_ID, retrieve_request)
+            return await asyncio.wait_for(call, timeout=RETRIEVE_TIMEOUT)
+        finally:
+            _retrieve_semaphore.release()
+
+    try:
+        future = asyncio.get_running_loop().run_in_executor(
+            _retrieve_executor, bailian_client.retrieve, WORKSPACE_ID, retrieve_request
+        )
+    except BaseException:
+        _retrieve_semaphore.release()
+        raise
+    future.add_done_callback(_release_retrieve_slot)
+    # shield：超时只放弃等待，不取消 future，名额由 done 回调归还
+    return await asyncio.wait_for(asyncio.shield(future), timeout=RETRIEVE_TIMEOUT)
+
+# ---------------------------------------------------------------------------
+# Local index
+# ---------------------------------------------------------------------------
+
+local_index: Optional[Any] = None
+if LOCAL_INDEX_AVAILABLE:
+    local_embedder, local_embedder_name = load_embedder(LOCAL_EMBEDDER)
+    local_index = LocalIndex(
+        LOCAL_DOCS_DIR,
+        LOCAL_INDEX_DIR,
+        dim=LOCAL_EMBEDDING_DIM,
+        chunk_size=LOCAL_CHUNK_SIZE,
+        chunk_overlap=LOCAL_CHUNK_OVERLAP,
+        embedder=local_embedder,
+        embedder_name=local_embedder_name,
+    )
+_local_index_lock = asyncio.Lock()
+_local_index_checked_at = 0.0
+
+
+async def ensure_local_index(force: bool = False) -> None:
+    """
+    加载本地索引，并每隔 LOCAL_CHECK_INTERVAL 秒重新检查文档指纹，文档有变化则重建；
+    force=True 强制重建。构建在线程中执行，重建后清空本地后端的结果缓存。
+    """
+    global _local_index_checked_at
+    if local_index.ready and not force and time.monotonic() - _local_index_checked_at < LOCAL_CHECK_INTERVAL:
+        return
+    async with _local_index_lock:
+        if local_index.ready and not force and time.monotonic() - _local_index_checked_at < LOCAL_CHECK_INTERVAL:
+            return
+        built_at = local_index.built_at
+        await asyncio.to_thread(local_index.load_or_build, force)
+        _local_index_checked_at = time.monotonic()
+        if built_at is not None and local_index.built_at != built_at:
+            _result_cache.invalidate_backend('local')
+
 # ---------------------------------------------------------------------------
 # FastAPI app
 # ---------------------------------------------------------------------------
@@ -99,6 +230,7 @@ class RAGSearchRequest(BaseModel):
     rerank_min_score: float = 0.20
     dense_similarity_top_k: int = 50
     sparse_similarity_top_k: int = 50
+    backend: Optional[Literal['bailian', 'local']] = None  # 不传时使用 RAG_DEFAULT_BACKEND
 
 
 class RAGNode(BaseModel):
@@ -114,6 +246,121 @@ class RAGSearchResponse(BaseModel):
     request_id: Optional[str] = None
 
 
+class RAGBatchSearchRequest(BaseModel):
+    queries: List[str]
+    index_id: Optional[str] = None
+    top_k: int = 5
+    enable_reranking: bool = False
+    rerank_min_score: float = 0.20
+    dense_similarity_top_k: int = 50
+    sparse_similarity_top_k: int = 50
+    backend: Optional[Literal['bailian', 'local']] = None
+    # 同一文本切片只保留在得分最高的 query 分组中；会使其他分组缺少该切片甚至为空，默认关闭
+    dedupe: bool = False
+
+
+class RAGBatchSearchResult(BaseModel):
+    query: str
+    nodes: List[RAGNode]
+    success: bool
+    message: Optional[str] = None
+    request_id: Optional[str] = None
+
+
+class RAGBatchSearchResponse(BaseModel):
+    results: List[RAGBatchSearchResult]  # 与 queries 顺序一致
+    duplicates_removed: int = 0
+
+
+# ---------------------------------------------------------------------------
+# Result cache + request coalescing
+# ---------------------------------------------------------------------------
+
+
+class RAGResultCache:
+    """
+    检索结果的 LRU + TTL 缓存，并合并相同的在途请求（single-flight）。
+
+    只缓存 success=True 的结果；上游调用在独立 task 中执行，
+    某个调用方断开（取消）不会影响等待同一结果的其他调用方。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[tuple, tuple[float, RAGSearchResponse]]' = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(backend: str, index_id: str, request: RAGSearchRequest) -> tuple:
+        return (
+            backend,
+            index_id,
+            ' '.join(request.query.lower().split()),
+            request.top_k,
+            request.enable_reranking,
+            request.rerank_min_score if request.enable_reranking else None,
+            request.dense_similarity_top_k,
+            request.sparse_similarity_top_k,
+        )
+
+    async def get_or_fetch(
+        self, key: tuple, fetch: Callable[[], Awaitable[RAGSearchResponse]]
+    ) -> RAGSearchResponse:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task)
+
+    def invalidate_backend(self, backend: str) -> None:
+        """丢弃某个后端的全部缓存（本地索引重建后调用）。"""
+        for key in [k for k in self._entries if k[0] == backend]:
+            del self._entries[key]
+
+    def _on_done(self, key: tuple, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if result.success and self.max_size > 0:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_result_cache = RAGResultCache(CACHE_MAX_SIZE, CACHE_TTL)
+
+
 # ---------------------------------------------------------------------------
 # Endpoints
 # ---------------------------------------------------------------------------
@@ -126,6 +373,8 @@ async def healthcheck():
         'status': 'healthy',
         'sdk_available': SDK_AVAILABLE,
         'client_ready': bailian_client is not None,
+        'default_backend': DEFAULT_BACKEND,
+        'local_index_ready': local_index is not None and local_index.ready,
         'workspace_id': WORKSPACE_ID[:10] + '...' if WORKSPACE_ID else None,
         'default_index_id': DEFAULT_INDEX_ID[:10] + '...' if DEFAULT_INDEX_ID else None,
     }
@@ -134,7 +383,7 @@ async def healthcheck():
 @app.post('/search', response_model=RAGSearchResponse)
 async def search_rag(request: RAGSearchRequest):
     """
-    检索阿里云百炼知识库
+    检索阿里云百炼知识库（或本地索引，见 request.backend）
     
     Args:
         request: 检索请求，包含查询文本、知识库 ID、Top K 等参数
@@ -142,6 +391,112 @@ async def search_rag(request: RAGSearchRequest):
     Returns:
         RAGSearchResponse: 检索结果，包含文本切片列表
     """
+    key, fetch = _prepare_search(request)
+    return await _result_cache.get_or_fetch(key, fetch)
+
+
+@app.post('/search/batch', response_model=RAGBatchSearchResponse)
+async def search_rag_batch(request: RAGBatchSearchRequest):
+    """
+    批量检索：每个 query 按 /search 的逻辑检索，结果按 query 分组返回。
+
+    所有 query 并发执行，共用单条检索的缓存、在途合并与并发上限；
+    默认每组返回该 query 的完整结果；dedupe=True 时，同一切片（有切片 id 时按 id，否则按文本）
+    只保留在得分最高的分组里（同分保留靠前的 query），适合把各组结果拼接进同一个 prompt 的调用方。
+    """
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f'query 数量超过上限: {len(request.queries)} > {BATCH_MAX_QUERIES}'
+        )
+
+    # 先全部校验再发起检索，参数错误时不产生任何上游调用
+    shared = request.model_dump(exclude={'queries', 'dedupe'})
+    prepared = [_prepare_search(RAGSearchRequest(query=query, **shared)) for query in request.queries]
+    responses = await asyncio.gather(
+        *(_result_cache.get_or_fetch(key, fetch) for key, fetch in prepared)
+    )
+
+    node_lists = [response.nodes for response in responses]
+    removed = 0
+    if request.dedupe:
+        node_lists, removed = _dedupe_nodes(node_lists)
+    if removed:
+        logger.info(f"[RAG Batch] {len(request.queries)} 个 query，去除重复切片 {removed} 个")
+
+    return RAGBatchSearchResponse(
+        results=[
+            RAGBatchSearchResult(
+                query=query,
+                nodes=nodes,
+                success=response.success,
+                message=response.message,
+                request_id=response.request_id,
+            )
+            for query, nodes, response in zip(request.queries, node_lists, responses)
+        ],
+        duplicates_removed=removed,
+    )
+
+
+# 切片自带的唯一标识：百炼节点 metadata 中的 _id 等；依次尝试
+_NODE_ID_KEYS = ('_id', 'chunk_id', 'node_id', 'id', 'hash')
+
+
+def _node_key(node: RAGNode) -> tuple:
+    """
+    切片的去重键：优先用 metadata 中的切片 id / hash，
+    其次用本地索引的 (source, chunk_index)，都没有时才退回规范化文本。
+    """
+    metadata = node.metadata or {}
+    for key in _NODE_ID_KEYS:
+        value = metadata.get(key)
+        if value not in (None, ''):
+            return ('id', str(value))
+    if metadata.get('source') is not None and metadata.get('chunk_index') is not None:
+        return ('chunk', str(metadata['source']), metadata['chunk_index'])
+    return ('text', ' '.join(node.text.split()))
+
+
+def _dedupe_nodes(node_lists: List[List[RAGNode]]) -> tuple[List[List[RAGNode]], int]:
+    """按切片去重（键见 _node_key）：每个切片只留在得分最高的分组（不修改缓存中的原列表）。"""
+    best: Dict[tuple, tuple[float, int]] = {}
+    for group, nodes in enumerate(node_lists):
+        for node in nodes:
+            key = _node_key(node)
+            if key not in best or node.score > best[key][0]:
+                best[key] = (node.score, group)
+
+    kept: set[tuple] = set()
+    deduped: List[List[RAGNode]] = []
+    removed = 0
+    for group, nodes in enumerate(node_lists):
+        out = []
+        for node in nodes:
+            key = _node_key(node)
+            if best[key][1] == group and key not in kept:
+                kept.add(key)
+                out.append(node)
+            else:
+                removed += 1
+        deduped.append(out)
+    return deduped, removed
+
+
+def _prepare_search(
+    request: RAGSearchRequest,
+) -> tuple[tuple, Callable[[], Awaitable[RAGSearchResponse]]]:
+    """校验检索请求并返回 (缓存 key, 上游调用)；配置缺失时抛 HTTPException。"""
+    backend = request.backend or DEFAULT_BACKEND
+    if backend == 'local':
+        if local_index is None:
+            raise HTTPException(
+                status_code=503,
+                detail='本地检索后端不可用（需要 numpy）'
+            )
+        key = RAGResultCache.make_key('local', '', request)
+        return key, lambda: _retrieve_local(request)
+
     if not SDK_AVAILABLE:
         raise HTTPException(
             status_code=503,
@@ -168,6 +523,12 @@ async def search_rag(request: RAGSearchRequest):
             detail='知识库 ID 未指定且未配置默认值'
         )
     
+    key = RAGResultCache.make_key('bailian', index_id, request)
+    return key, lambda: _retrieve_remote(request, index_id)
+
+
+async def _retrieve_remote(request: RAGSearchRequest, index_id: str) -> RAGSearchResponse:
+    """调用百炼 Retrieve 接口并转换结果；任何异常都转换为 success=False 的响应。"""
     try:
         logger.info(f"[RAG Search] 查询: {request.query}, Index: {index_id}")
         
@@ -189,8 +550,8 @@ async def search_rag(request: RAGSearchRequest):
                 rerank_config.rerank_top_n = request.top_k
             retrieve_request.rerank = [rerank_config]
         
-        # 调用 Retrieve API
-        response = bailian_client.retrieve(WORKSPACE_ID, retrieve_request)
+        # 调用 Retrieve API（异步，不阻塞事件循环）
+        response = await retrieve_async(retrieve_request)
         
         # 检查响应
         if not response.body.success:
@@ -220,6 +581,14 @@ async def search_rag(request: RAGSearchRequest):
             request_id=response.body.request_id,
         )
         
+    except asyncio.TimeoutError:
+        logger.warning(f"[RAG Search] 超时（>{RETRIEVE_TIMEOUT}s）: {request.query}")
+        return RAGSearchResponse(
+            nodes=[],
+            success=False,
+            message=f'检索超时（>{RETRIEVE_TIMEOUT}s）',
+        )
+
     except Exception as e:
         logger.error(f"[RAG Search] 异常: {str(e)}")
         return RAGSearchResponse(
@@ -229,6 +598,45 @@ async def search_rag(request: RAGSearchRequest):
         )
 
 
+async def _retrieve_local(request: RAGSearchRequest) -> RAGSearchResponse:
+    """在本地索引上做混合检索；启用重排序时 rerank_min_score 作为融合分数下限。"""
+    try:
+        await ensure_local_index()
+        results = await asyncio.to_thread(
+            local_index.search,
+            request.query,
+            request.top_k,
+            dense_top_k=request.dense_similarity_top_k,
+            sparse_top_k=request.sparse_similarity_top_k,
+            dense_weight=LOCAL_DENSE_WEIGHT,
+            min_score=request.rerank_min_score if request.enable_reranking else None,
+        )
+        nodes = [RAGNode(text=text, score=score, metadata=metadata) for text, score, metadata in results]
+        logger.info(f"[RAG Search] 本地索引返回 {len(nodes)} 个结果: {request.query}")
+        return RAGSearchResponse(nodes=nodes, success=True)
+
+    except Exception as e:
+        logger.error(f"[RAG Search] 本地检索异常: {str(e)}")
+        return RAGSearchResponse(
+            nodes=[],
+            success=False,
+            message=str(e),
+        )
+
+
+@app.post('/local/reindex')
+async def reindex_local():
+    """重新扫描 RAG_LOCAL_DOCS_DIR 并重建本地索引"""
+    if local_index is None:
+        raise HTTPException(
+            status_code=503,
+            detail='本地检索后端不可用（需要 numpy）'
+        )
+    await ensure_local_index(force=True)
+    _result_cache.invalidate_backend('local')
+    return local_index.stats()
+
+
 @app.get('/info')
 async def rag_info():
     """获取 RAG 服务配置信息（调试用）"""
@@ -237,6 +645,13 @@ async def rag_info():
         'default_index_id': DEFAULT_INDEX_ID,
         'sdk_available': SDK_AVAILABLE,
         'client_ready': bailian_client is not None,
+        'async_retrieve': hasattr(bailian_client, 'retrieve_async'),
+        'max_concurrency': MAX_CONCURRENT_RETRIEVES,
+        'retrieve_timeout': RETRIEVE_TIMEOUT,
+        'batch_max_queries': BATCH_MAX_QUERIES,
+        'cache': _result_cache.stats(),
+        'default_backend': DEFAULT_BACKEND,
+        'local_index': local_index.stats() if local_index is not None else None,
     }
 
 
@@ -0,0 +1,370 @@
+"""
+Realtime 中继的媒体处理（供 qwen_realtime_websocket.py 使用）
+
+VideoFramePipeline：浏览器上传的 JPEG 视频帧在转发给 Qwen 之前
+  1. 解码（JPEG 用 draft 模式在 DCT 阶段直接缩小，解码开销很低）
+  2. 用 dHash（64 位差值哈希）丢弃与上一个接受帧近似重复的帧
+  3. 缩放到 max_side 以内并按 quality 重新编码
+  4. 按发送间隔限速：间隔内到达的新帧覆盖尚未发送的旧帧，视频上行帧率有上限
+发送间隔随实测上行带宽自适应：统计最近 rate_window 秒实际交给 SDK 的音频字节数，
+上行预算（uplink_budget，字节/秒）扣除音频后剩余的部分分给视频，
+间隔 = 近期平均帧大小 / 视频可用速率，限制在 [interval, max_interval] 内；
+说话时视频自动降帧，静音时恢复。uplink_budget 为 0 时按固定 interval 发送。
+未安装 Pillow 时退化为原样转发，仅保留发送间隔控制。
+
+二进制帧协议：音视频走 WebSocket 二进制消息，省去 base64（+33%）与 JSON 解析；
+控制消息（init / commit / ping 等）仍是 JSON 文本。每个二进制消息 =
+  6 字节头（网络字节序）：kind u8 | version u8 | seq u32
+  + 负载：FRAME_AUDIO_IN 为 16kHz PCM16 单声道，FRAME_VIDEO_IN 为 JPEG，
+          FRAME_AUDIO_OUT 为 24kHz PCM16 单声道（下行，init 时 binary=true 才启用）
+seq 由发送方按 kind 各自递增，接收方据此统计丢帧 / 乱序。
+
+VoiceActivityDetector：对上行 16kHz PCM16 做纯 CPU 的能量 VAD，
+静音不上行，一段话结束（静音超过 hangover，或达到最长时长）时通知调用方自动提交。
+"""
+
+import base64
+import io
+import math
+import struct
+import time
+from collections import deque
+from typing import Optional
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+FRAME_HEADER = struct.Struct('!BBI')
+PROTOCOL_VERSION = 1
+
+FRAME_AUDIO_IN = 1
+FRAME_VIDEO_IN = 2
+FRAME_AUDIO_OUT = 3
+
+
+def pack_frame(kind: int, seq: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(kind, PROTOCOL_VERSION, seq & 0xFFFFFFFF) + payload
+
+
+def unpack_frame(message: bytes) -> tuple[int, int, bytes]:
+    """解析二进制消息，返回 (kind, seq, payload)；格式不对时抛 ValueError。"""
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError(f'binary frame too short: {len(message)} bytes')
+    kind, version, seq = FRAME_HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f'unsupported frame version: {version}')
+    return kind, seq, message[FRAME_HEADER.size:]
+
+
+class SequenceTracker:
+    """按 kind 记录最近的 seq，统计跳号（丢帧）与回退（乱序 / 重复）的次数。"""
+
+    def __init__(self) -> None:
+        self._last: dict[int, int] = {}
+        self.gaps = 0
+        self.reordered = 0
+
+    def observe(self, kind: int, seq: int) -> bool:
+        """返回 False 表示该帧不比上一帧新（乱序或重复），调用方应丢弃。"""
+        last = self._last.get(kind)
+        if last is not None:
+            delta = (seq - last) & 0xFFFFFFFF
+            if delta == 0 or delta > 0x7FFFFFFF:
+                self.reordered += 1
+                return False
+            if delta > 1:
+                self.gaps += delta - 1
+        self._last[kind] = seq
+        return True
+
+
+class ByteRateMeter:
+    """最近 window 秒内的字节速率（字节/秒），按调用方给出的时间统计。"""
+
+    def __init__(self, window: float = 5.0):
+        self.window = max(window, 0.1)
+        self._samples: deque[tuple[float, int]] = deque()
+        self._bytes = 0
+        self.total = 0
+
+    def record(self, size: int, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._samples.append((now, size))
+        self._bytes += size
+        self.total += size
+        self._expire(now)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        self._expire(time.monotonic() if now is None else now)
+        return self._bytes / self.window
+
+    def _expire(self, now: float) -> None:
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._bytes -= self._samples.popleft()[1]
+
+
+def _dhash(image: 'Image.Image') -> int:
+    """差值哈希：9x8 灰度图相邻像素比较得到 64 位指纹，对缩放/压缩噪声不敏感。"""
+    pixels = list(image.convert('L').resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+
+class VideoFramePipeline:
+    """
+    单个会话的视频帧处理管线。
+
+    submit() 接收一帧（解码 / 去重 / 缩放，CPU 开销可放到线程里执行），
+    结果暂存为待发送帧，新帧覆盖旧帧；take_due() 在到达发送间隔时取出待发送帧，
+    调用方发送后通过 record_sent() 回报大小，上行音频通过 record_audio() 回报，
+    二者决定下一次的发送间隔（见模块说明）。
+    """
+
+    def __init__(
+        self,
+        max_side: int = 640,
+        quality: int = 70,
+        dedupe_distance: int = 4,
+        keepalive: float = 5.0,
+        interval: float = 0.5,
+        max_interval: float = 5.0,
+        uplink_budget: float = 0.0,
+        rate_window: float = 5.0,
+    ):
+        self.max_side = max_side
+        self.quality = quality
+        self.dedupe_distance = dedupe_distance  # dHash 汉明距离 ≤ 此值视为重复帧
+        self.keepalive = keepalive              # 画面静止时至少每隔这么久仍接受一帧
+        self.min_interval = interval            # 两次发送之间的最小间隔（秒）
+        self.max_interval = max(max_interval, interval)
+        self.uplink_budget = uplink_budget      # 音视频合计的上行预算（字节/秒），0 表示固定间隔
+        self.interval = interval                # 当前生效的发送间隔
+        self.audio = ByteRateMeter(rate_window)
+        self._frame_size = 0.0                  # 近期发送帧大小的指数平均（字节）
+
+        self._pending: Optional[str] = None
+        self._last_hash: Optional[int] = None
+        self._last_accept = 0.0
+        self._last_sent = 0.0
+
+        self.frames_in = 0
+        self.frames_dropped = 0
+        self.frames_sent = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+
+    def submit(self, jpeg: bytes, now: Optional[float] = None) -> bool:
+        """处理一帧；被判定为重复或无法解码时返回 False。"""
+        now = time.monotonic() if now is None else now
+        self.frames_in += 1
+        self.bytes_in += len(jpeg)
+        if not PIL_AVAILABLE:
+            self._pending = base64.b64encode(jpeg).decode('ascii')
+            return True
+
+        try:
+            image = Image.open(io.BytesIO(jpeg))
+            image.draft('RGB', (self.max_side, self.max_side))
+            image.load()
+        except Exception:
+            self.frames_dropped += 1
+            return False
+
+        fingerprint = _dhash(image)
+        if (
+            self._last_hash is not None
+            and bin(fingerprint ^ self._last_hash).count('1') <= self.dedupe_distance
+            and now - self._last_accept < self.keepalive
+        ):
+            self.frames_dropped += 1
+            return False
+        self._last_hash = fingerprint
+        self._last_accept = now
+
+        if max(image.size) > self.max_side:
+            image.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+        out = io.BytesIO()
+        image.convert('RGB').save(out, format='JPEG', quality=self.quality)
+        encoded = out.getvalue()
+        # 原图已经足够小时保留原图
+        if len(encoded) >= len(jpeg):
+            encoded = jpeg
+        self._pending = base64.b64encode(encoded).decode('ascii')
+        return True
+
+    def take_due(self, now: Optional[float] = None) -> Optional[str]:
+        """到达发送间隔且有待发送帧时取出（base64），否则返回 None。"""
+        now = time.monotonic() if now is None else now
+        self.interval = self._adapt_interval(now)
+        if self._pending is None or now - self._last_sent < self.interval:
+            return None
+        frame, self._pending = self._pending, None
+        self._last_sent = now
+        return frame
+
+    def record_sent(self, size: int) -> None:
+        """回报一次视频上行：size 为交给 SDK 的字节数（base64 字符数）。"""
+        self.frames_sent += 1
+        self.bytes_sent += size
+        self._frame_size = size if not self._frame_size else 0.7 * self._frame_size + 0.3 * size
+
+    def record_audio(self, size: int, now: Optional[float] = None) -> None:
+        """回报一次音频上行：size 为交给 SDK 的字节数（base64 字符数）。"""
+        self.audio.record(size, now)
+
+    def _adapt_interval(self, now: float) -> float:
+        if self.uplink_budget <= 0 or not self._frame_size:
+            return self.min_interval
+        # 音频优先：预算扣除实测音频速率后的部分给视频，至少保留 10% 避免除零 / 停发
+        video_rate = max(self.uplink_budget - self.audio.rate(now), 0.1 * self.uplink_budget)
+        return min(max(self._frame_size / video_rate, self.min_interval), self.max_interval)
+
+    def stats(self) -> dict:
+        return {
+            'frames_in': self.frames_in,
+            'frames_dropped': self.frames_dropped,
+            'frames_sent': self.frames_sent,
+            'bytes_in': self.bytes_in,
+            'bytes_sent': self.bytes_sent,
+            'interval': round(self.interval, 3),
+            'audio_rate': round(self.audio.rate()),
+        }
+
+
+class VoiceActivityDetector:
+    """
+    单个会话的语音活动检测（16kHz / PCM16 / 单声道）。
+
+    按 frame_ms 切帧计算能量（dBFS），与噪声底比较：
+    高出 margin（由 aggressiveness 0-3 决定，越大越严格）且高于绝对下限视为语音帧。
+    噪声底取最近 noise_window_ms 内的最小帧能量（最小值统计）：说话中总有音节间隙，
+    最小值跟随背景噪声；持续的稳定噪声在一个窗口后即成为新的噪声底，不会被一直当作语音。
+    连续 min_speech_ms 的语音帧判定为开口，并补发此前 preroll_ms 的音频避免吞字；
+    开口后持续上行，连续静音达到 hangover_ms 或一段话达到 max_utterance_ms 时判定结束。
+    """
+
+    MARGINS_DB = (6.0, 9.0, 12.0, 15.0)
+    FLOOR_DB = -55.0  # 低于此能量一律视为静音
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 20,
+        aggressiveness: int = 2,
+        hangover_ms: int = 600,
+        preroll_ms: int = 300,
+        min_speech_ms: int = 100,
+        max_utterance_ms: int = 15000,
+        noise_window_ms: int = 3000,
+    ):
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.margin_db = self.MARGINS_DB[min(max(aggressiveness, 0), 3)]
+        self.start_frames = max(min_speech_ms // frame_ms, 1)
+        self.hangover_frames = max(hangover_ms // frame_ms, 1)
+        # 0 表示不限制一段话的时长
+        self.max_utterance_frames = max(max_utterance_ms // frame_ms, 1) if max_utterance_ms > 0 else 0
+        self.noise_window = max(noise_window_ms // frame_ms, 1)
+        self._preroll: deque[bytes] = deque(maxlen=max(preroll_ms // frame_ms, self.start_frames))
+        self._remainder = b''
+        self._minima: deque[tuple[int, float]] = deque()  # (帧序号, dB)，dB 单调递增
+        self._noise_db: Optional[float] = None
+        self._speech_run = 0       # 未开口时连续语音帧数
+        self._silence_run = 0      # 开口后连续静音帧数
+        self._utterance_frames = 0  # 当前这段话已上行的帧数
+        self.speaking = False
+
+        self.frames_in = 0
+        self.frames_forwarded = 0
+        self.utterances = 0
+        self.forced_ends = 0  # 因达到 max_utterance_ms 而结束的次数
+
+    def _frame_db(self, frame: bytes) -> float:
+        samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples)))
+        return 20 * math.log10(max(rms, 1.0) / 32768)
+
+    def _track_floor(self, db: float) -> float:
+        """滑动窗口最小值（单调队列，均摊 O(1)）：最近 noise_window 帧的最低能量。"""
+        index = self.frames_in
+        while self._minima and self._minima[-1][1] >= db:
+            self._minima.pop()
+        self._minima.append((index, db))
+        if self._minima[0][0] <= index - self.noise_window:
+            self._minima.popleft()
+        return self._minima[0][1]
+
+    def _is_speech(self, frame: bytes) -> bool:
+        db = self._frame_db(frame)
+        self._noise_db = self._track_floor(db)
+        return db > max(self._noise_db + self.margin_db, self.FLOOR_DB)
+
+    def process(self, pcm: bytes) -> list[tuple[str, Optional[bytes]]]:
+        """
+        输入任意长度的 PCM，返回按顺序处理的事件：
+        ('start', None) 开口；('audio', bytes) 应上行的音频；('end', None) 一段话结束。
+        不足一帧的尾部留到下次调用。
+        """
+        data = self._remainder + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+
+        events: list[tuple[str, Optional[bytes]]] = []
+        out = bytearray()
+        for offset in range(0, usable, self.frame_bytes):
+            frame = data[offset:offset + self.frame_bytes]
+            self.frames_in += 1
+            speech = self._is_speech(frame)
+            if self.speaking:
+                out += frame
+                self.frames_forwarded += 1
+                self._utterance_frames += 1
+                self._silence_run = 0 if speech else self._silence_run + 1
+                forced = 0 < self.max_utterance_frames <= self._utterance_frames
+                if self._silence_run >= self.hangover_frames or forced:
+                    events.append(('audio', bytes(out)))
+                    events.append(('end', None))
+                    out = bytearray()
+                    self.speaking = False
+                    self._silence_run = 0
+                    self._utterance_frames = 0
+                    self.utterances += 1
+                    if forced:
+                        self.forced_ends += 1
+            else:
+                self._preroll.append(frame)
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self.start_frames:
+                    events.append(('start', None))
+                    self.speaking = True
+                    self._speech_run = 0
+                    self._utterance_frames = len(self._preroll)
+                    self.frames_forwarded += len(self._preroll)
+                    out += b''.join(self._preroll)
+                    self._preroll.clear()
+        if out:
+            events.append(('audio', bytes(out)))
+        return events
+
+    def stats(self) -> dict:
+        return {
+            'frames_in': self.frames_in,
+            'frames_forwarded': self.frames_forwarded,
+            'utterances': self.utterances,
+            'forced_ends': self.forced_ends,
+            'speaking': self.speaking,
+            'noise_db': round(self._noise_db, 1) if self._noise_db is not None else None,
+        }
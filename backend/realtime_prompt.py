@@ -0,0 +1,222 @@
+"""
+Realtime 中继的系统提示词模板（供 qwen_realtime_websocket.py 使用）
+
+提示词按节拼装：角色 / 当前情况 / 游戏步骤 / 历史参考 / 任务与原则。
+角色与任务原则是固定文本，模块加载时就已拼好；其余各节只由对应输入渲染，
+整份提示词按输入指纹做 LRU 缓存，同一游戏、同一孩子的会话不再重复拼接。
+会话中途更新游戏进度或历史时，用 diff_sections() 找出实际变化的节。
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+PROMPT_ROLE = """# 角色：地板时光引导师
+
+你通过视频通话观察孩子，当孩子注意力分散时，引导家长用地板时光的方式处理。"""
+
+PROMPT_RULES = """## 你的任务
+
+**只在孩子注意力分散时说话**
+
+当你看到孩子：
+- 不看游戏材料，看别的东西
+- 拿起其他物品
+- 走开或转身
+- 对游戏失去兴趣
+
+**立即引导家长：**
+
+### 四步法（Follow the Child's Lead）
+
+**1. 观察**
+看清孩子在做什么、看什么
+
+**2. 跟随**
+"你也[拿/看/做]一个，坐他旁边"
+
+**3. 互动**
+"[轻轻碰/慢慢靠近]，等他看你"
+
+**4. 桥梁（关键！）**
+结合游戏步骤和孩子当前兴趣，找到连接点：
+- 如果孩子在玩车，游戏是积木 → "把积木当车库/停车场"
+- 如果孩子在看窗外，游戏是认颜色 → "指外面的[颜色]，再指[游戏材料]"
+- 如果孩子在排列物品，游戏是分类 → "你也排一个，按[游戏目标]排"
+
+**核心思路：在孩子的兴趣中实现游戏目标**
+
+### 回复格式
+
+[孩子在做什么] 1句
+[家长怎么做] 1-2句
+[如何连接游戏] 1句（如果可能）
+
+**示例：**
+
+场景：游戏是"积木搭高塔"，孩子拿起小车
+"他拿车了。你也拿一辆，推到他面前。等他看你，把积木当车库，'车开进去'"
+
+场景：游戏是"认识颜色"，孩子看窗外的树
+"他在看树。你也看，'绿色的树'。指指绿色的[游戏材料]，'这个也是绿色'"
+
+场景：游戏是"物品分类"，孩子在排列玩具
+"他在排玩具。你也排一个，慢慢按[大小/颜色]排，看他会不会跟着分"
+
+场景：游戏是"角色扮演"，孩子趴在地上看蚂蚁
+"他在看蚂蚁。蹲下来一起看。'小蚂蚁在搬家'，拿[游戏材料]，'我们也搬家'"
+
+## 核心原则
+
+✅ 跟随孩子的兴趣
+✅ 在他的世界里建立连接
+✅ 用他感兴趣的方式实现游戏目标
+✅ 慢慢搭桥回到游戏步骤
+
+❌ 不要强拉回游戏
+❌ 不要说"回来""别走神"
+❌ 不要打断孩子
+❌ 不要放弃游戏目标（要巧妙融入）
+
+## 何时说话
+
+**说话：**
+- 孩子明显分心超过5秒
+- 家长不知道怎么办
+- 家长试图强拉孩子
+
+**不说话：**
+- 孩子在玩游戏
+- 家长正在互动
+- 家长在哄孩子
+
+## 语言要求
+
+- 20-35字
+- 口语化
+- 具体动作
+- 温和语气
+
+开始观察！"""
+
+SECTION_ORDER = ('role', 'situation', 'steps', 'history', 'rules')
+
+# 历史参考最多列出的近期游戏数
+HISTORY_MAX_GAMES = 3
+
+# 参与渲染的字段；指纹只取这些，前端附带的其他字段变化不会打散缓存
+CHILD_FIELDS = ('name',)
+GAME_FIELDS = ('title', 'goal', 'materials', 'steps', 'currentStep')
+HISTORY_FIELDS = ('recentGames', 'successfulStrategies', 'challengingAreas')
+
+
+def _fingerprint(child_info: dict, game_info: dict, history_info: Optional[dict]) -> str:
+    parts = [
+        {k: child_info.get(k) for k in CHILD_FIELDS},
+        {k: game_info.get(k) for k in GAME_FIELDS},
+        {k: (history_info or {}).get(k) for k in HISTORY_FIELDS},
+    ]
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def render_situation(child_info: dict, game_info: dict) -> str:
+    lines = [
+        '## 当前情况',
+        f"- 孩子：{child_info.get('name', '孩子')}",
+        f"- 游戏：{game_info.get('title', '游戏')}",
+        f"- 目标：{game_info.get('goal', '')}",
+    ]
+    materials = game_info.get('materials', [])
+    if materials:
+        lines.append(f"- 材料：{', '.join(materials)}")
+    return '\n'.join(lines)
+
+
+def render_steps(game_info: dict) -> str:
+    steps = game_info.get('steps', [])
+    if not steps:
+        return ''
+    lines = ['**游戏步骤（了解这些，才能在孩子分心时找到回归的桥梁）：**']
+    for i, step in enumerate(steps, 1):
+        step_title = step.get('stepTitle', f'第{i}步')
+        instruction = step.get('instruction', '')
+        lines.append(f'{i}. {step_title}：{instruction}')
+    current = game_info.get('currentStep')
+    if isinstance(current, int) and 0 <= current < len(steps):
+        lines.append(f'\n**当前进行到第 {current + 1} 步**，引导时优先桥接回这一步。')
+    return '\n'.join(lines)
+
+
+def render_history(history_info: Optional[dict]) -> str:
+    if not history_info:
+        return ''
+    lines = []
+    for game in history_info.get('recentGames', [])[:HISTORY_MAX_GAMES]:
+        evaluation = game.get('evaluation') or {}
+        detail = '，'.join(
+            part for part in (
+                game.get('result', ''),
+                f"评分 {evaluation['score']}" if evaluation.get('score') is not None else '',
+            ) if part
+        )
+        lines.append(f"- 最近玩过：{game.get('title', '游戏')}" + (f'（{detail}）' if detail else ''))
+    if history_info.get('successfulStrategies'):
+        lines.append(f"- 有效策略：{'、'.join(history_info['successfulStrategies'])}")
+    if history_info.get('challengingAreas'):
+        lines.append(f"- 困难领域：{'、'.join(history_info['challengingAreas'])}")
+    if not lines:
+        return ''
+    return '## 历史参考（优先复用有效策略，避开困难领域）\n' + '\n'.join(lines)
+
+
+def render_sections(child_info: dict, game_info: dict, history_info: Optional[dict] = None) -> dict:
+    """按 SECTION_ORDER 渲染各节；空节为空字符串。"""
+    return {
+        'role': PROMPT_ROLE,
+        'situation': render_situation(child_info, game_info),
+        'steps': render_steps(game_info),
+        'history': render_history(history_info),
+        'rules': PROMPT_RULES,
+    }
+
+
+def join_sections(sections: dict) -> str:
+    return '\n\n'.join(sections[name] for name in SECTION_ORDER if sections.get(name))
+
+
+def diff_sections(old: dict, new: dict) -> list[str]:
+    """返回内容发生变化的节名（按 SECTION_ORDER）。"""
+    return [name for name in SECTION_ORDER if old.get(name, '') != new.get(name, '')]
+
+
+class PromptCache:
+    """按 (孩子, 游戏, 历史) 指纹缓存渲染结果：{sections, prompt}，LRU 淘汰。"""
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, tuple[dict, str]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(
+        self, child_info: dict, game_info: dict, history_info: Optional[dict] = None
+    ) -> tuple[dict, str]:
+        key = _fingerprint(child_info, game_info, history_info)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        sections = render_sections(child_info, game_info, history_info)
+        entry = (sections, join_sections(sections))
+        if self.max_size > 0:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,350 @@
+"""
+Realtime 中继的会话管理（供 qwen_realtime_websocket.py 使用）
+
+SessionManager 限制同时进行的 Qwen 会话数：超出上限的连接排队等待空位，
+等待超时则拒绝。每个会话记录上下行字节数与延迟，汇总后由 /stats 暴露，用于容量规划。
+
+延迟口径：
+  response_latency   提交（commit）→ 上游 response.created
+  first_audio        提交（commit）→ 第一个 response.audio.delta（首包音频）
+  forward_latency    SDK 回调收到上游事件 → 转发给浏览器完成
+
+OutboundQueue 是每个连接的下行通道：SDK 回调线程只负责入队，
+由单个发送 task 按顺序写 WebSocket；连续的音频增量合并后再发送，
+队列满时按策略丢弃最旧的音频或阻塞回调线程（对上游施加背压）。
+发送失败时队列关闭：之后的入队直接丢弃，不再阻塞回调线程。
+连接结束前用 drain() 等待积压发完（例如最后的 error 消息），再取消发送 task。
+"""
+
+import asyncio
+import base64
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from realtime_media import FRAME_AUDIO_OUT, pack_frame
+
+
+class SessionRejected(Exception):
+    """排队超时，未获得会话名额。"""
+
+
+class LatencyStats:
+    """最近 window 个样本的延迟统计（秒），线程安全地追加（deque.append 原子）。"""
+
+    def __init__(self, window: int = 256):
+        self._samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: 'LatencyStats') -> None:
+        for sample in list(other._samples):
+            self.add(sample)
+
+    def summary(self) -> dict:
+        samples = sorted(self._samples)
+        if not samples:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'avg_ms': round(sum(samples) / len(samples) * 1000, 1),
+            'p50_ms': round(samples[len(samples) // 2] * 1000, 1),
+            'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 1),
+            'max_ms': round(self.max * 1000, 1),
+        }
+
+
+@dataclass
+class SessionStats:
+    """单个会话的资源与延迟统计；SDK 回调线程与事件循环都会写入，只做简单累加。"""
+
+    id: int
+    remote: str
+    queued_seconds: float = 0.0
+    started_at: float = field(default_factory=time.time)
+    audio_bytes_in: int = 0
+    video_bytes_in: int = 0
+    audio_bytes_out: int = 0
+    upstream_events: int = 0
+    responses: int = 0
+    commit_at: Optional[float] = None   # 最近一次提交的 monotonic 时间，收到首包音频后清空
+    response_latency: LatencyStats = field(default_factory=LatencyStats)
+    first_audio: LatencyStats = field(default_factory=LatencyStats)
+    forward_latency: LatencyStats = field(default_factory=LatencyStats)
+    outbound_dropped: int = 0      # 下行队列满时丢弃的音频增量数
+    outbound_merged: int = 0       # 被合并进前一条消息的音频增量数
+    outbound_depth_max: int = 0    # 下行队列的最大积压
+
+    def mark_commit(self) -> None:
+        self.commit_at = time.monotonic()
+
+    def on_upstream_event(self, event_type: str) -> None:
+        self.upstream_events += 1
+        commit_at = self.commit_at
+        if commit_at is None:
+            return
+        if event_type == 'response.created':
+            self.responses += 1
+            self.response_latency.add(time.monotonic() - commit_at)
+        elif event_type == 'response.audio.delta':
+            self.first_audio.add(time.monotonic() - commit_at)
+            self.commit_at = None
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'remote': self.remote,
+            'duration_seconds': round(time.time() - self.started_at, 1),
+            'queued_seconds': round(self.queued_seconds, 3),
+            'audio_bytes_in': self.audio_bytes_in,
+            'video_bytes_in': self.video_bytes_in,
+            'audio_bytes_out': self.audio_bytes_out,
+            'upstream_events': self.upstream_events,
+            'responses': self.responses,
+            'response_latency': self.response_latency.summary(),
+            'first_audio': self.first_audio.summary(),
+            'forward_latency': self.forward_latency.summary(),
+            'outbound_dropped': self.outbound_dropped,
+            'outbound_merged': self.outbound_merged,
+            'outbound_depth_max': self.outbound_depth_max,
+        }
+
+
+class SessionManager:
+    """
+    并发会话上限 + 排队准入。
+
+    admit() 在有空位时立即返回，否则排队最多 queue_timeout 秒，超时抛 SessionRejected；
+    会话结束时必须调用 release()。结束会话的延迟样本并入全局统计。
+    """
+
+    def __init__(self, max_sessions: int, queue_timeout: float):
+        self.max_sessions = max_sessions
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_sessions)
+        self._ids = itertools.count(1)
+        self.active: dict[int, SessionStats] = {}
+        self.waiting = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.completed_total = 0
+        self.totals = {'audio_bytes_in': 0, 'video_bytes_in': 0, 'audio_bytes_out': 0}
+        self.queue_wait = LatencyStats()
+        self.response_latency = LatencyStats()
+        self.first_audio = LatencyStats()
+
+    async def admit(self, remote: str) -> SessionStats:
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_total += 1
+            raise SessionRejected(f'等待 {self.queue_timeout}s 仍无空闲会话')
+        finally:
+            self.waiting -= 1
+        session = SessionStats(id=next(self._ids), remote=remote)
+        session.queued_seconds = time.monotonic() - queued_at
+        self.queue_wait.add(session.queued_seconds)
+        self.active[session.id] = session
+        self.admitted_total += 1
+        return session
+
+    def release(self, session: SessionStats) -> None:
+        if self.active.pop(session.id, None) is None:
+            return
+        self._slots.release()
+        self.completed_total += 1
+        for key in self.totals:
+            self.totals[key] += getattr(session, key)
+        self.response_latency.merge(session.response_latency)
+        self.first_audio.merge(session.first_audio)
+
+    def is_full(self) -> bool:
+        return len(self.active) >= self.max_sessions
+
+    def stats(self) -> dict:
+        return {
+            'max_sessions': self.max_sessions,
+            'active': len(self.active),
+            'waiting': self.waiting,
+            'admitted_total': self.admitted_total,
+            'rejected_total': self.rejected_total,
+            'completed_total': self.completed_total,
+            'completed_bytes': dict(self.totals),
+            'queue_wait': self.queue_wait.summary(),
+            'completed_response_latency': self.response_latency.summary(),
+            'completed_first_audio': self.first_audio.summary(),
+            'sessions': [session.summary() for session in self.active.values()],
+        }
+
+
+@dataclass
+class OutboundItem:
+    event: dict                    # 上游事件或本地控制消息
+    pcm: Optional[bytes] = None    # response.audio.delta 解码后的 PCM
+    received_at: float = field(default_factory=time.monotonic)
+
+
+class OutboundQueue:
+    """
+    单连接的有界下行队列 + 单发送 task。
+
+    put_threadsafe() 供 SDK 回调线程调用，put() 供事件循环内调用；run() 是唯一的发送者。
+    发送时把队首连续的音频增量合并为一条（队列暂空时最多再等 merge_window 秒凑批），
+    合并后的 PCM 不超过 merge_max_bytes。
+    队列满（max_items）时：
+      policy='drop_oldest'  丢弃最旧的一条音频增量（控制事件从不丢弃）
+      policy='block'        回调线程阻塞等待空位（最长 block_timeout 秒，超时丢弃该条）
+    发送抛出异常时 run() 记录到 error、关闭队列并返回，调用方据此关闭连接。
+    所有下行消息都必须经过本队列，不要绕过它直接写 WebSocket。
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Any], Awaitable[None]],
+        session: SessionStats,
+        loop: asyncio.AbstractEventLoop,
+        max_items: int = 256,
+        merge_window: float = 0.02,
+        merge_max_bytes: int = 48000,
+        policy: str = 'drop_oldest',
+        block_timeout: float = 2.0,
+    ):
+        self._send = send
+        self.session = session
+        self.loop = loop
+        self.max_items = max_items
+        self.merge_window = merge_window
+        self.merge_max_bytes = merge_max_bytes
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.binary = False  # 由 init 消息决定音频增量以二进制帧还是 JSON 下发
+
+        self._items: deque[OutboundItem] = deque()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()  # 队列已空且发送 task 不在发送中
+        self._idle.set()
+        self._space = threading.Semaphore(max_items) if policy == 'block' else None
+        self._audio_seq = 0
+        self.closed = False  # 发送 task 已结束，不再接受入队（回调线程也会读取）
+        self.error: Optional[BaseException] = None
+
+    # ------------------------------------------------------------ producers
+
+    def put_threadsafe(self, item: OutboundItem) -> None:
+        if self.closed:
+            return
+        # 容量只约束音频增量；控制事件量小且不能丢，始终入队
+        if self._space is not None and item.pcm is not None:
+            if not self._space.acquire(timeout=self.block_timeout) or self.closed:
+                self.session.outbound_dropped += 1
+                return
+        try:
+            self.loop.call_soon_threadsafe(self._append, item)
+        except RuntimeError:
+            pass  # 事件循环已关闭（服务退出中）
+
+    def put(self, event: dict) -> None:
+        """事件循环内发送控制消息，与上游事件共用同一发送顺序。"""
+        self._append(OutboundItem(event))
+
+    def _append(self, item: OutboundItem) -> None:
+        if self.closed:
+            return
+        if self._space is None and item.pcm is not None and len(self._items) >= self.max_items:
+            for victim in self._items:
+                if victim.pcm is not None:
+                    self._items.remove(victim)
+                    self.session.outbound_dropped += 1
+                    break
+        self._items.append(item)
+        self._idle.clear()
+        self.session.outbound_depth_max = max(self.session.outbound_depth_max, len(self._items))
+        self._wakeup.set()
+
+    def _popleft(self) -> OutboundItem:
+        item = self._items.popleft()
+        if self._space is not None and item.pcm is not None:
+            self._space.release()
+        return item
+
+    def close(self) -> None:
+        """停止接受入队，丢弃积压，并唤醒阻塞在 put_threadsafe 中的回调线程。"""
+        if self.closed:
+            return
+        self.closed = True
+        self._items.clear()
+        self._idle.set()
+        if self._space is not None:
+            self._space.release(self.max_items)
+
+    async def drain(self, timeout: float) -> bool:
+        """等待已入队的消息全部发出（或队列关闭）；超时返回 False。"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # --------------------------------------------------------------- sender
+
+    async def run(self) -> None:
+        """唯一的发送者；发送失败时关闭队列并返回（异常保存在 error）。"""
+        try:
+            await self._run()
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        except Exception as exc:
+            self.error = exc
+            self.close()
+
+    async def _run(self) -> None:
+        while True:
+            if not self._items:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            item = self._popleft()
+            if item.pcm is None:
+                await self._send(json.dumps(item.event))
+                self.session.forward_latency.add(time.monotonic() - item.received_at)
+                continue
+
+            chunks = [item.pcm]
+            size = len(item.pcm)
+            while size < self.merge_max_bytes:
+                if not self._items and self.merge_window > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.merge_window)
+                    except asyncio.TimeoutError:
+                        break
+                if not self._items or self._items[0].pcm is None:
+                    break
+                nxt = self._popleft()
+                chunks.append(nxt.pcm)
+                size += len(nxt.pcm)
+                self.session.outbound_merged += 1
+            await self._send_audio(item, b''.join(chunks))
+
+    async def _send_audio(self, first: OutboundItem, pcm: bytes) -> None:
+        if self.binary:
+            message = pack_frame(FRAME_AUDIO_OUT, self._audio_seq, pcm)
+            self._audio_seq += 1
+        else:
+            message = json.dumps({**first.event, 'delta': base64.b64encode(pcm).decode('ascii')})
+        await self._send(message)
+        self.session.audio_bytes_out += len(pcm)
+        self.session.forward_latency.add(time.monotonic() - first.received_at)
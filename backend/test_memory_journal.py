@@ -0,0 +1,141 @@
+"""
+memory_journal.EpisodeJournal 测试：重放、压缩、flush 失败不中断、close 写完缓冲
+
+Run: python -m pytest -q backend/test_memory_journal.py
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import memory_journal
+from memory_journal import EpisodeJournal, JournalClosed
+
+
+def _episode(episode_id: str) -> dict:
+    return {'id': episode_id, 'group_id': 'child_1', 'content': f'内容 {episode_id}'}
+
+
+def _read_ops(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_replay_returns_unfinished_and_skips_corrupt_line(tmp_path):
+    path = tmp_path / 'wal.jsonl'
+    path.write_text(
+        json.dumps({'op': 'enqueue', 'episode': _episode('a')}) + '\n'
+        + json.dumps({'op': 'enqueue', 'episode': _episode('b')}) + '\n'
+        + json.dumps({'op': 'done', 'id': 'a'}) + '\n'
+        + '{"op": "enqueue", "epis',  # 崩溃留下的半行
+        encoding='utf-8',
+    )
+    journal = EpisodeJournal(str(path))
+    records = journal.replay()
+
+    assert [r['id'] for r in records] == ['b']
+    # 重放后文件被压缩为仅含未完成记录
+    assert _read_ops(path) == [{'op': 'enqueue', 'episode': _episode('b')}]
+
+
+def test_append_and_done_survive_restart(tmp_path):
+    path = tmp_path / 'wal.jsonl'
+
+    async def run():
+        journal = EpisodeJournal(str(path), flush_interval=0.01)
+        journal.replay()
+        journal.start()
+        await asyncio.gather(*(journal.append_enqueue(_episode(i)) for i in ('a', 'b', 'c')))
+        journal.mark_done('b')
+        await journal.close()
+
+    asyncio.run(run())
+    assert [r['id'] for r in EpisodeJournal(str(path)).replay()] == ['a', 'c']
+
+
+def test_compaction_rewrites_to_live_records(tmp_path):
+    path = tmp_path / 'wal.jsonl'
+
+    async def run():
+        journal = EpisodeJournal(str(path), flush_interval=0.01, compact_threshold=10)
+        journal.replay()
+        journal.start()
+        for i in range(20):
+            await journal.append_enqueue(_episode(str(i)))
+            journal.mark_done(str(i))
+        await journal.append_enqueue(_episode('live'))
+        await journal.close()
+
+    asyncio.run(run())
+    ops = _read_ops(path)
+    assert len(ops) < 10
+    assert [r['id'] for r in EpisodeJournal(str(path)).replay()] == ['live']
+
+
+def test_compaction_failure_keeps_flush_loop_running(tmp_path, monkeypatch):
+    path = tmp_path / 'wal.jsonl'
+
+    def broken_replace(src, dst):
+        raise OSError('replace failed')
+
+    async def run():
+        journal = EpisodeJournal(str(path), flush_interval=0.01, compact_threshold=2)
+        journal.replay()
+        monkeypatch.setattr(memory_journal.os, 'replace', broken_replace)
+        journal.start()
+        for i in range(5):
+            await journal.append_enqueue(_episode(str(i)))
+            journal.mark_done(str(i))
+        # 压缩一直失败，但后续写入仍能完成
+        await asyncio.wait_for(journal.append_enqueue(_episode('after')), timeout=2)
+        assert not journal._task.done()
+        await journal.close()
+
+    asyncio.run(run())
+    monkeypatch.undo()
+    assert [r['id'] for r in EpisodeJournal(str(path)).replay()] == ['after']
+
+
+def test_write_failure_fails_waiters_and_loop_continues(tmp_path, monkeypatch):
+    path = tmp_path / 'wal.jsonl'
+
+    async def run():
+        journal = EpisodeJournal(str(path), flush_interval=0.01)
+        journal.replay()
+        journal.start()
+        original = journal._write_lines
+        calls = {'n': 0}
+
+        def flaky(lines):
+            calls['n'] += 1
+            if calls['n'] == 1:
+                raise OSError('disk full')
+            original(lines)
+
+        monkeypatch.setattr(journal, '_write_lines', flaky)
+        with pytest.raises(OSError):
+            await asyncio.wait_for(journal.append_enqueue(_episode('lost')), timeout=2)
+        await asyncio.wait_for(journal.append_enqueue(_episode('kept')), timeout=2)
+        await journal.close()
+
+    asyncio.run(run())
+    assert [r['id'] for r in EpisodeJournal(str(path)).replay()] == ['kept']
+
+
+def test_close_flushes_pending_writes_and_rejects_new_ones(tmp_path):
+    path = tmp_path / 'wal.jsonl'
+
+    async def run():
+        # 间隔足够长：只有 close 触发的最后一次 flush 会写入
+        journal = EpisodeJournal(str(path), flush_interval=60)
+        journal.replay()
+        journal.start()
+        pending = asyncio.create_task(journal.append_enqueue(_episode('a')))
+        await asyncio.sleep(0)
+        await journal.close()
+        assert pending.done() and pending.exception() is None
+        with pytest.raises(JournalClosed):
+            await journal.append_enqueue(_episode('b'))
+
+    asyncio.run(run())
+    assert [r['id'] for r in EpisodeJournal(str(path)).replay()] == ['a']
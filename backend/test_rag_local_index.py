@@ -0,0 +1,136 @@
+"""
+rag_local_index 测试：文档变化后重建、向量文件版本化、重建期间检索、可替换 embedder
+
+Run: python -m pytest -q backend/test_rag_local_index.py
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from rag_local_index import LocalIndex, hash_embed, load_embedder
+
+
+def _write(path, text: str, mtime: int) -> None:
+    path.write_text(text, encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+def _manifest(index_dir) -> dict:
+    return json.loads((index_dir / 'manifest.json').read_text(encoding='utf-8'))
+
+
+def test_rebuild_writes_new_vectors_file_while_old_one_is_mapped(tmp_path):
+    docs, index_dir = tmp_path / 'docs', tmp_path / 'index'
+    docs.mkdir()
+    _write(docs / 'a.md', '眼神接触训练：每天三次，每次五分钟。', 1_000)
+
+    index = LocalIndex(str(docs), str(index_dir), dim=64)
+    index.load_or_build()
+    first = _manifest(index_dir)['vectors']
+    old_vectors = index._snapshot.vectors  # 模拟仍在进行的检索持有旧 mmap
+
+    _write(docs / 'b.md', 'Joint attention games with blocks.', 2_000)
+    index.load_or_build()
+
+    manifest = _manifest(index_dir)
+    assert manifest['vectors'] != first and manifest['chunks'] == 2
+    assert len(index) == 2 and old_vectors.shape == (1, 64)
+    assert [p.name for p in index_dir.glob('vectors*.npy')] == [manifest['vectors']]
+    assert index.search('blocks', top_k=1)[0][2]['source'] == 'b.md'
+
+
+def test_search_during_rebuild_uses_a_consistent_snapshot(tmp_path):
+    docs, index_dir = tmp_path / 'docs', tmp_path / 'index'
+    docs.mkdir()
+    _write(docs / 'a.md', '\n\n'.join(f'blocks game step {i}' for i in range(50)), 1_000)
+    index = LocalIndex(str(docs), str(index_dir), dim=64, chunk_size=20, chunk_overlap=0)
+    index.load_or_build()
+
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def searcher():
+        while not stop.is_set():
+            try:
+                texts = [text for text, _, _ in index.search('blocks step', top_k=5)]
+                # 结果整体来自同一个版本：要么只有小文档的一个切块，要么全是大文档的切块
+                assert texts == ['tiny blocks step'] or (
+                    len(texts) == 5 and all(t.startswith('blocks game step') for t in texts)
+                ), texts
+            except BaseException as e:  # noqa: BLE001
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=searcher) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        # 切块数在 50 与 1 之间来回变化：新旧快照混用会越界或错配
+        for i in range(20):
+            if i % 2:
+                _write(docs / 'a.md', '\n\n'.join(f'blocks game step {j}' for j in range(50)), 1_000 + i)
+            else:
+                _write(docs / 'a.md', 'tiny blocks step', 1_000 + i)
+            index.load_or_build()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert errors == []
+
+
+def test_unchanged_documents_load_existing_index(tmp_path):
+    docs, index_dir = tmp_path / 'docs', tmp_path / 'index'
+    docs.mkdir()
+    _write(docs / 'a.md', '共同注意力训练', 1_000)
+    LocalIndex(str(docs), str(index_dir), dim=64).load_or_build()
+    built_at = _manifest(index_dir)['built_at']
+
+    reloaded = LocalIndex(str(docs), str(index_dir), dim=64)
+    reloaded.load_or_build()
+    assert reloaded.built_at == built_at
+    assert reloaded.search('注意力', top_k=1)
+
+
+def test_custom_embedder_is_used_and_changes_fingerprint(tmp_path):
+    docs, index_dir = tmp_path / 'docs', tmp_path / 'index'
+    docs.mkdir()
+    _write(docs / 'a.md', 'alpha\n\nbeta', 1_000)
+    calls: list[list[str]] = []
+
+    def embedder(texts, dim):
+        calls.append(list(texts))
+        return hash_embed(texts, dim) * 3  # 未归一化，由索引统一归一化
+
+    LocalIndex(str(docs), str(index_dir), dim=32).load_or_build()
+    index = LocalIndex(str(docs), str(index_dir), dim=32, embedder=embedder, embedder_name='test:embedder')
+    index.load_or_build()
+
+    assert calls == [['alpha\nbeta']]
+    assert _manifest(index_dir)['embedder'] == 'test:embedder'
+    assert np.allclose(np.linalg.norm(index._snapshot.vectors, axis=1), 1.0)
+    text, score, _ = index.search('alpha', top_k=1)[0]
+    assert text == 'alpha\nbeta' and score > 0
+
+
+def test_embedder_with_wrong_dim_is_rejected(tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    _write(docs / 'a.md', 'alpha', 1_000)
+    index = LocalIndex(
+        str(docs), str(tmp_path / 'index'), dim=32,
+        embedder=lambda texts, dim: np.ones((len(texts), dim + 1)), embedder_name='bad',
+    )
+    with pytest.raises(ValueError):
+        index.load_or_build()
+
+
+def test_load_embedder_falls_back_to_hash():
+    assert load_embedder('') == (hash_embed, 'hash')
+    assert load_embedder('no_such_module:embed') == (hash_embed, 'hash')
+    assert load_embedder('rag_local_index:INDEX_FORMAT_VERSION') == (hash_embed, 'hash')
+    assert load_embedder('rag_local_index:hash_embed') == (hash_embed, 'rag_local_index:hash_embed')
@@ -0,0 +1,95 @@
+"""
+rag_service 测试：同步 SDK 超时后并发名额直到线程内调用结束才归还、批量检索按切片 id 去重
+
+Run: python -m pytest -q backend/test_rag_service.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import rag_service
+
+
+class SlowClient:
+    """只有同步 retrieve 的客户端，记录同时在途的调用数。"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def retrieve(self, workspace_id, request):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return request
+
+
+def test_timed_out_executor_calls_keep_their_slot(monkeypatch):
+    client = SlowClient(delay=0.3)
+    monkeypatch.setattr(rag_service, 'bailian_client', client)
+    monkeypatch.setattr(rag_service, 'RETRIEVE_TIMEOUT', 0.05)
+
+    async def run():
+        semaphore = asyncio.Semaphore(2)
+        monkeypatch.setattr(rag_service, '_retrieve_semaphore', semaphore)
+        results = await asyncio.gather(
+            *(rag_service.retrieve_async(i) for i in range(6)), return_exceptions=True
+        )
+        assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+        # 调用方都已超时返回，但线程里的调用还在：名额尚未全部归还
+        assert semaphore.locked()
+        deadline = time.monotonic() + 5
+        while (client.active or semaphore.locked()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        assert not semaphore.locked()
+
+    asyncio.run(run())
+    # 超时不归还名额：同时在途的同步调用不超过信号量上限
+    assert client.peak == 2
+
+
+def test_async_client_releases_slot_after_timeout(monkeypatch):
+    class AsyncClient:
+        async def retrieve_async(self, workspace_id, request):
+            await asyncio.sleep(1)
+
+    monkeypatch.setattr(rag_service, 'bailian_client', AsyncClient())
+    monkeypatch.setattr(rag_service, 'RETRIEVE_TIMEOUT', 0.01)
+
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        monkeypatch.setattr(rag_service, '_retrieve_semaphore', semaphore)
+        with pytest.raises(asyncio.TimeoutError):
+            await rag_service.retrieve_async('q')
+        assert not semaphore.locked()
+
+    asyncio.run(run())
+
+
+def _node(text, score, **metadata):
+    return rag_service.RAGNode(text=text, score=score, metadata=metadata)
+
+
+def test_dedupe_keys_on_chunk_id_before_text():
+    node_lists = [
+        [_node('同一句话', 0.9, _id='c1'), _node('other', 0.5)],
+        # 文本相同但切片 id 不同：是两个切片，都保留
+        [_node('同一句话', 0.8, _id='c2'), _node('同一句话 ', 0.7, _id='c1')],
+        # 无 id 的节点才按规范化文本去重；本地索引按 (source, chunk_index)
+        [_node(' other', 0.6), _node('a', 0.4, source='a.md', chunk_index=0)],
+        [_node('a (rebuilt)', 0.3, source='a.md', chunk_index=0)],
+    ]
+    deduped, removed = rag_service._dedupe_nodes(node_lists)
+    assert [[n.text for n in nodes] for nodes in deduped] == [
+        ['同一句话'], ['同一句话'], [' other', 'a'], [],
+    ]
+    assert [n.metadata.get('_id') for n in deduped[1]] == ['c2']
+    assert removed == 3
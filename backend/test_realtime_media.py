@@ -0,0 +1,213 @@
+"""
+realtime_media 测试：VAD 开口 / 结束、持续噪声、最长时长，二进制帧，视频帧管线与自适应发送间隔
+
+Run: python -m pytest -q backend/test_realtime_media.py
+"""
+
+import base64
+import io
+
+import numpy as np
+import pytest
+
+from realtime_media import (
+    FRAME_AUDIO_IN,
+    ByteRateMeter,
+    FRAME_VIDEO_IN,
+    PIL_AVAILABLE,
+    SequenceTracker,
+    VideoFramePipeline,
+    VoiceActivityDetector,
+    pack_frame,
+    unpack_frame,
+)
+
+SAMPLE_RATE = 16000
+_rng = np.random.default_rng(0)
+
+
+def noise(seconds: float, amplitude: float) -> bytes:
+    samples = _rng.normal(0, amplitude, int(SAMPLE_RATE * seconds))
+    return np.clip(samples, -32768, 32767).astype('<i2').tobytes()
+
+
+def tone(seconds: float, amplitude: float = 8000, freq: float = 220) -> bytes:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype('<i2').tobytes()
+
+
+def run_vad(vad: VoiceActivityDetector, pcm: bytes, chunk_ms: int = 100) -> list[tuple[float, str]]:
+    """按 chunk_ms 分块喂入，返回 (事件所在块的起始秒数, 事件名)，不含 audio。"""
+    chunk = SAMPLE_RATE * chunk_ms // 1000 * 2
+    events = []
+    for offset in range(0, len(pcm), chunk):
+        for name, _ in vad.process(pcm[offset:offset + chunk]):
+            if name != 'audio':
+                events.append((offset / 2 / SAMPLE_RATE, name))
+    return events
+
+
+def test_vad_start_and_end_around_speech():
+    vad = VoiceActivityDetector(hangover_ms=600)
+    events = run_vad(vad, noise(1, 30) + tone(1) + noise(1.5, 30))
+
+    assert [name for _, name in events] == ['start', 'end']
+    (start_at, _), (end_at, _) = events
+    assert 1.0 <= start_at < 1.2
+    assert 2.5 <= end_at < 2.8
+    assert vad.utterances == 1 and not vad.speaking
+
+
+def test_vad_forwards_preroll_and_drops_silence():
+    vad = VoiceActivityDetector(preroll_ms=300)
+    forwarded = sum(
+        len(chunk or b'')
+        for name, chunk in vad.process(noise(2, 30) + tone(1) + noise(2, 30))
+        if name == 'audio'
+    )
+    # 只上行一段话（含开口前补发与结束前的 hangover），静音不上行
+    assert 1.0 * SAMPLE_RATE * 2 < forwarded < 2.2 * SAMPLE_RATE * 2
+
+
+def test_vad_first_frame_speech_does_not_poison_floor():
+    vad = VoiceActivityDetector()
+    events = run_vad(vad, tone(0.5) + noise(1, 30) + tone(1) + noise(1.5, 30))
+    # 一开始就是语音时也能在下一段话正常开口
+    starts = [at for at, name in events if name == 'start']
+    assert any(1.5 <= at < 1.7 for at in starts)
+
+
+def test_vad_steady_noise_eventually_ends():
+    vad = VoiceActivityDetector(noise_window_ms=2000, max_utterance_ms=0)
+    # 环境突然变吵并持续：先被当作语音，噪声底跟上后结束且不再反复开口
+    events = run_vad(vad, noise(1, 30) + noise(10, 3000))
+
+    assert [name for _, name in events] == ['start', 'end']
+    assert events[1][0] < 1 + 2 + 1
+    assert vad.forced_ends == 0
+
+
+def test_vad_max_utterance_forces_end():
+    vad = VoiceActivityDetector(max_utterance_ms=1000, noise_window_ms=10000)
+    events = run_vad(vad, noise(1, 30) + tone(2.5))
+
+    names = [name for _, name in events]
+    assert names[:2] == ['start', 'end']
+    start_at, end_at = events[0][0], events[1][0]
+    # 时长包含开口前补发的 preroll（默认 300ms）
+    assert 0.6 <= end_at - start_at <= 1.1
+    assert vad.forced_ends >= 1
+
+
+def test_vad_keeps_partial_frames_between_calls():
+    vad = VoiceActivityDetector()
+    pcm = noise(0.5, 30)
+    for offset in range(0, len(pcm), 333):
+        vad.process(pcm[offset:offset + 333])
+    assert vad.frames_in == len(pcm) // vad.frame_bytes
+
+
+def test_frame_round_trip_and_errors():
+    message = pack_frame(FRAME_VIDEO_IN, 0x1_0000_0005, b'jpeg')
+    assert unpack_frame(message) == (FRAME_VIDEO_IN, 5, b'jpeg')
+
+    with pytest.raises(ValueError):
+        unpack_frame(b'\x01\x01')
+    with pytest.raises(ValueError):
+        unpack_frame(bytes([FRAME_AUDIO_IN, 99, 0, 0, 0, 1]))
+
+
+def test_sequence_tracker_counts_gaps_and_rejects_reordered():
+    tracker = SequenceTracker()
+    assert tracker.observe(FRAME_AUDIO_IN, 1)
+    assert tracker.observe(FRAME_AUDIO_IN, 4)
+    assert not tracker.observe(FRAME_AUDIO_IN, 3)
+    assert not tracker.observe(FRAME_AUDIO_IN, 4)
+    # 各 kind 独立计数，seq 回绕视为递增
+    assert tracker.observe(FRAME_VIDEO_IN, 0xFFFFFFFF)
+    assert tracker.observe(FRAME_VIDEO_IN, 0)
+    assert tracker.gaps == 2 and tracker.reordered == 2
+
+
+def test_video_take_due_respects_fixed_interval():
+    video = VideoFramePipeline(interval=0.5)
+    video._pending = 'frame-1'
+    assert video.take_due(now=10.0) == 'frame-1'
+    video._pending = 'frame-2'
+    assert video.take_due(now=10.2) is None
+    assert video.take_due(now=10.5) == 'frame-2'
+    assert video.take_due(now=11.5) is None
+
+
+def test_byte_rate_meter_expires_old_samples():
+    meter = ByteRateMeter(window=2.0)
+    meter.record(1000, now=0.0)
+    meter.record(3000, now=1.0)
+    assert meter.rate(now=1.5) == 2000
+    assert meter.rate(now=2.5) == 1500
+    assert meter.rate(now=10.0) == 0 and meter.total == 4000
+
+
+def test_video_interval_adapts_to_measured_audio_uplink():
+    video = VideoFramePipeline(interval=0.5, max_interval=3.0, uplink_budget=100_000, rate_window=5.0)
+    video.record_sent(40_000)
+
+    def feed_audio(bytes_per_second: int, start: float, seconds: float) -> float:
+        # 每 100ms 上行一块音频
+        t = start
+        while t < start + seconds:
+            video.record_audio(bytes_per_second // 10, now=t)
+            t += 0.1
+        return t
+
+    # 没有音频：视频独占预算，40KB / 100KB/s 低于最小间隔
+    video._pending = 'frame'
+    assert video.take_due(now=10.0) == 'frame' and video.interval == 0.5
+
+    # 音频占 60KB/s：视频剩 40KB/s，一帧 40KB 需 1 秒
+    now = feed_audio(60_000, 11.0, 5.0)
+    video._pending = 'frame'
+    assert video.take_due(now=now) == 'frame'
+    assert video.interval == pytest.approx(1.0, rel=0.05)
+    video._pending = 'frame'
+    assert video.take_due(now=now + 0.6) is None
+
+    # 音频占满预算：退到最大间隔
+    now = feed_audio(120_000, now, 5.0)
+    video.take_due(now=now)
+    assert video.interval == 3.0
+
+    # 停止说话，窗口过后恢复最小间隔
+    video.take_due(now=now + 6.0)
+    assert video.interval == 0.5
+    assert video.stats()['interval'] == 0.5
+
+
+def test_video_interval_is_fixed_without_budget():
+    video = VideoFramePipeline(interval=0.5, uplink_budget=0)
+    video.record_sent(400_000)
+    for i in range(50):
+        video.record_audio(10_000, now=i * 0.1)
+    video._pending = 'frame'
+    assert video.take_due(now=10.0) == 'frame' and video.interval == 0.5
+
+
+@pytest.mark.skipif(not PIL_AVAILABLE, reason='Pillow not installed')
+def test_video_drops_near_duplicate_frames():
+    from PIL import Image
+
+    def jpeg(color: tuple[int, int, int], split: int) -> bytes:
+        image = Image.new('RGB', (1280, 720), color)
+        image.paste((255, 255, 255), (0, 0, split, 720))
+        out = io.BytesIO()
+        image.save(out, format='JPEG')
+        return out.getvalue()
+
+    video = VideoFramePipeline(max_side=320, keepalive=60)
+    assert video.submit(jpeg((10, 10, 10), 400), now=0.0)
+    assert not video.submit(jpeg((12, 12, 12), 400), now=0.1)
+    assert video.submit(jpeg((10, 10, 10), 900), now=0.2)
+    assert video.frames_dropped == 1
+
+    sent = Image.open(io.BytesIO(base64.b64decode(video.take_due(now=1.0))))
+    assert max(sent.size) <= 320
@@ -0,0 +1,169 @@
+"""
+realtime_session 测试：下行队列的音频合并、drop_oldest / block 策略、发送失败关闭、drain，会话准入
+
+Run: python -m pytest -q backend/test_realtime_session.py
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from realtime_media import FRAME_AUDIO_OUT, unpack_frame
+from realtime_session import OutboundItem, OutboundQueue, SessionManager, SessionRejected, SessionStats
+
+
+def _audio(pcm: bytes) -> OutboundItem:
+    return OutboundItem({'type': 'response.audio.delta'}, pcm)
+
+
+class Recorder:
+    def __init__(self, fail_after: int | None = None):
+        self.messages: list = []
+        self.fail_after = fail_after
+
+    async def __call__(self, message) -> None:
+        if self.fail_after is not None and len(self.messages) >= self.fail_after:
+            raise ConnectionError('socket gone')
+        self.messages.append(message)
+
+
+async def _drain(queue: OutboundQueue, timeout: float = 0.2) -> None:
+    task = asyncio.create_task(queue.run())
+    await asyncio.sleep(timeout)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_consecutive_audio_deltas_are_merged():
+    session = SessionStats(id=1, remote='test')
+    send = Recorder()
+
+    async def run():
+        queue = OutboundQueue(send, session, asyncio.get_running_loop(), merge_window=0.01)
+        queue.binary = True
+        queue.put({'type': 'response.created'})
+        for chunk in (b'\x01\x00' * 10, b'\x02\x00' * 10, b'\x03\x00' * 10):
+            queue._append(_audio(chunk))
+        queue.put({'type': 'response.done'})
+        await _drain(queue)
+
+    asyncio.run(run())
+    assert [json.loads(m)['type'] for m in (send.messages[0], send.messages[2])] == [
+        'response.created', 'response.done',
+    ]
+    kind, seq, pcm = unpack_frame(send.messages[1])
+    assert (kind, seq) == (FRAME_AUDIO_OUT, 0)
+    assert pcm == b'\x01\x00' * 10 + b'\x02\x00' * 10 + b'\x03\x00' * 10
+    assert session.outbound_merged == 2 and session.audio_bytes_out == 60
+
+
+def test_drop_oldest_discards_audio_but_keeps_control_events():
+    session = SessionStats(id=1, remote='test')
+    send = Recorder()
+
+    async def run():
+        queue = OutboundQueue(send, session, asyncio.get_running_loop(), max_items=3, merge_window=0)
+        queue.put({'type': 'response.created'})
+        queue._append(_audio(b'a' * 4))
+        queue._append(_audio(b'b' * 4))
+        queue._append(_audio(b'c' * 4))
+        await _drain(queue)
+
+    asyncio.run(run())
+    assert session.outbound_dropped == 1
+    assert json.loads(send.messages[0])['type'] == 'response.created'
+    # 非二进制模式下音频以 JSON 下发，合并后只剩 b 与 c
+    assert session.audio_bytes_out == 8
+
+
+def test_block_policy_times_out_when_sender_is_stalled():
+    session = SessionStats(id=1, remote='test')
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = OutboundQueue(Recorder(), session, loop, max_items=1, policy='block', block_timeout=0.1)
+        started = time.monotonic()
+        # 发送 task 未运行：第一条占满容量，第二条在回调线程中等待 block_timeout 后丢弃
+        await asyncio.to_thread(queue.put_threadsafe, _audio(b'a'))
+        await asyncio.to_thread(queue.put_threadsafe, _audio(b'b'))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    assert session.outbound_dropped == 1
+    assert elapsed >= 0.1
+
+
+def test_send_failure_closes_queue_and_releases_blocked_producers():
+    session = SessionStats(id=1, remote='test')
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = OutboundQueue(
+            Recorder(fail_after=0), session, loop, max_items=1, policy='block', block_timeout=5,
+        )
+        # 队首是控制事件：发送它失败时音频容量尚未释放
+        queue.put({'type': 'response.created'})
+        await asyncio.to_thread(queue.put_threadsafe, _audio(b'a'))
+        # 队列已满：回调线程阻塞，直到发送失败关闭队列
+        blocked = threading.Thread(target=queue.put_threadsafe, args=(_audio(b'b'),))
+        blocked.start()
+        await asyncio.sleep(0.05)
+
+        await asyncio.wait_for(queue.run(), timeout=1)
+        assert queue.closed and isinstance(queue.error, ConnectionError)
+        await asyncio.to_thread(blocked.join, 1)
+        assert not blocked.is_alive()
+        assert session.outbound_dropped == 1
+
+        started = time.monotonic()
+        for _ in range(10):
+            queue.put_threadsafe(_audio(b'c'))
+        queue.put({'type': 'pong'})
+        assert time.monotonic() - started < 0.05
+
+    asyncio.run(run())
+
+
+def test_drain_waits_for_backlog_before_sender_is_cancelled():
+    session = SessionStats(id=1, remote='test')
+    send = Recorder()
+
+    async def run():
+        queue = OutboundQueue(send, session, asyncio.get_running_loop())
+        assert await queue.drain(timeout=0.01)  # 空队列立即返回
+        sender = asyncio.create_task(queue.run())
+        queue._append(_audio(b'a' * 4))
+        queue.put({'type': 'error', 'message': 'boom'})
+        assert await queue.drain(timeout=1)
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+
+        # 发送 task 已停止时 drain 超时返回 False
+        stalled = OutboundQueue(Recorder(), session, asyncio.get_running_loop())
+        stalled.put({'type': 'error'})
+        assert not await stalled.drain(timeout=0.05)
+
+    asyncio.run(run())
+    assert json.loads(send.messages[-1]) == {'type': 'error', 'message': 'boom'}
+
+
+def test_session_manager_rejects_after_queue_timeout():
+    async def run():
+        manager = SessionManager(max_sessions=1, queue_timeout=0.05)
+        first = await manager.admit('a')
+        assert manager.is_full()
+        with pytest.raises(SessionRejected):
+            await manager.admit('b')
+        manager.release(first)
+        second = await manager.admit('c')
+        manager.release(second)
+        return manager.stats()
+
+    stats = asyncio.run(run())
+    assert stats['admitted_total'] == 2
+    assert stats['rejected_total'] == 1
+    assert stats['completed_total'] == 2
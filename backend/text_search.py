@@ -0,0 +1,38 @@
+"""
+关键词检索的公共部分（供 memory_service.py 与 rag_local_index.py 使用）
+
+两处的 pending 检索与本地索引使用同一套分词与 BM25 参数，
+同样的 query 在两边命中同样的词项。
+"""
+
+import math
+import re
+
+_WORD_RE    = re.compile(r'[a-z0-9]+')
+_CJK_RUN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+BM25_K1 = 1.2
+BM25_B  = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    """轻量分词：英文/数字按词，中文按字符 bigram（单字串保留单字）。"""
+    text = text.lower()
+    terms = _WORD_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def bm25_idf(n_docs: int, df: int) -> float:
+    """BM25 idf（加 1 平滑，恒为正）。"""
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_term_score(idf: float, tf: int, length: int, avg_len: float) -> float:
+    """单个词项对一篇文档的 BM25 得分。"""
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+    return idf * tf * (BM25_K1 + 1) / (tf + norm)
@@ -17,12 +17,16 @@ AI 推断引擎服务（AIInferenceEngine）
     - 所有公开方法均为协程或同步方法，与 EventAggregator 对接友好。
     - 所有状态保存在内存（_sessions / _inference_store / _probe_store）；
       持久化由调用方 / EventAggregator 统一处理。
+    - 每个会话只保留最近 INFERENCE_EVENT_RING_SIZE 条精简事件（推断只看最近窗口），
+      空闲超过 SESSION_IDLE_TTL_SECONDS 的会话状态自动回收。
 """
 from __future__ import annotations
 
 import asyncio
 import json
 import logging
+import os
+import time
 from collections import Counter, defaultdict
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
@@ -61,6 +65,8 @@ except ImportError:  # pragma: no cover
         build_probe_user_message,
     )
 
+from .event_ring import CompactEvent, EventRing
+
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +92,15 @@ PHASE_RATIO_BOUNDARIES: list[tuple[float, GamePhase]] = [
     (1.01, GamePhase.CLOSURE),  # 1.01 兜底，确保末端命中 closure
 ]
 
+#: 每个会话在内存中保留的最近事件数（推断只用最近 RECENT_EVENT_WINDOW_SECONDS 的事件）
+INFERENCE_EVENT_RING_SIZE = int(os.getenv("INFERENCE_EVENT_RING_SIZE", "500"))
+
+#: 会话空闲（无新事件）超过该秒数即回收状态，与 EventAggregator 一致
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", str(4 * 3600)))
+
+#: 空闲会话回收的最小检查间隔（秒）
+SESSION_REAP_INTERVAL_SECONDS = 60.0
+
 #: 高潮提前判定：interaction 阶段事件密度 ≥ 该值（事件/分钟）则提前进入 climax
 CLIMAX_DENSITY_THRESHOLD: float = 4.0
 
@@ -146,8 +161,13 @@ class InferenceSessionState:
     # 历史基线（如：{"eye_contact_per_min": 1.2, "engagement_avg": 0.7}）
     child_history: dict[str, Any] = field(default_factory=dict)
 
-    # 该会话累积的事件（按时间顺序）
-    events: list[BehaviorRecord] = field(default_factory=list)
+    # 该会话最近的事件（按时间顺序，有界；total 为累计事件数）
+    events: EventRing = field(
+        default_factory=lambda: EventRing(INFERENCE_EVENT_RING_SIZE)
+    )
+
+    # 最近一次活动的 monotonic 时间，用于空闲回收
+    last_active: float = field(default_factory=time.monotonic)
 
     # 上一次生成推断的时间戳（用于频率限制）
     last_inference_at: Optional[datetime] = None
@@ -196,6 +216,7 @@ class AIInferenceEngine:
         self._inference_store: dict[str, list[AIInferenceRecord]] = defaultdict(list)
         self._probe_store: dict[str, list[AIProbeQuestion]] = defaultdict(list)
         self._async_lock = asyncio.Lock()
+        self._reaped_at = time.monotonic()
 
         logger.info(
             "[AIInferenceEngine] 初始化完成 llm_enabled=%s",
@@ -214,6 +235,7 @@ class AIInferenceEngine:
         child_history: Optional[dict] = None,
     ) -> None:
         """初始化一个推断会话。重复调用会重置状态。"""
+        self._reap_idle_sessions()
         state = InferenceSessionState(
             session_id=session_id,
             game_type=game_type,
@@ -247,7 +269,7 @@ class AIInferenceEngine:
             "game_type": state.game_type,
             "started_at": state.started_at.isoformat(),
             "ended_at": datetime.now(timezone.utc).isoformat(),
-            "total_events": len(state.events),
+            "total_events": state.events.total,
             "total_inferences": len(inferences),
             "total_probes": len(probes),
             "confirmed_inferences": sum(1 for i in inferences if i.is_confirmed is True),
@@ -264,6 +286,21 @@ class AIInferenceEngine:
         )
         return stats
 
+    def _reap_idle_sessions(self) -> None:
+        """回收空闲超过 TTL 的会话状态（最多每 SESSION_REAP_INTERVAL_SECONDS 检查一次）。"""
+        now = time.monotonic()
+        if now - self._reaped_at < SESSION_REAP_INTERVAL_SECONDS:
+            return
+        self._reaped_at = now
+        for sid, state in list(self._sessions.items()):
+            if now - state.last_active >= SESSION_IDLE_TTL_SECONDS:
+                self._sessions.pop(sid, None)
+                logger.warning(
+                    "[AIInferenceEngine] 回收空闲会话 session=%s idle=%.0fs",
+                    sid,
+                    now - state.last_active,
+                )
+
     # ------------------------------------------------------------------
     # 事件监听
     # ------------------------------------------------------------------
@@ -276,6 +313,7 @@ class AIInferenceEngine:
         - 重新计算当前游戏阶段
         - 如果满足条件则触发推断 / 探测问题
         """
+        self._reap_idle_sessions()
         state = self._sessions.get(event.session_id)
         if state is None:
             # 推断引擎未追踪该会话，忽略即可
@@ -286,7 +324,8 @@ class AIInferenceEngine:
             return
 
         async with self._async_lock:
-            state.events.append(event)
+            state.events.append(CompactEvent.from_record(event))
+            state.last_active = time.monotonic()
             new_phase = self._infer_phase(state)
             phase_changed = new_phase != state.current_phase
             state.last_phase = state.current_phase
@@ -364,9 +403,7 @@ class AIInferenceEngine:
         """统计最近 window_seconds 内的事件数量。"""
         if not state.events:
             return 0
-        now = datetime.now(timezone.utc)
-        cutoff = now.timestamp() - window_seconds
-        return sum(1 for e in state.events if e.timestamp.timestamp() >= cutoff)
+        return len(state.events.since(time.time() - window_seconds))
 
     # ------------------------------------------------------------------
     # 推断生成
@@ -376,7 +413,7 @@ class AIInferenceEngine:
         """是否满足"可以生成下一条推断"的条件。"""
         if state.last_inference_at is None:
             # 至少累计 3 条事件再开始推断
-            return len(state.events) >= 3
+            return state.events.total >= 3
         delta = (datetime.now(timezone.utc) - state.last_inference_at).total_seconds()
         return delta >= MIN_INFERENCE_INTERVAL_SECONDS
 
@@ -484,12 +521,7 @@ class AIInferenceEngine:
         self, state: InferenceSessionState
     ) -> Optional[AIInferenceRecord]:
         """基于规则的简单推断（无 LLM 时的兜底实现）。"""
-        recent = [
-            e
-            for e in state.events
-            if (datetime.now(timezone.utc) - e.timestamp).total_seconds()
-            <= RECENT_EVENT_WINDOW_SECONDS
-        ]
+        recent = state.events.since(time.time() - RECENT_EVENT_WINDOW_SECONDS)
         if not recent:
             return None
 
@@ -609,7 +641,8 @@ class AIInferenceEngine:
             return "phase_transition"
 
         # 数据稀疏触发：超过窗口无新事件
-        last_event_ts = state.events[-1].timestamp if state.events else state.started_at
+        last_event = state.events.last()
+        last_event_ts = last_event.timestamp if last_event else state.started_at
         idle = (datetime.now(timezone.utc) - last_event_ts).total_seconds()
         if idle >= SPARSE_DATA_WINDOW_SECONDS:
             # 同一稀疏窗口内，避免重复发问
@@ -817,12 +850,7 @@ class AIInferenceEngine:
         self, state: InferenceSessionState, limit: int = 20
     ) -> list[dict]:
         """构造给 LLM 的最近事件载荷。"""
-        cutoff_ts = (
-            datetime.now(timezone.utc).timestamp() - RECENT_EVENT_WINDOW_SECONDS
-        )
-        recent = [
-            e for e in state.events if e.timestamp.timestamp() >= cutoff_ts
-        ][-limit:]
+        recent = state.events.since(time.time() - RECENT_EVENT_WINDOW_SECONDS)[-limit:]
         return [
             {
                 "event_type": e.event_type,
@@ -9,24 +9,45 @@
     1. 事件接收与上下文增强：注入时间戳、session_id、game_type、UUID。
     2. 去重逻辑：同会话同类型事件在 5 秒内只保留一条。
     3. 置信度赋值：根据 EventSource 自动设置 confidence。
-    4. 双写存储：同步写 SQLite + 异步入队 memory_service（HTTP）。
-    5. 事件广播：通知所有注册的监听器（同步/异步均可）。
-    6. 会话管理：维护会话级别的事件缓存与统计。
+    4. 双写存储：组提交写 SQLite，同一事务写入 outbox，后台批量投递 memory_service（HTTP）。
+    5. 事件广播：经每个监听器独立的有界队列异步分发（同步/异步监听器均可）。
+    6. 会话管理：维护会话级别的事件缓存与统计；长时间无事件的会话按 TTL 回收。
 
 设计要点：
-    - 线程/协程安全：使用 asyncio.Lock 保护共享缓存。
-    - SQLite 同步写入通过 asyncio.to_thread 包装，避免阻塞事件循环。
-    - Memory 服务以 fire-and-forget 方式写入，单独的协程任务处理失败重试，
-      绝不阻塞主流程；任何下游异常都被捕获并记录日志。
+    - 去重与追加无锁且按会话隔离：状态只在各自的 _SessionContext 中，
+      "去重判断 + 时间戳更新 + 追加事件" 放在同步方法 _claim_event 中完成，
+      中间没有 await，在事件循环上天然原子；不同会话之间没有任何共享锁，
+      某个会话的点击突发不会增加其他会话的延迟。
+    - SQLite 由专用写线程独占一个长连接（WAL 模式）：各协程把记录投入队列，
+      写线程每攒够 N 条或等待满 M 毫秒组提交一次，再逐条唤醒等待的协程。
+      多会话同时点击时不再为每条事件重复 connect + fsync。
+    - Memory 服务写入走 outbox：memory_outbox 与 behavior_records 同事务提交，
+      进程崩溃也不会丢失待投递的记忆；后台 drainer 协程批量 POST
+      /api/memory/write/batch，按 memory_service 返回的逐条结果更新状态：
+      accepted → delivered，shed → shed（死信，不再重试），over_quota / 可重试失败
+      → 仅该 group 退避（next_attempt_at），其他 group 照常投递。每批按 group 限量、
+      高优先级来源优先，单个孩子的积压或低优先级事件不会阻塞其他行。
+    - 监听器分发与请求路径解耦：record_event 只把事件放入各监听器的队列即返回。
+      每个监听器有 concurrency 条 lane（各自一个有界队列 + worker），同一会话的
+      事件固定落在同一 lane，保证会话内顺序；队列满时按 overflow 策略处理。
+      AIInferenceEngine 的 LLM 调用不再拖慢家长点击的 HTTP 响应。
+    - 内存中每个会话只保留最近 SESSION_EVENT_RING_SIZE 条精简事件（EventRing），
+      更早的事件按需从 behavior_records 回读；未调用 end_session 就被遗弃的
+      会话在空闲 SESSION_IDLE_TTL_SECONDS 后回收，进程内存不随运行时间增长。
+    - 会话统计增量维护（_RunningStats）：每条事件入队时更新类型 / 来源 / 情感计数，
+      以及最近 SESSION_STATS_WINDOW_SECONDS 的滑动窗口计数；前端轮询
+      get_session_stats 是 O(1)，不再遍历事件。
 """
 from __future__ import annotations
 
 import asyncio
 import logging
 import os
+import queue
 import sqlite3
 import threading
-from collections import defaultdict
+import time
+from collections import defaultdict, deque
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
@@ -52,6 +73,8 @@ except ImportError:  # 兼容相对包路径环境
         GamePhase,
     )
 
+from .event_ring import CompactEvent, EventRing
+
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +104,59 @@ DEFAULT_SQLITE_PATH = os.getenv(
     "SQLITE_DB_PATH", "./data/asd_intervention.db"
 )
 
+#: SQLite 组提交：每批最多写入的记录数
+SQLITE_BATCH_SIZE = int(os.getenv("SQLITE_BATCH_SIZE", "64"))
+
+#: SQLite 组提交：批内第一条记录最多等待多久（毫秒）即提交
+SQLITE_FLUSH_INTERVAL_MS = float(os.getenv("SQLITE_FLUSH_INTERVAL_MS", "10"))
+
+#: memory outbox：每次批量投递的最大条数
+MEMORY_OUTBOX_BATCH_SIZE = int(os.getenv("MEMORY_OUTBOX_BATCH_SIZE", "50"))
+
+#: memory outbox：每批中单个 group 最多占用的条数
+MEMORY_OUTBOX_GROUP_BATCH_SIZE = int(os.getenv("MEMORY_OUTBOX_GROUP_BATCH_SIZE", "20"))
+
+#: memory outbox：低优先级来源（与 memory_service 的 MEMORY_LOW_PRIORITY_SOURCES 一致），批内排在最后
+MEMORY_OUTBOX_LOW_PRIORITY_SOURCES = tuple(
+    src.strip()
+    for src in os.getenv("MEMORY_LOW_PRIORITY_SOURCES", "timed_snapshot,ai_inferred").split(",")
+    if src.strip()
+)
+
+#: memory outbox：空闲时轮询间隔（秒）；新事件入库后会立即唤醒 drainer
+MEMORY_OUTBOX_POLL_SECONDS = float(os.getenv("MEMORY_OUTBOX_POLL_SECONDS", "5"))
+
+#: memory outbox：失败重试退避上限（秒）
+MEMORY_OUTBOX_RETRY_MAX_SECONDS = float(
+    os.getenv("MEMORY_OUTBOX_RETRY_MAX_SECONDS", "60")
+)
+
+#: memory outbox：已投递行的保留时长（秒），过期后清理
+MEMORY_OUTBOX_RETENTION_SECONDS = float(
+    os.getenv("MEMORY_OUTBOX_RETENTION_SECONDS", str(7 * 24 * 3600))
+)
+
+#: 监听器：每条 lane 的队列容量
+LISTENER_QUEUE_SIZE = int(os.getenv("EVENT_LISTENER_QUEUE_SIZE", "256"))
+
+#: 监听器：默认 lane 数（跨会话并发度；同一会话始终串行）
+LISTENER_CONCURRENCY = int(os.getenv("EVENT_LISTENER_CONCURRENCY", "4"))
+
+#: 监听器：队列满时的策略 drop_oldest / drop_newest / block
+LISTENER_OVERFLOW = os.getenv("EVENT_LISTENER_OVERFLOW", "drop_oldest")
+
+#: 每个会话在内存中保留的最近事件数，更早的事件从 SQLite 回读
+SESSION_EVENT_RING_SIZE = int(os.getenv("SESSION_EVENT_RING_SIZE", "500"))
+
+#: 会话空闲（无新事件）超过该秒数即回收，防止未 end_session 的会话常驻内存
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", str(4 * 3600)))
+
+#: 空闲会话回收的最小检查间隔（秒）
+SESSION_REAP_INTERVAL_SECONDS = 60.0
+
+#: 会话统计的滑动窗口（秒）；0 表示只统计全程
+SESSION_STATS_WINDOW_SECONDS = float(os.getenv("SESSION_STATS_WINDOW_SECONDS", "300"))
+
 # 监听器签名：可同步或异步
 ListenerCallable = Callable[[BehaviorRecord], Union[None, Awaitable[None]]]
 
@@ -89,6 +165,83 @@ ListenerCallable = Callable[[BehaviorRecord], Union[None, Awaitable[None]]]
 # 会话上下文
 # ---------------------------------------------------------------------------
 
+class _EventCounters:
+    """一组事件的类型 / 来源 / 情感计数，支持增减。"""
+
+    __slots__ = ("total", "types", "sources", "valence")
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.types: dict[str, int] = defaultdict(int)
+        self.sources: dict[str, int] = defaultdict(int)
+        self.valence = {"positive": 0, "neutral": 0, "negative": 0}
+
+    @staticmethod
+    def _valence_key(valence: int) -> str:
+        return "positive" if valence > 0 else "negative" if valence < 0 else "neutral"
+
+    def add(self, event: CompactEvent) -> None:
+        self.total += 1
+        self.types[event.event_type] += 1
+        self.sources[event.source] += 1
+        self.valence[self._valence_key(event.valence)] += 1
+
+    def remove(self, event: CompactEvent) -> None:
+        self.total -= 1
+        for counts, key in ((self.types, event.event_type), (self.sources, event.source)):
+            counts[key] -= 1
+            if counts[key] <= 0:
+                del counts[key]
+        self.valence[self._valence_key(event.valence)] -= 1
+
+    def summary(self, minutes: float) -> dict:
+        minutes = max(minutes, 1 / 60)
+        return {
+            "total_events": self.total,
+            "event_type_distribution": dict(self.types),
+            "source_distribution": dict(self.sources),
+            "valence_distribution": dict(self.valence),
+            "events_per_minute": round(self.total / minutes, 2),
+            "positive_per_minute": round(self.valence["positive"] / minutes, 2),
+            "negative_per_minute": round(self.valence["negative"] / minutes, 2),
+        }
+
+
+class _RunningStats:
+    """
+    会话统计的增量维护。
+
+    totals 为全程计数；window_seconds > 0 时另维护最近 window_seconds 的滑动窗口：
+    事件进入时加计数、过期时（追加或读取时顺带检查）减计数，均摊 O(1)。
+    """
+
+    def __init__(self, window_seconds: float = SESSION_STATS_WINDOW_SECONDS) -> None:
+        self.totals = _EventCounters()
+        self.window_seconds = window_seconds
+        self.window = _EventCounters() if window_seconds > 0 else None
+        self._window_events: deque[CompactEvent] = deque()
+
+    def add(self, event: CompactEvent) -> None:
+        self.totals.add(event)
+        if self.window is not None:
+            self._window_events.append(event)
+            self.window.add(event)
+            self._expire(event.ts)
+
+    def _expire(self, now_ts: float) -> None:
+        cutoff = now_ts - self.window_seconds
+        while self._window_events and self._window_events[0].ts < cutoff:
+            self.window.remove(self._window_events.popleft())
+
+    def window_summary(self, now_ts: float, elapsed_seconds: float) -> Optional[dict]:
+        if self.window is None:
+            return None
+        self._expire(now_ts)
+        # 会话不足一个窗口时按实际时长计算速率
+        span = min(self.window_seconds, max(elapsed_seconds, 0.0))
+        return {"window_seconds": self.window_seconds, **self.window.summary(span / 60)}
+
+
 @dataclass
 class _SessionContext:
     """单个游戏会话的运行时上下文。"""
@@ -98,8 +251,397 @@ class _SessionContext:
     started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
     # event_type → 上一次发生的时间戳，用于去重
     last_event_ts: dict[str, datetime] = field(default_factory=dict)
-    # 该会话已记录的事件（顺序）
-    events: list[BehaviorRecord] = field(default_factory=list)
+    # 该会话最近的事件（有界，精简字段；更早的事件由 loader 从 SQLite 回读）
+    events: EventRing = field(
+        default_factory=lambda: EventRing(SESSION_EVENT_RING_SIZE)
+    )
+    # 最近一次活动（start / 事件）的 monotonic 时间，用于空闲回收
+    last_active: float = field(default_factory=time.monotonic)
+    # 增量维护的统计（全程 + 滑动窗口）
+    stats: _RunningStats = field(default_factory=_RunningStats)
+
+
+# ---------------------------------------------------------------------------
+# SQLite 写线程
+# ---------------------------------------------------------------------------
+
+_INSERT_BEHAVIOR_RECORD_SQL = """
+    INSERT OR REPLACE INTO behavior_records (
+        id, timestamp, session_id, game_type, event_type,
+        detail, valence, source, confidence,
+        game_phase, related_interest, is_confirmed
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_OUTBOX_SQL = """
+    INSERT INTO memory_outbox (
+        record_id, group_id, content, reference_time, source, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# 写线程退出信号
+_STOP = object()
+
+
+def _record_to_row(record: BehaviorRecord) -> tuple:
+    """BehaviorRecord → behavior_records 表的一行。"""
+    return (
+        record.id,
+        record.timestamp.isoformat(),
+        record.session_id,
+        record.game_type,
+        record.event_type,
+        record.detail,
+        record.valence,
+        record.source.value,
+        record.confidence,
+        record.game_phase.value if record.game_phase else None,
+        record.related_interest,
+        None if record.is_confirmed is None
+        else (1 if record.is_confirmed else 0),
+    )
+
+
+def _resolve_future(
+    future: asyncio.Future, result: object, exc: Optional[BaseException]
+) -> None:
+    """在事件循环线程内完成 future（调用方可能已取消等待）。"""
+    if future.done():
+        return
+    if exc is None:
+        future.set_result(result)
+    else:
+        future.set_exception(exc)
+
+
+class _SQLiteWriter:
+    """
+    SQLite 专用写线程。
+
+    独占一个长连接（sqlite3 连接不跨线程使用），从队列取出记录按批写入：
+    一批最多 batch_size 条，或自批内第一条入队起等待 flush_interval 秒后提交，
+    一批只做一次 executemany + commit；记录附带的 outbox 行在同一事务内写入。
+    call() 把任意函数 fn(conn) 排进同一队列，在单独的事务中执行。
+    返回的 future 在提交成功（或失败）后于调用方的事件循环内完成。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        batch_size: int = SQLITE_BATCH_SIZE,
+        flush_interval: float = SQLITE_FLUSH_INTERVAL_MS / 1000,
+    ) -> None:
+        self.db_path = db_path
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_interval, 0.0)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._thread = threading.Thread(
+            target=self._run, name="EventAggregator-sqlite", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self, record: BehaviorRecord, outbox_row: Optional[tuple] = None
+    ) -> asyncio.Future:
+        """投递一条记录（及可选的 outbox 行），返回在写入提交后完成的 future。"""
+        return self._put("record", (record, outbox_row))
+
+    def call(self, fn: Callable[[sqlite3.Connection], object]) -> asyncio.Future:
+        """在写线程的连接上执行 fn(conn)（单独事务），future 结果为其返回值。"""
+        return self._put("call", fn)
+
+    def _put(self, kind: str, payload: object) -> asyncio.Future:
+        # 须在事件循环内调用
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._thread.is_alive():
+            future.set_exception(RuntimeError("SQLite 写线程已停止"))
+            return future
+        self._queue.put((kind, payload, future, loop))
+        return future
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写完已排队的记录后停止写线程并关闭连接（阻塞调用）。"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在 checkpoint 时 fsync，崩溃最多丢失最近提交、不会损坏库
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self) -> None:
+        pending = None
+        while True:
+            item = pending if pending is not None else self._queue.get()
+            pending = None
+            if item is _STOP:
+                break
+            if item[0] == "call":
+                self._execute(item)
+                continue
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = (
+                        self._queue.get(timeout=remaining) if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is _STOP or item[0] == "call":
+                    # 先提交已攒的记录，再处理该条（保持入队顺序）
+                    pending = item
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _flush(self, batch: list) -> None:
+        payloads = [payload for _, payload, _, _ in batch]
+
+        def write(conn: sqlite3.Connection) -> None:
+            conn.executemany(
+                _INSERT_BEHAVIOR_RECORD_SQL,
+                [_record_to_row(record) for record, _ in payloads],
+            )
+            outbox_rows = [row for _, row in payloads if row is not None]
+            if outbox_rows:
+                conn.executemany(_INSERT_OUTBOX_SQL, outbox_rows)
+
+        result, exc = self._transaction(write)
+        if exc is not None:
+            logger.error(
+                "[EventAggregator] SQLite 批量写入失败 batch=%d: %s", len(batch), exc
+            )
+        for _, _, future, loop in batch:
+            self._complete(future, loop, result, exc)
+
+    def _execute(self, item: tuple) -> None:
+        _, fn, future, loop = item
+        result, exc = self._transaction(fn)
+        self._complete(future, loop, result, exc)
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], object]) -> tuple:
+        """在一个事务中执行 fn：成功 commit，异常 rollback。返回 (result, exc)。"""
+        try:
+            if self._conn is None:
+                self._conn = self._connect()
+            with self._conn:
+                return fn(self._conn), None
+        except Exception as error:
+            # 连接可能已损坏，下次重新连接
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:  # pragma: no cover
+                    pass
+                self._conn = None
+            return None, error
+
+    @staticmethod
+    def _complete(
+        future: asyncio.Future,
+        loop: asyncio.AbstractEventLoop,
+        result: object,
+        exc: Optional[BaseException],
+    ) -> None:
+        try:
+            loop.call_soon_threadsafe(_resolve_future, future, result, exc)
+        except RuntimeError:
+            pass  # 调用方事件循环已关闭
+
+
+# ---------------------------------------------------------------------------
+# 监听器分发
+# ---------------------------------------------------------------------------
+
+class _ListenerDispatcher:
+    """
+    单个监听器的异步分发器。
+
+    事件按 session_id 哈希到 concurrency 条 lane 之一，每条 lane 是一个有界
+    asyncio.Queue + 一个 worker 协程：同会话事件串行且有序，不同会话并发处理。
+    队列满时：
+      overflow='drop_oldest'  丢弃该 lane 最旧的一条再入队
+      overflow='drop_newest'  丢弃新事件
+      overflow='block'        dispatch 等待空位（会把背压传回 record_event）
+    worker 在首次 dispatch 时于当前事件循环内启动。
+    每个会话的未处理事件数单独计数，join_session 只等待该会话的事件。
+    """
+
+    OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+    def __init__(
+        self,
+        callback: ListenerCallable,
+        name: str,
+        concurrency: int = LISTENER_CONCURRENCY,
+        max_queue: int = LISTENER_QUEUE_SIZE,
+        overflow: str = LISTENER_OVERFLOW,
+    ) -> None:
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"未知的 overflow 策略: {overflow}")
+        self.callback = callback
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.max_queue = max(max_queue, 1)
+        self.overflow = overflow
+
+        self._lanes: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
+        # session_id → 已入队未处理完的事件数；有人等待时附带一个 Event
+        self._pending: dict[str, int] = {}
+        self._idle: dict[str, asyncio.Event] = {}
+
+        self.dispatched = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.depth_max = 0
+        # 最近 256 次的 入队→处理完成 耗时与 处理本身耗时（秒）
+        self._latency: deque[float] = deque(maxlen=256)
+        self._handle_time: deque[float] = deque(maxlen=256)
+
+    async def dispatch(self, record: BehaviorRecord) -> None:
+        if not self._workers:
+            self._start()
+        lane = self._lanes[hash(record.session_id) % self.concurrency]
+        item = (record, time.monotonic())
+        self.dispatched += 1
+        if lane.full():
+            if self.overflow == "drop_newest":
+                self._drop(record)
+                return
+            if self.overflow == "drop_oldest":
+                victim, _ = lane.get_nowait()
+                lane.task_done()
+                self._settle(victim.session_id)
+                self._drop(victim)
+        self._pending[record.session_id] = self._pending.get(record.session_id, 0) + 1
+        try:
+            await lane.put(item)  # block 策略下在此等待空位
+        except BaseException:
+            self._settle(record.session_id)
+            raise
+        self.depth_max = max(self.depth_max, lane.qsize())
+
+    def _settle(self, session_id: str) -> None:
+        """该会话的一条事件处理完（或被丢弃）；归零时唤醒 join_session。"""
+        remaining = self._pending.get(session_id, 0) - 1
+        if remaining > 0:
+            self._pending[session_id] = remaining
+            return
+        self._pending.pop(session_id, None)
+        idle = self._idle.pop(session_id, None)
+        if idle is not None:
+            idle.set()
+
+    def _drop(self, record: BehaviorRecord) -> None:
+        self.dropped += 1
+        logger.warning(
+            "[EventAggregator] 监听器 %s 队列已满，丢弃事件 id=%s session=%s",
+            self.name,
+            record.id,
+            record.session_id,
+        )
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._lanes = [asyncio.Queue(self.max_queue) for _ in range(self.concurrency)]
+        self._workers = [
+            loop.create_task(self._work(lane), name=f"listener-{self.name}-{i}")
+            for i, lane in enumerate(self._lanes)
+        ]
+
+    async def _work(self, lane: asyncio.Queue) -> None:
+        while True:
+            record, enqueued_at = await lane.get()
+            started = time.monotonic()
+            try:
+                result = self.callback(record)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                self.errors += 1
+                logger.warning(
+                    "[EventAggregator] 监听器 %s 抛出异常（已忽略）: %s", self.name, exc
+                )
+            finally:
+                finished = time.monotonic()
+                self.processed += 1
+                self._handle_time.append(finished - started)
+                self._latency.append(finished - enqueued_at)
+                lane.task_done()
+                self._settle(record.session_id)
+
+    async def join(self) -> None:
+        """等待已入队的事件全部处理完。"""
+        for lane in self._lanes:
+            await lane.join()
+
+    async def join_session(self, session_id: str) -> None:
+        """只等待该会话已入队的事件处理完，不受其他会话积压影响。"""
+        if not self._pending.get(session_id):
+            return
+        idle = self._idle.setdefault(session_id, asyncio.Event())
+        await idle.wait()
+
+    async def aclose(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._workers = []
+        self._lanes = []
+        self._pending.clear()
+        for idle in self._idle.values():
+            idle.set()
+        self._idle.clear()
+
+    @staticmethod
+    def _summary(samples: deque) -> dict:
+        values = sorted(samples)
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "avg_ms": round(sum(values) / len(values) * 1000, 1),
+            "p50_ms": round(values[len(values) // 2] * 1000, 1),
+            "p95_ms": round(values[min(int(len(values) * 0.95), len(values) - 1)] * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "concurrency": self.concurrency,
+            "overflow": self.overflow,
+            "dispatched": self.dispatched,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "queue_depth": sum(lane.qsize() for lane in self._lanes),
+            "pending_sessions": len(self._pending),
+            "queue_depth_max": self.depth_max,
+            "latency": self._summary(self._latency),
+            "handle_time": self._summary(self._handle_time),
+        }
 
 
 # ---------------------------------------------------------------------------
@@ -127,6 +669,8 @@ class EventAggregator:
         db_path: Optional[str] = None,
         memory_service_url: Optional[str] = None,
         dedup_window_seconds: float = DEDUP_WINDOW_SECONDS,
+        sqlite_batch_size: int = SQLITE_BATCH_SIZE,
+        sqlite_flush_interval_ms: float = SQLITE_FLUSH_INTERVAL_MS,
     ):
         """
         初始化事件聚合器。
@@ -136,6 +680,8 @@ class EventAggregator:
             memory_service_url: memory_service 基础 URL（不含路径）。
                                 为 None 时从环境变量 MEMORY_SERVICE_URL 读取。
             dedup_window_seconds: 去重时间窗口，默认 5 秒。
+            sqlite_batch_size: SQLite 组提交每批最多记录数。
+            sqlite_flush_interval_ms: SQLite 组提交最长等待时间（毫秒）。
         """
         self.db_path: str = db_path or DEFAULT_SQLITE_PATH
         self.memory_service_url: str = (
@@ -145,28 +691,39 @@ class EventAggregator:
 
         # 会话上下文：session_id → _SessionContext
         self._sessions: dict[str, _SessionContext] = {}
+        self._reaped_at = time.monotonic()
 
-        # 监听器列表
-        self._listeners: list[ListenerCallable] = []
-
-        # 异步并发保护
-        self._async_lock = asyncio.Lock()
-
-        # SQLite 写入采用单独的线程锁（sqlite3 连接非线程安全）
-        self._sqlite_lock = threading.Lock()
+        # 监听器分发器（每个监听器独立队列与 worker）
+        self._listeners: list[_ListenerDispatcher] = []
 
         # 懒加载的 httpx 客户端
         self._http_client: Optional["httpx.AsyncClient"] = None
 
+        # memory outbox 投递协程（首次需要时在事件循环内启动）
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._outbox_closing = False
+        self._outbox_wakeup: Optional[asyncio.Event] = None
+        self._outbox_pruned_at = 0.0
+
         # 确保数据库目录存在
         try:
             Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         except Exception as exc:  # pragma: no cover
             logger.warning("[EventAggregator] 创建数据库目录失败: %s", exc)
 
-        # 启动时确保 behavior_records 表存在
+        # 启动时确保 behavior_records / memory_outbox 表存在
         self._ensure_table()
 
+        # SQLite 写线程（独占长连接，组提交）
+        self._sqlite_writer = _SQLiteWriter(
+            self.db_path,
+            batch_size=sqlite_batch_size,
+            flush_interval=sqlite_flush_interval_ms / 1000,
+        )
+
+        if httpx is None:
+            logger.warning("[EventAggregator] httpx 未安装，memory outbox 暂不投递")
+
         logger.info(
             "[EventAggregator] 初始化完成 db_path=%s memory_service=%s",
             self.db_path,
@@ -185,12 +742,17 @@ class EventAggregator:
 
         重复 start_session 会重置该 session 的缓存。
         """
+        self._reap_idle_sessions()
         ctx = _SessionContext(
             session_id=session_id,
             child_id=child_id,
             game_type=game_type,
         )
+        since = ctx.started_at.isoformat()
+        ctx.events.loader = lambda n: self._load_compact_events(session_id, since, n)
         self._sessions[session_id] = ctx
+        # 上次进程遗留的待投递记忆也尽早开始投递
+        self._ensure_outbox_drainer()
         logger.info(
             "[EventAggregator] 会话开始 session_id=%s child_id=%s game_type=%s",
             session_id,
@@ -223,15 +785,49 @@ class EventAggregator:
         return stats
 
     def get_session_events(self, session_id: str) -> list[BehaviorRecord]:
-        """返回该会话内存中已聚合的所有事件（按入队顺序）。"""
+        """
+        返回该会话已记录的所有事件（按时间顺序）。
+
+        内存中只保留精简事件，完整记录从 SQLite 读取（record_event 返回前已提交）。
+        """
         ctx = self._sessions.get(session_id)
         if ctx is None:
             return []
-        # 返回拷贝，避免外部修改内部状态
-        return list(ctx.events)
+        try:
+            rows = self._query_session_rows(
+                "SELECT * FROM behavior_records WHERE session_id = ? AND timestamp >= ? "
+                "ORDER BY timestamp",
+                (session_id, ctx.started_at.isoformat()),
+            )
+        except Exception as exc:
+            logger.error("[EventAggregator] 读取会话事件失败 session=%s: %s", session_id, exc)
+            return []
+        return [self._row_to_record(row) for row in rows]
+
+    def _reap_idle_sessions(self) -> None:
+        """回收空闲超过 TTL 的会话上下文（最多每 SESSION_REAP_INTERVAL_SECONDS 检查一次）。"""
+        now = time.monotonic()
+        if now - self._reaped_at < SESSION_REAP_INTERVAL_SECONDS:
+            return
+        self._reaped_at = now
+        idle = [
+            sid for sid, ctx in self._sessions.items()
+            if now - ctx.last_active >= SESSION_IDLE_TTL_SECONDS
+        ]
+        for sid in idle:
+            ctx = self._sessions.pop(sid)
+            logger.warning(
+                "[EventAggregator] 回收空闲会话 session_id=%s idle=%.0fs total_events=%d",
+                sid,
+                now - ctx.last_active,
+                ctx.events.total,
+            )
 
     def get_session_stats(self, session_id: str) -> dict:
-        """返回该会话的事件计数、类型分布与情感分布等统计信息。"""
+        """
+        返回该会话的事件计数、类型 / 来源 / 情感分布与每分钟速率；
+        启用滑动窗口时另含 recent_window（最近 SESSION_STATS_WINDOW_SECONDS 的同口径统计）。
+        """
         ctx = self._sessions.get(session_id)
         if ctx is None:
             return {}
@@ -241,17 +837,74 @@ class EventAggregator:
     # 监听器注册
     # ------------------------------------------------------------------
 
-    def register_listener(self, callback: ListenerCallable) -> None:
+    def register_listener(
+        self,
+        callback: ListenerCallable,
+        *,
+        name: Optional[str] = None,
+        concurrency: int = LISTENER_CONCURRENCY,
+        max_queue: int = LISTENER_QUEUE_SIZE,
+        overflow: str = LISTENER_OVERFLOW,
+    ) -> None:
         """
         注册一个事件监听器。
 
-        监听器接收单个 BehaviorRecord 参数，可以是同步函数或协程函数。
+        监听器接收单个 BehaviorRecord 参数，可以是同步函数或协程函数，
+        在独立的 worker 中异步调用，不阻塞 record_event。
         监听器内部抛出的异常不会影响主流程，仅以 warning 记录。
+
+        Args:
+            name: 指标与日志中使用的名称，默认取回调的 __qualname__。
+            concurrency: lane 数；不同会话最多并发处理 concurrency 个事件。
+            max_queue: 每条 lane 的队列容量。
+            overflow: 队列满时的策略（drop_oldest / drop_newest / block）。
         """
         if not callable(callback):
             raise TypeError("listener 必须是可调用对象")
-        self._listeners.append(callback)
-        logger.debug("[EventAggregator] 注册监听器 %r", callback)
+        dispatcher = _ListenerDispatcher(
+            callback,
+            name=name or getattr(callback, "__qualname__", repr(callback)),
+            concurrency=concurrency,
+            max_queue=max_queue,
+            overflow=overflow,
+        )
+        self._listeners.append(dispatcher)
+        logger.debug("[EventAggregator] 注册监听器 %s", dispatcher.name)
+
+    async def flush_listeners(
+        self, session_id: Optional[str] = None, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        等待监听器处理完已分发的事件（如结束会话前汇总推断结果）。
+
+        Args:
+            session_id: 只等待该会话的事件；为 None 时等待全部会话。
+            timeout: 最长等待秒数。
+
+        Returns:
+            是否在 timeout 秒内处理完；超时不取消监听器中的任务。
+        """
+        async def join_all() -> None:
+            for dispatcher in list(self._listeners):
+                if session_id is None:
+                    await dispatcher.join()
+                else:
+                    await dispatcher.join_session(session_id)
+
+        try:
+            await asyncio.wait_for(join_all(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(
+                "[EventAggregator] 等待监听器处理积压事件超时 %.1fs session=%s",
+                timeout,
+                session_id,
+            )
+            return False
+
+    def get_listener_stats(self) -> list[dict]:
+        """各监听器的分发 / 丢弃 / 异常计数与延迟（p50 / p95）。"""
+        return [dispatcher.stats() for dispatcher in self._listeners]
 
     # ------------------------------------------------------------------
     # 核心：记录事件
@@ -275,6 +928,7 @@ class EventAggregator:
                 is_new_record=True  → 新事件，已写入；返回 BehaviorRecord 对象。
                 is_new_record=False → 命中去重窗口，未写入；record 为 None。
         """
+        self._reap_idle_sessions()
         ctx = self._sessions.get(session_id)
         if ctx is None:
             logger.warning(
@@ -283,44 +937,20 @@ class EventAggregator:
             )
             return False, None
 
-        now = datetime.now(timezone.utc)
-
-        # 在锁内完成"去重判断 + 时间戳更新 + 加入 events 列表"
-        async with self._async_lock:
-            last_ts = ctx.last_event_ts.get(event_type)
-            if last_ts is not None:
-                delta = (now - last_ts).total_seconds()
-                if 0 <= delta < self.dedup_window_seconds:
-                    logger.info(
-                        "[EventAggregator] 去重命中 session=%s event_type=%s delta=%.2fs",
-                        session_id,
-                        event_type,
-                        delta,
-                    )
-                    return False, None
-
-            confidence = SOURCE_CONFIDENCE_MAP.get(source, 0.5)
-            record = BehaviorRecord(
-                id=str(uuid4()),
-                timestamp=now,
-                session_id=session_id,
-                game_type=ctx.game_type,
-                event_type=event_type,
-                detail=detail,
-                valence=valence,
-                source=source,
-                confidence=confidence,
-                game_phase=game_phase,
-                related_interest=related_interest,
-                is_confirmed=None,
-            )
-
-            ctx.last_event_ts[event_type] = now
-            ctx.events.append(record)
+        record = self._claim_event(
+            ctx,
+            event_type=event_type,
+            source=source,
+            detail=detail,
+            valence=valence,
+            game_phase=game_phase,
+            related_interest=related_interest,
+        )
+        if record is None:
+            return False, None
 
-        # 锁外执行 IO：SQLite（线程池）+ memory_service（fire-and-forget）+ 监听器
-        await self._write_sqlite_safe(record)
-        self._enqueue_memory_write(record, ctx.child_id)
+        # IO：SQLite + memory outbox（写线程组提交，同一事务）+ 监听器
+        await self._write_sqlite_safe(record, ctx.child_id)
         await self._notify_listeners(record)
 
         logger.info(
@@ -332,148 +962,527 @@ class EventAggregator:
         )
         return True, record
 
+    def _claim_event(
+        self,
+        ctx: _SessionContext,
+        event_type: str,
+        source: EventSource,
+        detail: Optional[str],
+        valence: int,
+        game_phase: Optional[GamePhase],
+        related_interest: Optional[str],
+    ) -> Optional[BehaviorRecord]:
+        """
+        去重判断 + 时间戳更新 + 追加到会话事件环（EventRing）与增量统计；命中去重窗口时返回 None。
+
+        必须保持同步（不得引入 await）：这是同一会话并发点击之间唯一的互斥保证。
+        """
+        now = datetime.now(timezone.utc)
+        last_ts = ctx.last_event_ts.get(event_type)
+        if last_ts is not None:
+            delta = (now - last_ts).total_seconds()
+            if 0 <= delta < self.dedup_window_seconds:
+                logger.info(
+                    "[EventAggregator] 去重命中 session=%s event_type=%s delta=%.2fs",
+                    ctx.session_id,
+                    event_type,
+                    delta,
+                )
+                return None
+
+        record = BehaviorRecord(
+            id=str(uuid4()),
+            timestamp=now,
+            session_id=ctx.session_id,
+            game_type=ctx.game_type,
+            event_type=event_type,
+            detail=detail,
+            valence=valence,
+            source=source,
+            confidence=SOURCE_CONFIDENCE_MAP.get(source, 0.5),
+            game_phase=game_phase,
+            related_interest=related_interest,
+            is_confirmed=None,
+        )
+        ctx.last_event_ts[event_type] = now
+        event = CompactEvent.from_record(record)
+        ctx.events.append(event)
+        ctx.stats.add(event)
+        ctx.last_active = time.monotonic()
+        return record
+
     # ------------------------------------------------------------------
     # SQLite 写入
     # ------------------------------------------------------------------
 
     def _ensure_table(self) -> None:
-        """确保 behavior_records 表与索引存在（启动时调用一次）。"""
+        """确保 behavior_records / memory_outbox 表与索引存在，并把数据库切换到 WAL 模式（启动时调用一次）。"""
         try:
-            with self._sqlite_lock:
-                conn = sqlite3.connect(self.db_path)
-                try:
-                    cur = conn.cursor()
-                    cur.execute(
-                        """
-                        CREATE TABLE IF NOT EXISTS behavior_records (
-                            id TEXT PRIMARY KEY,
-                            timestamp TEXT NOT NULL,
-                            session_id TEXT NOT NULL,
-                            game_type TEXT NOT NULL,
-                            event_type TEXT NOT NULL,
-                            detail TEXT,
-                            valence INTEGER NOT NULL DEFAULT 0,
-                            source TEXT NOT NULL,
-                            confidence REAL NOT NULL DEFAULT 1.0,
-                            game_phase TEXT,
-                            related_interest TEXT,
-                            is_confirmed INTEGER
-                        )
-                        """
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cur = conn.cursor()
+                # WAL 模式持久化在数据库文件中：写线程提交时不阻塞其他连接的读
+                cur.execute("PRAGMA journal_mode=WAL")
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS behavior_records (
+                        id TEXT PRIMARY KEY,
+                        timestamp TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        game_type TEXT NOT NULL,
+                        event_type TEXT NOT NULL,
+                        detail TEXT,
+                        valence INTEGER NOT NULL DEFAULT 0,
+                        source TEXT NOT NULL,
+                        confidence REAL NOT NULL DEFAULT 1.0,
+                        game_phase TEXT,
+                        related_interest TEXT,
+                        is_confirmed INTEGER
                     )
-                    cur.execute(
-                        "CREATE INDEX IF NOT EXISTS idx_behavior_records_session_id "
-                        "ON behavior_records(session_id)"
+                    """
+                )
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_behavior_records_session_id "
+                    "ON behavior_records(session_id)"
+                )
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_behavior_records_session_time "
+                    "ON behavior_records(session_id, timestamp)"
+                )
+                # status: pending → delivered / failed（memory 服务明确拒收，不再重试）
+                #         / shed（过载时被丢弃的低优先级事件，死信，不再重试）
+                # next_attempt_at: 该行所属 group 退避到的时间（epoch 秒）
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS memory_outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        record_id TEXT NOT NULL,
+                        group_id TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        reference_time TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        created_at TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        last_error TEXT,
+                        delivered_at TEXT,
+                        next_attempt_at REAL NOT NULL DEFAULT 0
                     )
+                    """
+                )
+                columns = {row[1] for row in cur.execute("PRAGMA table_info(memory_outbox)")}
+                if "next_attempt_at" not in columns:
+                    # 旧版本建的表：补列
                     cur.execute(
-                        "CREATE INDEX IF NOT EXISTS idx_behavior_records_session_time "
-                        "ON behavior_records(session_id, timestamp)"
+                        "ALTER TABLE memory_outbox "
+                        "ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0"
                     )
-                    conn.commit()
-                finally:
-                    conn.close()
-        except Exception as exc:
-            # 数据库不可用时不抛出，让主流程继续；只记日志
-            logger.error("[EventAggregator] 初始化数据表失败: %s", exc)
-
-    def _write_sqlite_sync(self, record: BehaviorRecord) -> None:
-        """同步写一条记录到 SQLite（在线程池中调用）。"""
-        with self._sqlite_lock:
-            conn = sqlite3.connect(self.db_path)
-            try:
-                conn.execute(
-                    """
-                    INSERT OR REPLACE INTO behavior_records (
-                        id, timestamp, session_id, game_type, event_type,
-                        detail, valence, source, confidence,
-                        game_phase, related_interest, is_confirmed
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        record.id,
-                        record.timestamp.isoformat(),
-                        record.session_id,
-                        record.game_type,
-                        record.event_type,
-                        record.detail,
-                        record.valence,
-                        record.source.value,
-                        record.confidence,
-                        record.game_phase.value if record.game_phase else None,
-                        record.related_interest,
-                        None if record.is_confirmed is None
-                        else (1 if record.is_confirmed else 0),
-                    ),
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_memory_outbox_status "
+                    "ON memory_outbox(status, id)"
+                )
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_memory_outbox_group "
+                    "ON memory_outbox(status, group_id, next_attempt_at)"
                 )
                 conn.commit()
             finally:
                 conn.close()
+        except Exception as exc:
+            # 数据库不可用时不抛出，让主流程继续；只记日志
+            logger.error("[EventAggregator] 初始化数据表失败: %s", exc)
 
-    async def _write_sqlite_safe(self, record: BehaviorRecord) -> None:
-        """异步包装 SQLite 写入，捕获异常。"""
+    async def _write_sqlite_safe(self, record: BehaviorRecord, child_id: str) -> None:
+        """投递给写线程（连同 outbox 行）并等待所属批次提交，捕获异常。"""
+        outbox_row = (
+            record.id,
+            child_id,
+            self._record_to_natural_language(record),
+            record.timestamp.isoformat(),
+            # 过载时 memory_service 按来源优先级丢弃（定时快照 / AI 推断优先丢弃）
+            record.source.value,
+            datetime.now(timezone.utc).isoformat(),
+        )
         try:
-            await asyncio.to_thread(self._write_sqlite_sync, record)
+            await self._sqlite_writer.submit(record, outbox_row)
         except Exception as exc:
             logger.error(
                 "[EventAggregator] SQLite 写入失败 id=%s: %s", record.id, exc
             )
+            return
+        self._ensure_outbox_drainer()
+        if self._outbox_wakeup is not None:
+            self._outbox_wakeup.set()
 
     # ------------------------------------------------------------------
-    # Memory Service 写入（HTTP，fire-and-forget）
+    # SQLite 读取（按需回读已挤出内存的事件）
     # ------------------------------------------------------------------
 
-    def _enqueue_memory_write(
-        self, record: BehaviorRecord, child_id: str
-    ) -> None:
-        """以 fire-and-forget 模式将记录写入 memory_service。"""
+    def _query_session_rows(self, sql: str, params: tuple) -> list[sqlite3.Row]:
+        """用短连接执行只读查询（WAL 下不与写线程互相阻塞）。"""
+        conn = sqlite3.connect(self.db_path)
         try:
-            asyncio.create_task(self._post_memory_write(record, child_id))
+            conn.row_factory = sqlite3.Row
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _load_compact_events(
+        self, session_id: str, since: str, limit: int
+    ) -> list[CompactEvent]:
+        """EventRing 的 loader：该会话（本次 start 之后）最早的 limit 条事件。"""
+        try:
+            rows = self._query_session_rows(
+                "SELECT id, timestamp, event_type, valence, source, detail "
+                "FROM behavior_records WHERE session_id = ? AND timestamp >= ? "
+                "ORDER BY timestamp LIMIT ?",
+                (session_id, since, limit),
+            )
+        except Exception as exc:
+            logger.error("[EventAggregator] 回读会话事件失败 session=%s: %s", session_id, exc)
+            return []
+        return [
+            CompactEvent(
+                row["id"],
+                datetime.fromisoformat(row["timestamp"]).timestamp(),
+                row["event_type"],
+                row["valence"],
+                row["source"],
+                row["detail"],
+            )
+            for row in rows
+        ]
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> BehaviorRecord:
+        is_confirmed = row["is_confirmed"]
+        return BehaviorRecord(
+            id=row["id"],
+            timestamp=datetime.fromisoformat(row["timestamp"]),
+            session_id=row["session_id"],
+            game_type=row["game_type"],
+            event_type=row["event_type"],
+            detail=row["detail"],
+            valence=row["valence"],
+            source=EventSource(row["source"]),
+            confidence=row["confidence"],
+            game_phase=GamePhase(row["game_phase"]) if row["game_phase"] else None,
+            related_interest=row["related_interest"],
+            is_confirmed=None if is_confirmed is None else bool(is_confirmed),
+        )
+
+    # ------------------------------------------------------------------
+    # Memory Service 写入（outbox + 后台批量投递）
+    # ------------------------------------------------------------------
+
+    def _ensure_outbox_drainer(self) -> None:
+        """在当前事件循环内启动 outbox 投递协程（已在运行则忽略）。"""
+        if httpx is None or self._outbox_closing:
+            return  # 行保留在 outbox 中，下次启动后继续投递
+        if self._outbox_task is not None and not self._outbox_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
         except RuntimeError:
-            # 没有运行中的事件循环时，记录日志但不阻塞
-            logger.warning(
-                "[EventAggregator] 无运行中的事件循环，跳过 memory 写入 id=%s",
-                record.id,
+            return  # 无事件循环（同步调用 start_session），等首个事件入库时再启动
+        self._outbox_wakeup = asyncio.Event()
+        self._outbox_task = loop.create_task(self._drain_outbox())
+
+    async def _drain_outbox(self) -> None:
+        """
+        批量投递到期的 pending 行，并按逐条结果更新状态。
+
+        可重试的失败只让对应 group 退避（该 group 的 pending 行整体推迟，
+        保证同一 group 内不会越过失败行先投递后面的行），其他 group 不受影响。
+        """
+        group_failures: dict[str, int] = {}
+        read_failures = 0
+        while not self._outbox_closing:
+            # 先清除再读取：读取期间入库的新事件会重新置位，不会漏掉唤醒
+            self._outbox_wakeup.clear()
+            try:
+                rows, next_due = await self._sqlite_writer.call(self._fetch_outbox)
+                read_failures = 0
+            except Exception as exc:
+                logger.error("[EventAggregator] 读取 memory outbox 失败: %s", exc)
+                rows, next_due = [], None
+                read_failures += 1
+
+            if not rows:
+                await self._prune_outbox()
+                timeout = MEMORY_OUTBOX_POLL_SECONDS
+                if read_failures:
+                    timeout = self._retry_delay(read_failures)
+                elif next_due is not None:
+                    timeout = min(max(next_due - time.time(), 0.05), timeout)
+                try:
+                    await asyncio.wait_for(self._outbox_wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            outcomes = await self._post_memory_batch(rows)
+            if self._outbox_closing:
+                # httpx 在建连阶段可能吞掉取消；结果未知的这批保持 pending，下次重投
+                return
+
+            updates: list[tuple[int, str, Optional[str]]] = []
+            backoff: dict[str, float] = {}
+            now = time.time()
+            last_error: Optional[str] = None
+            for (row_id, group_id, *_), (status, retry_after, error) in zip(rows, outcomes):
+                updates.append((row_id, status, error))
+                if status != "pending":
+                    group_failures.pop(group_id, None)
+                    continue
+                last_error = error
+                if group_id not in backoff:
+                    failures = group_failures[group_id] = group_failures.get(group_id, 0) + 1
+                    delay = retry_after if retry_after is not None else self._retry_delay(failures)
+                    backoff[group_id] = now + delay
+            if backoff:
+                logger.warning(
+                    "[EventAggregator] memory 投递未完成 rows=%d groups=%d，对应 group 退避 %.1f~%.1fs: %s",
+                    sum(1 for status, _, _ in outcomes if status == "pending"),
+                    len(backoff),
+                    min(backoff.values()) - now,
+                    max(backoff.values()) - now,
+                    last_error,
+                )
+            try:
+                await self._sqlite_writer.call(
+                    lambda conn: self._mark_outbox(conn, updates, backoff)
+                )
+            except Exception as exc:
+                logger.error("[EventAggregator] 更新 memory outbox 状态失败: %s", exc)
+                await asyncio.sleep(self._retry_delay(1))
+
+    @staticmethod
+    def _retry_delay(failures: int) -> float:
+        """指数退避：1s, 2s, 4s ... 上限 MEMORY_OUTBOX_RETRY_MAX_SECONDS。"""
+        return min(2.0 ** max(failures - 1, 0), MEMORY_OUTBOX_RETRY_MAX_SECONDS)
+
+    @staticmethod
+    def _fetch_outbox(conn: sqlite3.Connection) -> tuple[list[tuple], Optional[float]]:
+        """
+        取一批到期的 pending 行（按 id 升序返回），以及最近一次退避到期的时间。
+
+        正在退避的 group 整体跳过；每个 group 最多取 MEMORY_OUTBOX_GROUP_BATCH_SIZE 条，
+        超出批大小时高优先级来源优先。低优先级行因此可能晚于同组更新的行投递，
+        episode 自带 reference_time，graphiti 侧的时间线不受影响。
+        """
+        now = time.time()
+        low = MEMORY_OUTBOX_LOW_PRIORITY_SOURCES
+        low_placeholders = ",".join("?" * len(low)) or "NULL"
+        rows = conn.execute(
+            f"""
+            SELECT id, group_id, content, reference_time, source FROM (
+                SELECT id, group_id, content, reference_time, source,
+                       CASE WHEN source IN ({low_placeholders}) THEN 1 ELSE 0 END AS low_priority,
+                       ROW_NUMBER() OVER (PARTITION BY group_id ORDER BY id) AS group_rank
+                FROM memory_outbox
+                WHERE status = 'pending' AND group_id NOT IN (
+                    SELECT group_id FROM memory_outbox
+                    WHERE status = 'pending' AND next_attempt_at > ?
+                )
             )
+            WHERE group_rank <= ?
+            ORDER BY low_priority, id
+            LIMIT ?
+            """,
+            (*low, now, MEMORY_OUTBOX_GROUP_BATCH_SIZE, MEMORY_OUTBOX_BATCH_SIZE),
+        ).fetchall()
+        next_due = conn.execute(
+            "SELECT MIN(next_attempt_at) FROM memory_outbox "
+            "WHERE status = 'pending' AND next_attempt_at > ?",
+            (now,),
+        ).fetchone()[0]
+        return sorted(rows), next_due
 
-    async def _post_memory_write(
-        self, record: BehaviorRecord, child_id: str
+    @staticmethod
+    def _mark_outbox(
+        conn: sqlite3.Connection,
+        updates: list[tuple[int, str, Optional[str]]],
+        backoff: dict[str, float],
     ) -> None:
-        """实际向 memory_service POST /api/memory/write。"""
-        if httpx is None:
-            logger.warning("[EventAggregator] httpx 未安装，跳过 memory 写入")
+        """按逐条结果更新状态；backoff 中的 group 其全部 pending 行推迟到给定时间。"""
+        delivered_at = datetime.now(timezone.utc).isoformat()
+        conn.executemany(
+            "UPDATE memory_outbox SET status = 'delivered', delivered_at = ?, "
+            "attempts = attempts + 1, last_error = NULL WHERE id = ?",
+            [(delivered_at, row_id) for row_id, status, _ in updates if status == "delivered"],
+        )
+        conn.executemany(
+            "UPDATE memory_outbox SET status = ?, attempts = attempts + 1, "
+            "last_error = ? WHERE id = ?",
+            [
+                (status, error, row_id)
+                for row_id, status, error in updates
+                if status != "delivered"
+            ],
+        )
+        conn.executemany(
+            "UPDATE memory_outbox SET next_attempt_at = ? "
+            "WHERE status = 'pending' AND group_id = ?",
+            [(until, group_id) for group_id, until in backoff.items()],
+        )
+
+    async def _prune_outbox(self) -> None:
+        """清理超过保留期的 delivered 行（最多每小时一次）。"""
+        now = time.time()
+        if now - self._outbox_pruned_at < 3600:
             return
+        self._outbox_pruned_at = now
+        cutoff = datetime.fromtimestamp(
+            now - MEMORY_OUTBOX_RETENTION_SECONDS, timezone.utc
+        ).isoformat()
+        try:
+            await self._sqlite_writer.call(
+                lambda conn: conn.execute(
+                    "DELETE FROM memory_outbox WHERE status = 'delivered' AND delivered_at < ?",
+                    (cutoff,),
+                )
+            )
+        except Exception as exc:
+            logger.warning("[EventAggregator] 清理 memory outbox 失败: %s", exc)
+
+    async def _post_memory_batch(
+        self, rows: list[tuple]
+    ) -> list[tuple[str, Optional[float], Optional[str]]]:
+        """
+        POST /api/memory/write/batch，返回与 rows 一一对应的 (status, retry_after, error)。
+
+            status="delivered" → 已被 memory_service 接收
+            status="shed"      → 过载时被丢弃的低优先级事件，转入死信，不再重试
+            status="pending"   → 可重试（over_quota / 网络 / 5xx / 非 422 的 4xx），retry_after 来自响应
+            status="failed"    → 该条本身有问题（逐条结果报错，或 422 定位到该条），不再重试
 
-        content = self._record_to_natural_language(record)
+        响应带逐条 results 时按条处理。只有 422（请求体校验失败）视为条目问题：
+        按错误位置（或二分重发）定位出问题的条目，只把这些条目标记 failed。
+        其余 4xx（404 / 405 / 401 等）说明接口缺失或配置错误，与条目无关，
+        与 5xx 一样整批保留 pending、按 group 退避重试，不会因部署不一致清空 outbox。
+        """
         payload = {
-            "group_id": child_id,
-            "content": content,
-            "reference_time": record.timestamp.isoformat(),
+            "episodes": [
+                {
+                    "group_id": group_id,
+                    "content": content,
+                    "reference_time": reference_time,
+                    "source": source,
+                }
+                for _, group_id, content, reference_time, source in rows
+            ]
         }
-
         try:
             client = await self._get_http_client()
             resp = await client.post(
-                f"{self.memory_service_url}/api/memory/write",
+                f"{self.memory_service_url}/api/memory/write/batch",
                 json=payload,
                 timeout=10.0,
             )
-            if resp.status_code >= 400:
+        except Exception as exc:
+            return [("pending", None, str(exc))] * len(rows)
+
+        retry_after = self._parse_retry_after(resp.headers.get("Retry-After"))
+        results = self._batch_results(resp, len(rows))
+        if results is not None:
+            outcomes = [self._item_outcome(item, retry_after) for item in results]
+            logger.debug(
+                "[EventAggregator] memory 批量投递 batch=%d delivered=%d",
+                len(rows),
+                sum(1 for status, _, _ in outcomes if status == "delivered"),
+            )
+            return outcomes
+
+        if resp.status_code < 400:
+            logger.debug("[EventAggregator] memory 已入队 batch=%d", len(rows))
+            return [("delivered", None, None)] * len(rows)
+        error = f"{resp.status_code} {resp.text[:200]}"
+        if resp.status_code != 422:
+            if resp.status_code < 500 and resp.status_code not in (408, 429):
                 logger.warning(
-                    "[EventAggregator] memory 写入返回非 2xx: %d %s",
+                    "[EventAggregator] memory 批量接口返回 %s（接口缺失或配置错误？），%d 条稍后重试",
                     resp.status_code,
-                    resp.text[:200],
+                    len(rows),
                 )
-            else:
-                logger.debug(
-                    "[EventAggregator] memory 已入队 id=%s", record.id
-                )
-        except Exception as exc:
-            # 内存服务不可用时绝不影响主流程
-            logger.warning(
-                "[EventAggregator] memory 写入失败（已忽略） id=%s: %s",
-                record.id,
-                exc,
+            return [("pending", retry_after, error)] * len(rows)
+
+        # 422：只让出问题的条目失败，其余条目重新投递
+        if len(rows) == 1:
+            logger.error("[EventAggregator] memory 服务拒收 id=%s，已标记 failed: %s", rows[0][0], error)
+            return [("failed", None, error)]
+        bad = self._invalid_indexes(resp, len(rows))
+        if bad:
+            outcomes: list = [("failed", None, error) if i in bad else None for i in range(len(rows))]
+            rest = [i for i in range(len(rows)) if i not in bad]
+            logger.error(
+                "[EventAggregator] memory 服务拒收 %d/%d 条，已标记 failed: %s",
+                len(bad),
+                len(rows),
+                error,
             )
+            if rest:
+                for i, outcome in zip(rest, await self._post_memory_batch([rows[i] for i in rest])):
+                    outcomes[i] = outcome
+            return outcomes
+        mid = len(rows) // 2
+        return (
+            await self._post_memory_batch(rows[:mid])
+            + await self._post_memory_batch(rows[mid:])
+        )
+
+    @staticmethod
+    def _parse_retry_after(value: object) -> Optional[float]:
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _batch_results(resp: "httpx.Response", expected: int) -> Optional[list]:
+        """响应体中的逐条 results；旧版本 memory_service 或长度不符时返回 None。"""
+        try:
+            body = resp.json()
+        except ValueError:
+            return None
+        results = body.get("results") if isinstance(body, dict) else None
+        if isinstance(results, list) and len(results) == expected:
+            return results
+        return None
+
+    def _item_outcome(
+        self, item: object, default_retry_after: Optional[float]
+    ) -> tuple[str, Optional[float], Optional[str]]:
+        status = item.get("status") if isinstance(item, dict) else None
+        reason = item.get("reason") if isinstance(item, dict) else None
+        if status == "accepted":
+            return "delivered", None, None
+        if status == "shed":
+            return "shed", None, reason
+        if status == "over_quota":
+            retry_after = self._parse_retry_after(item.get("retry_after"))
+            return "pending", retry_after if retry_after is not None else default_retry_after, reason
+        return "failed", None, reason or f"unexpected result {item!r}"
+
+    @staticmethod
+    def _invalid_indexes(resp: "httpx.Response", count: int) -> set[int]:
+        """从 422 校验错误的 loc（["body", "episodes", i, ...]）中取出出错条目的下标。"""
+        try:
+            detail = resp.json().get("detail")
+        except (ValueError, AttributeError):
+            return set()
+        bad: set[int] = set()
+        for err in detail if isinstance(detail, list) else []:
+            loc = err.get("loc") if isinstance(err, dict) else None
+            if (
+                isinstance(loc, list)
+                and len(loc) >= 3
+                and loc[:2] == ["body", "episodes"]
+                and isinstance(loc[2], int)
+                and 0 <= loc[2] < count
+            ):
+                bad.add(loc[2])
+        return bad
 
     async def _get_http_client(self) -> "httpx.AsyncClient":
         """懒加载 httpx 客户端。"""
@@ -482,7 +1491,16 @@ class EventAggregator:
         return self._http_client
 
     async def aclose(self) -> None:
-        """关闭底层资源（HTTP 客户端等）。"""
+        """关闭底层资源（监听器 worker、outbox 投递协程、SQLite 写线程、HTTP 客户端等）。"""
+        for dispatcher in self._listeners:
+            await dispatcher.aclose()
+        # 未投递的 outbox 行已落库，下次启动后继续投递
+        self._outbox_closing = True
+        if self._outbox_task is not None:
+            self._outbox_task.cancel()
+            await asyncio.wait({self._outbox_task}, timeout=5.0)
+            self._outbox_task = None
+        await asyncio.to_thread(self._sqlite_writer.close)
         if self._http_client is not None:
             try:
                 await self._http_client.aclose()
@@ -532,18 +1550,14 @@ class EventAggregator:
     # ------------------------------------------------------------------
 
     async def _notify_listeners(self, record: BehaviorRecord) -> None:
-        """依次通知所有监听器；任一监听器异常都不影响其他监听器。"""
-        if not self._listeners:
-            return
-        for listener in list(self._listeners):
+        """把事件放入各监听器的队列；只在 overflow='block' 且队列满时等待。"""
+        for dispatcher in list(self._listeners):
             try:
-                result = listener(record)
-                if asyncio.iscoroutine(result):
-                    await result
+                await dispatcher.dispatch(record)
             except Exception as exc:
                 logger.warning(
-                    "[EventAggregator] 监听器 %r 抛出异常（已忽略）: %s",
-                    listener,
+                    "[EventAggregator] 监听器 %s 分发失败（已忽略）: %s",
+                    dispatcher.name,
                     exc,
                 )
 
@@ -553,36 +1567,24 @@ class EventAggregator:
 
     @staticmethod
     def _compute_stats(ctx: _SessionContext) -> dict:
-        """根据 session 上下文计算统计摘要。"""
-        type_counts: dict[str, int] = defaultdict(int)
-        source_counts: dict[str, int] = defaultdict(int)
-        valence_counts = {"positive": 0, "neutral": 0, "negative": 0}
-
-        for ev in ctx.events:
-            type_counts[ev.event_type] += 1
-            source_counts[ev.source.value] += 1
-            if ev.valence > 0:
-                valence_counts["positive"] += 1
-            elif ev.valence < 0:
-                valence_counts["negative"] += 1
-            else:
-                valence_counts["neutral"] += 1
-
+        """根据 session 上下文的增量计数生成统计摘要（O(1)，不遍历事件）。"""
         end_time = datetime.now(timezone.utc)
         duration = (end_time - ctx.started_at).total_seconds()
+        totals = ctx.stats.totals.summary(duration / 60)
 
-        return {
+        stats = {
             "session_id": ctx.session_id,
             "child_id": ctx.child_id,
             "game_type": ctx.game_type,
             "start_time": ctx.started_at.isoformat(),
             "end_time": end_time.isoformat(),
             "duration_seconds": duration,
-            "total_events": len(ctx.events),
-            "event_type_distribution": dict(type_counts),
-            "source_distribution": dict(source_counts),
-            "valence_distribution": valence_counts,
+            **totals,
         }
+        recent = ctx.stats.window_summary(end_time.timestamp(), duration)
+        if recent is not None:
+            stats["recent_window"] = recent
+        return stats
 
 
 __all__ = ["EventAggregator"]
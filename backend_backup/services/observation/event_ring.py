@@ -0,0 +1,128 @@
+"""
+会话事件环形缓冲（EventRing）
+
+EventAggregator / AIInferenceEngine 在内存中只保留每个会话最近的若干条事件，
+且只保存统计与推断用到的字段（CompactEvent，__slots__，无 Pydantic 开销）。
+更早的事件已落库（behavior_records），需要时通过 loader 从 SQLite 分页读回。
+
+设计要点：
+    - 追加 O(1)；超出容量时最旧的事件被挤出（spilled），total 仍计入。
+    - 最近窗口查询只扫描内存；窗口早于内存中最旧事件且存在挤出时才回读 SQLite。
+    - 事件按到达顺序追加（同一会话时间戳单调），挤出的恰好是该会话最早的
+      spilled 条事件，loader 按时间顺序取前 N 条即可。
+"""
+from __future__ import annotations
+
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+
+try:
+    from backend_backup.src.models.behavior_record import BehaviorRecord
+except ImportError:  # 兼容相对包路径环境
+    from src.models.behavior_record import BehaviorRecord  # type: ignore
+
+
+class CompactEvent:
+    """内存中的精简事件：统计 / 推断所需字段，时间戳为 epoch 秒。"""
+
+    __slots__ = ("id", "ts", "event_type", "valence", "source", "detail")
+
+    def __init__(
+        self,
+        id: Optional[str],
+        ts: float,
+        event_type: str,
+        valence: int,
+        source: str,
+        detail: Optional[str] = None,
+    ) -> None:
+        self.id = id
+        self.ts = ts
+        self.event_type = event_type
+        self.valence = valence
+        self.source = source
+        self.detail = detail
+
+    @classmethod
+    def from_record(cls, record: BehaviorRecord) -> "CompactEvent":
+        return cls(
+            record.id,
+            record.timestamp.timestamp(),
+            record.event_type,
+            record.valence,
+            record.source.value,
+            record.detail,
+        )
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.ts, timezone.utc)
+
+    def __repr__(self) -> str:
+        return f"CompactEvent({self.event_type!r}, ts={self.ts:.3f}, valence={self.valence})"
+
+
+#: loader(n) → 该会话最早的 n 条事件（按时间升序）
+EventLoader = Callable[[int], list[CompactEvent]]
+
+
+class EventRing:
+    """
+    单个会话的有界事件缓冲。
+
+    使用方式::
+
+        ring = EventRing(capacity=500, loader=lambda n: load_first_n(session_id, n))
+        ring.append(CompactEvent.from_record(record))
+        ring.total               # 累计事件数（含已挤出）
+        ring.since(cutoff_ts)    # 最近窗口内的事件
+    """
+
+    def __init__(self, capacity: int, loader: Optional[EventLoader] = None) -> None:
+        self.capacity = max(capacity, 1)
+        self.loader = loader
+        self._events: deque[CompactEvent] = deque(maxlen=self.capacity)
+        self.total = 0
+
+    def append(self, event: CompactEvent) -> None:
+        self._events.append(event)
+        self.total += 1
+
+    @property
+    def spilled(self) -> int:
+        """已被挤出内存的事件数。"""
+        return self.total - len(self._events)
+
+    def __len__(self) -> int:
+        """内存中保留的事件数（累计总数见 total）。"""
+        return len(self._events)
+
+    def __bool__(self) -> bool:
+        return self.total > 0
+
+    def __iter__(self) -> Iterator[CompactEvent]:
+        return iter(self._events)
+
+    def last(self) -> Optional[CompactEvent]:
+        return self._events[-1] if self._events else None
+
+    def _load_spilled(self) -> list[CompactEvent]:
+        if self.loader is None or self.spilled <= 0:
+            return []
+        return self.loader(self.spilled)
+
+    def since(self, cutoff_ts: float) -> list[CompactEvent]:
+        """时间戳 ≥ cutoff_ts 的事件（升序）；窗口超出内存范围时回读已挤出的部分。"""
+        recent = [e for e in self._events if e.ts >= cutoff_ts]
+        if self.spilled and (not self._events or self._events[0].ts >= cutoff_ts):
+            older = [e for e in self._load_spilled() if e.ts >= cutoff_ts]
+            recent = older + recent
+        return recent
+
+    def all(self) -> list[CompactEvent]:
+        """全部事件（升序），包括从 SQLite 回读的已挤出部分。"""
+        return self._load_spilled() + list(self._events)
+
+
+__all__ = ["CompactEvent", "EventLoader", "EventRing"]
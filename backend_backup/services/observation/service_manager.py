@@ -8,12 +8,14 @@
 
 事件流向：
     parent_click / probe_response
-        → EventAggregator.record_event
+        → EventAggregator.record_event（入库后把事件放入各监听器队列即返回）
             → 监听器 1：AIInferenceEngine.on_event（async）— 累计事件，必要时生成推断
             → 监听器 2：_on_event_for_scheduler（sync）— 通知调度器有用户活动
 
 设计要点：
-    - EventAggregator 内部使用 iscoroutine 检测，因此监听器既可同步也可异步。
+    - EventAggregator 内部使用 iscoroutine 检测，因此监听器既可同步也可异步；
+      监听器在各自的 worker 中运行，推断引擎的 LLM 调用不会拖慢 record_event。
+    - end_session 先等待监听器处理完积压事件，保证推断统计包含全部事件。
     - 三个子服务均可独立替换 / 测试；本类仅承担"组合 + 生命周期"。
     - start_session 是 async（与 record_event 调用风格保持一致），便于 FastAPI 路由直接 await。
 """
@@ -65,9 +67,13 @@ class ObservationServiceManager:
         self.inference_engine = AIInferenceEngine(llm_service=llm_service)
 
         # 监听器 1：事件聚合器 → AI 推断引擎（异步回调）
-        self.event_aggregator.register_listener(self.inference_engine.on_event)
-        # 监听器 2：事件聚合器 → 快照调度器（同步回调）
-        self.event_aggregator.register_listener(self._on_event_for_scheduler)
+        self.event_aggregator.register_listener(
+            self.inference_engine.on_event, name="inference_engine"
+        )
+        # 监听器 2：事件聚合器 → 快照调度器（同步回调，开销小，单 lane 即可）
+        self.event_aggregator.register_listener(
+            self._on_event_for_scheduler, name="snapshot_scheduler", concurrency=1
+        )
 
         logger.info(
             "[ObservationServiceManager] 初始化完成 db_path=%s memory_url=%s llm=%s",
@@ -145,6 +151,8 @@ class ObservationServiceManager:
             event_stats → snapshot_stats → inference_stats，
             最终保留各服务的特征字段。
         """
+        # 只等待本会话的事件被推断引擎 / 调度器处理完，其他会话的积压不影响结束耗时
+        await self.event_aggregator.flush_listeners(session_id, timeout=15.0)
         event_stats = self.event_aggregator.end_session(session_id) or {}
         snapshot_stats = self.snapshot_scheduler.end_session(session_id) or {}
         inference_stats = self.inference_engine.end_session(session_id) or {}
@@ -175,6 +183,10 @@ class ObservationServiceManager:
                 exc,
             )
 
+    def get_health_stats(self) -> dict:
+        """运行状态（供 /health）：各事件监听器的队列深度、丢弃数与处理延迟。"""
+        return {"event_listeners": self.event_aggregator.get_listener_stats()}
+
     # ------------------------------------------------------------------
     # 资源清理
     # ------------------------------------------------------------------
@@ -97,8 +97,12 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    return {"status": "healthy"}
+    """健康检查端点（附实时记录系统的监听器队列状态）"""
+    from src.container import container
+    health = {"status": "healthy"}
+    if container.has('observation_manager'):
+        health["observation"] = container.get('observation_manager').get_health_stats()
+    return health
 
 
 @app.post("/test/workflow")
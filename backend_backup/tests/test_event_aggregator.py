@@ -0,0 +1,392 @@
+"""
+EventAggregator 测试：SQLite 写线程批量提交；memory outbox 逐条投递结果、group 退避与优先级；
+监听器按会话 flush
+
+memory_service 用 httpx.MockTransport 模拟，不需要真实服务。
+Run: python -m pytest -q backend_backup/tests/test_event_aggregator.py
+"""
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+
+# 添加 backend_backup 目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import services.observation.event_aggregator as event_aggregator  # noqa: E402
+from services.observation.event_aggregator import (  # noqa: E402
+    _INSERT_OUTBOX_SQL,
+    EventAggregator,
+)
+from src.models.behavior_record import BehaviorRecord, EventSource  # noqa: E402
+
+
+def _record(record_id: str) -> BehaviorRecord:
+    return BehaviorRecord(
+        id=record_id,
+        timestamp=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        session_id="s1",
+        game_type="blocks",
+        event_type="眼神接触",
+        valence=1,
+        source=EventSource.PARENT_CLICK,
+        confidence=1.0,
+    )
+
+
+def _outbox_row(record_id: str, group_id: str, source: str = "parent_click") -> tuple:
+    return (record_id, group_id, f"内容 {record_id}", "2026-01-01T00:00:00+00:00", source, "now")
+
+
+def _statuses(db_path: Path) -> dict[str, str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute("SELECT record_id, status FROM memory_outbox"))
+    finally:
+        conn.close()
+
+
+async def _wait_for(predicate, timeout: float = 3.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met before timeout")
+        await asyncio.sleep(0.02)
+
+
+class FakeMemoryService:
+    """记录每次请求的 content 列表，按 decide(content, attempt) 返回逐条结果。"""
+
+    def __init__(self, decide) -> None:
+        self.decide = decide
+        self.requests: list[list[str]] = []
+        self.attempts: dict[str, int] = {}
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        episodes = json.loads(request.content)["episodes"]
+        contents = [episode["content"] for episode in episodes]
+        self.requests.append(contents)
+        results = []
+        for content in contents:
+            self.attempts[content] = self.attempts.get(content, 0) + 1
+            results.append(self.decide(content, self.attempts[content]))
+        return httpx.Response(202, json={"results": results})
+
+
+async def _run_outbox(tmp_path: Path, handler, rows: list[tuple]) -> EventAggregator:
+    aggregator = EventAggregator(db_path=str(tmp_path / "events.db"))
+    aggregator._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    await aggregator._sqlite_writer.call(lambda conn: conn.executemany(_INSERT_OUTBOX_SQL, rows))
+    aggregator._ensure_outbox_drainer()
+    return aggregator
+
+
+def _record_batches(aggregator: EventAggregator) -> list[int]:
+    """记录写线程每次提交的批大小。"""
+    writer = aggregator._sqlite_writer
+    batches: list[int] = []
+    flush = writer._flush
+
+    def recording_flush(batch):
+        batches.append(len(batch))
+        flush(batch)
+
+    writer._flush = recording_flush
+    return batches
+
+
+def test_sqlite_writer_group_commits_up_to_batch_size(tmp_path):
+    async def run():
+        aggregator = EventAggregator(
+            db_path=str(tmp_path / "events.db"), sqlite_batch_size=3, sqlite_flush_interval_ms=50
+        )
+        batches = _record_batches(aggregator)
+        writer = aggregator._sqlite_writer
+        outbox = _outbox_row("r0", "g1")
+        await asyncio.gather(
+            *(writer.submit(_record(f"r{i}"), outbox if i == 0 else None) for i in range(5))
+        )
+        # call 排在记录之后：先提交已攒的记录，再在单独事务中执行
+        writer.submit(_record("r5"))
+        count = await writer.call(
+            lambda conn: conn.execute("SELECT COUNT(*) FROM behavior_records").fetchone()[0]
+        )
+        await aggregator.aclose()
+        return batches, count
+
+    batches, count = asyncio.run(run())
+    assert batches == [3, 2, 1]
+    assert count == 6
+    assert _statuses(tmp_path / "events.db") == {"r0": "pending"}
+
+
+def test_sqlite_writer_failed_batch_fails_every_waiter_and_recovers(tmp_path):
+    async def run():
+        aggregator = EventAggregator(
+            db_path=str(tmp_path / "events.db"), sqlite_batch_size=10, sqlite_flush_interval_ms=50
+        )
+        writer = aggregator._sqlite_writer
+        bad_outbox = ("r1", "g1")  # 列数不对：整批回滚
+        results = await asyncio.gather(
+            writer.submit(_record("r0")), writer.submit(_record("r1"), bad_outbox),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, sqlite3.Error) for result in results)
+        # 写线程重新连接后继续工作
+        await writer.submit(_record("r2"))
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    conn = sqlite3.connect(tmp_path / "events.db")
+    try:
+        assert [row[0] for row in conn.execute("SELECT id FROM behavior_records")] == ["r2"]
+    finally:
+        conn.close()
+
+
+def test_outbox_applies_per_item_results(tmp_path):
+    def decide(content, attempt):
+        if "shed" in content:
+            return {"status": "shed", "reason": "overloaded"}
+        if "quota" in content and attempt == 1:
+            return {"status": "over_quota", "reason": "group quota", "retry_after": 0.2}
+        return {"status": "accepted", "episode_id": content}
+
+    service = FakeMemoryService(decide)
+
+    async def run():
+        aggregator = await _run_outbox(
+            tmp_path,
+            service,
+            [_outbox_row("ok", "g1"), _outbox_row("shed", "g2", "timed_snapshot"), _outbox_row("quota", "g3")],
+        )
+        db = tmp_path / "events.db"
+        await _wait_for(lambda: _statuses(db).get("quota") == "delivered")
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    assert _statuses(tmp_path / "events.db") == {"ok": "delivered", "shed": "shed", "quota": "delivered"}
+    # 只重发被拒绝的那一条，已接收 / 已丢弃的不再重发
+    assert service.requests[1:] == [["内容 quota"]]
+
+
+def test_outbox_backoff_is_per_group(tmp_path):
+    def decide(content, attempt):
+        if "busy" in content:
+            return {"status": "over_quota", "reason": "group quota", "retry_after": 60}
+        return {"status": "accepted"}
+
+    service = FakeMemoryService(decide)
+
+    async def run():
+        aggregator = await _run_outbox(tmp_path, service, [_outbox_row("busy-1", "busy")])
+        db = tmp_path / "events.db"
+        await _wait_for(lambda: len(service.requests) == 1)
+        # busy 退避期间：同组新行不越过失败行先投递，其他 group 不受影响
+        await aggregator._sqlite_writer.call(
+            lambda conn: conn.executemany(
+                _INSERT_OUTBOX_SQL, [_outbox_row("busy-2", "busy"), _outbox_row("other", "other")]
+            )
+        )
+        aggregator._outbox_wakeup.set()
+        await _wait_for(lambda: _statuses(db).get("other") == "delivered")
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    statuses = _statuses(tmp_path / "events.db")
+    assert statuses["busy-1"] == statuses["busy-2"] == "pending"
+    assert service.requests == [["内容 busy-1"], ["内容 other"]]
+
+
+def test_outbox_sends_high_priority_sources_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_aggregator, "MEMORY_OUTBOX_BATCH_SIZE", 2)
+    service = FakeMemoryService(lambda content, attempt: {"status": "accepted"})
+
+    async def run():
+        aggregator = await _run_outbox(
+            tmp_path,
+            service,
+            [
+                _outbox_row("snap-1", "g1", "timed_snapshot"),
+                _outbox_row("snap-2", "g2", "timed_snapshot"),
+                _outbox_row("click", "g3", "parent_click"),
+            ],
+        )
+        await _wait_for(lambda: sum(map(len, service.requests)) == 3)
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    assert service.requests[0] == ["内容 snap-1", "内容 click"]
+
+
+def test_outbox_caps_rows_per_group(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_aggregator, "MEMORY_OUTBOX_GROUP_BATCH_SIZE", 2)
+    service = FakeMemoryService(lambda content, attempt: {"status": "accepted"})
+
+    async def run():
+        aggregator = await _run_outbox(
+            tmp_path,
+            service,
+            [_outbox_row(f"big-{i}", "big") for i in range(5)] + [_outbox_row("small", "small")],
+        )
+        await _wait_for(lambda: sum(map(len, service.requests)) == 6)
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    assert service.requests[0] == ["内容 big-0", "内容 big-1", "内容 small"]
+
+
+@pytest.mark.parametrize("with_loc", [True, False])
+def test_outbox_isolates_rejected_item(tmp_path, with_loc):
+    requests: list[list[str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        contents = [episode["content"] for episode in json.loads(request.content)["episodes"]]
+        requests.append(contents)
+        if "内容 bad" in contents:
+            index = contents.index("内容 bad") if with_loc else 0
+            loc = ["body", "episodes", index, "content"] if with_loc else ["body"]
+            return httpx.Response(422, json={"detail": [{"loc": loc, "msg": "invalid"}]})
+        return httpx.Response(202, json={"results": [{"status": "accepted"}] * len(contents)})
+
+    async def run():
+        aggregator = await _run_outbox(
+            tmp_path,
+            handler,
+            [_outbox_row(name, "g1") for name in ("a", "b", "bad", "c")],
+        )
+        db = tmp_path / "events.db"
+        await _wait_for(lambda: "pending" not in _statuses(db).values())
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    assert _statuses(tmp_path / "events.db") == {
+        "a": "delivered",
+        "b": "delivered",
+        "bad": "failed",
+        "c": "delivered",
+    }
+    if with_loc:
+        # 错误位置明确时只重发其余条目一次，否则二分定位
+        assert requests[1] == ["内容 a", "内容 b", "内容 c"]
+
+
+@pytest.mark.parametrize("status_code", [400, 404, 405])
+def test_outbox_endpoint_error_keeps_rows_pending(tmp_path, status_code):
+    requests: list[list[str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append([episode["content"] for episode in json.loads(request.content)["episodes"]])
+        return httpx.Response(status_code, text="not here", headers={"Retry-After": "60"})
+
+    async def run():
+        aggregator = await _run_outbox(
+            tmp_path, handler, [_outbox_row("a", "g1"), _outbox_row("b", "g2")]
+        )
+        await _wait_for(lambda: len(requests) >= 1)
+        await asyncio.sleep(0.2)
+        await aggregator.aclose()
+
+    asyncio.run(run())
+    # 接口级错误与条目无关：不二分、不标记 failed，整批按 group 退避
+    assert requests == [["内容 a", "内容 b"]]
+    assert _statuses(tmp_path / "events.db") == {"a": "pending", "b": "pending"}
+    conn = sqlite3.connect(tmp_path / "events.db")
+    try:
+        due = [row[0] for row in conn.execute("SELECT next_attempt_at FROM memory_outbox")]
+    finally:
+        conn.close()
+    assert all(value is not None and value > time.time() + 30 for value in due)
+
+
+def test_flush_listeners_waits_only_for_the_given_session(tmp_path):
+    release = asyncio.Event()
+    handled: list[str] = []
+
+    async def slow_listener(record):
+        if record.session_id == "busy":
+            await release.wait()
+        handled.append(record.session_id)
+
+    async def run():
+        aggregator = EventAggregator(db_path=str(tmp_path / "events.db"))
+        aggregator._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(202, json={}))
+        )
+        aggregator.register_listener(slow_listener, name="slow", concurrency=1)
+        aggregator.start_session("quiet", "child-q", "blocks")
+        aggregator.start_session("busy", "child-b", "blocks")
+
+        await aggregator.record_event("quiet", "眼神接触", EventSource.PARENT_CLICK)
+        assert await aggregator.flush_listeners("quiet", timeout=1.0)
+        await aggregator.record_event("busy", "眼神接触", EventSource.PARENT_CLICK)
+
+        # busy 的事件卡在监听器中：quiet 已无积压，立即返回；busy 超时
+        started = time.monotonic()
+        assert await aggregator.flush_listeners("quiet", timeout=1.0)
+        assert time.monotonic() - started < 0.5
+        assert not await aggregator.flush_listeners("busy", timeout=0.1)
+
+        release.set()
+        assert await aggregator.flush_listeners("busy", timeout=1.0)
+        assert handled == ["quiet", "busy"]
+        stats = aggregator.get_listener_stats()[0]
+        assert stats["processed"] == 2 and stats["pending_sessions"] == 0
+        await aggregator.aclose()
+
+    asyncio.run(run())
+
+
+def test_session_stats_count_claimed_events(tmp_path):
+    async def run():
+        aggregator = EventAggregator(db_path=str(tmp_path / "events.db"))
+        aggregator._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(202, json={}))
+        )
+        aggregator.start_session("s1", "child-1", "blocks")
+        for event_type in ("眼神接触", "主动互动", "眼神接触"):
+            await aggregator.record_event("s1", event_type, EventSource.PARENT_CLICK, valence=1)
+
+        # 第二次「眼神接触」落在去重窗口内
+        stats = aggregator.end_session("s1")
+        await aggregator.aclose()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["total_events"] == 2
+    conn = sqlite3.connect(tmp_path / "events.db")
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM behavior_records").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+def test_session_events_page_in_from_sqlite_past_the_ring(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_aggregator, "SESSION_EVENT_RING_SIZE", 2)
+    event_types = ["眼神接触", "主动互动", "情绪正面", "模仿动作"]
+
+    async def run():
+        aggregator = EventAggregator(db_path=str(tmp_path / "events.db"))
+        aggregator._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(202, json={}))
+        )
+        aggregator.start_session("s1", "child-1", "blocks")
+        for event_type in event_types:
+            await aggregator.record_event("s1", event_type, EventSource.PARENT_CLICK, valence=1)
+
+        ring = aggregator._sessions["s1"].events
+        assert len(ring) == 2 and ring.spilled == 2
+        assert [e.event_type for e in ring.all()] == event_types
+        records = aggregator.get_session_events("s1")
+        await aggregator.aclose()
+        return records
+
+    records = asyncio.run(run())
+    assert [r.event_type for r in records] == event_types
+    assert all(r.source == EventSource.PARENT_CLICK for r in records)
@@ -0,0 +1,68 @@
+"""
+EventRing 测试：容量挤出、累计计数、最近窗口查询与已挤出事件的回读
+
+Run: python -m pytest -q backend_backup/tests/test_event_ring.py
+"""
+import sys
+from pathlib import Path
+
+# 添加 backend_backup 目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.observation.event_ring import CompactEvent, EventRing  # noqa: E402
+
+
+def _event(ts: float) -> CompactEvent:
+    return CompactEvent(f"e{ts}", ts, "眼神接触", 1, "parent_click")
+
+
+def test_ring_evicts_oldest_and_keeps_total():
+    ring = EventRing(capacity=3)
+    assert not ring and ring.last() is None
+    for ts in range(5):
+        ring.append(_event(float(ts)))
+
+    assert ring.total == 5
+    assert len(ring) == 3
+    assert [e.ts for e in ring] == [2.0, 3.0, 4.0]
+    assert ring.last().ts == 4.0
+
+
+def test_since_returns_recent_events_in_order():
+    ring = EventRing(capacity=10)
+    for ts in (1.0, 5.0, 7.0, 9.0):
+        ring.append(_event(ts))
+
+    assert [e.ts for e in ring.since(6.0)] == [7.0, 9.0]
+    assert [e.ts for e in ring.since(0.0)] == [1.0, 5.0, 7.0, 9.0]
+    assert ring.since(10.0) == []
+
+
+def test_since_without_loader_covers_retained_events():
+    ring = EventRing(capacity=2)
+    for ts in (1.0, 2.0, 3.0):
+        ring.append(_event(ts))
+
+    # 未设置 loader 时只返回内存中保留的部分
+    assert [e.ts for e in ring.since(0.0)] == [2.0, 3.0]
+
+
+def test_spilled_events_are_paged_in_from_loader():
+    stored = [_event(float(ts)) for ts in range(5)]
+    requested: list[int] = []
+
+    def loader(n):
+        requested.append(n)
+        return stored[:n]
+
+    ring = EventRing(capacity=2, loader=loader)
+    for event in stored:
+        ring.append(event)
+
+    assert ring.spilled == 3
+    assert [e.ts for e in ring.all()] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    # 窗口落在内存范围内时不回读
+    assert [e.ts for e in ring.since(3.5)] == [4.0]
+    assert requested == [3]
+    assert [e.ts for e in ring.since(1.0)] == [1.0, 2.0, 3.0, 4.0]
+    assert requested == [3, 3]
@@ -461,18 +461,15 @@ const AIVideoCall: React.FC<AIVideoCallProps> = ({
       // 绘制当前帧
       context.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-      // 转换为 JPEG base64（但不立即发送，等待音频发送时一起发送）
+      // 转换为 JPEG 字节，以二进制帧发送（后端缩放去重后按自己的节奏单独上行，间隔随上行带宽自适应）
       canvas.toBlob((blob) => {
         if (blob) {
-          const reader = new FileReader();
-          reader.onloadend = () => {
-            const base64 = reader.result as string;
+          blob.arrayBuffer().then((jpeg) => {
             // 只有在连接活跃时才发送
             if (qwenRealtimeService.isConnectionActive()) {
-              qwenRealtimeService.sendImage(base64);
+              qwenRealtimeService.sendImage(jpeg);
             }
-          };
-          reader.readAsDataURL(blob);
+          });
         }
       }, 'image/jpeg', 0.6); // 降低质量到 0.6，减少数据量
 
@@ -1,8 +1,18 @@
 /**
  * Qwen-Omni-Realtime 服务（基于官方 Python SDK）
  * 通过 WebSocket 连接到 Python 后端
+ *
+ * 音频 / 视频帧以二进制消息收发（6 字节头：kind u8 | version u8 | seq u32，大端），
+ * 控制消息（init / commit / ping 等）仍为 JSON 文本。
  */
 
+// 二进制帧格式，与 backend/realtime_media.py 保持一致
+const FRAME_HEADER_SIZE = 6;
+const FRAME_VERSION = 1;
+const FRAME_AUDIO_IN = 1;   // PCM16 16kHz 单声道
+const FRAME_VIDEO_IN = 2;   // JPEG
+const FRAME_AUDIO_OUT = 3;  // PCM16 24kHz 单声道
+
 export interface RealtimeCallbacks {
   onConnected?: () => void;
   onSessionCreated?: () => void;
@@ -73,6 +83,8 @@ class QwenRealtimeService {
   private serverUrl: string;
   private currentAssistantTranscript: string = ''; // 跟踪当前 AI 回复的完整文本
   private currentUserTranscript: string = ''; // 累积用户转录文字
+  private audioSeq: number = 0;
+  private videoSeq: number = 0;
   
   constructor() {
     // 使用相对路径，通过 Vite 代理转发（支持 HTTPS）
@@ -97,6 +109,9 @@ class QwenRealtimeService {
       try {
         console.log('[Qwen Realtime] 连接到服务器:', this.serverUrl);
         this.ws = new WebSocket(this.serverUrl);
+        this.ws.binaryType = 'arraybuffer';
+        this.audioSeq = 0;
+        this.videoSeq = 0;
         
         this.ws.onopen = () => {
           console.log('[Qwen Realtime] WebSocket 连接已建立');
@@ -108,7 +123,8 @@ class QwenRealtimeService {
             type: 'init',
             childInfo: initOptions.childInfo,
             gameInfo: initOptions.gameInfo,
-            historyInfo: initOptions.historyInfo
+            historyInfo: initOptions.historyInfo,
+            binary: true  // 下行音频使用二进制帧
           }));
           
           if (this.callbacks.onConnected) {
@@ -120,6 +136,10 @@ class QwenRealtimeService {
         
         this.ws.onmessage = async (event) => {
           let data = event.data;
+          if (data instanceof ArrayBuffer) {
+            this.handleBinaryMessage(data);
+            return;
+          }
           if (data instanceof Blob) {
             data = await data.text();
           }
@@ -150,6 +170,35 @@ class QwenRealtimeService {
     });
   }
   
+  /**
+   * 处理二进制帧（下行音频）
+   */
+  private handleBinaryMessage(buffer: ArrayBuffer): void {
+    if (buffer.byteLength < FRAME_HEADER_SIZE) return;
+    const view = new DataView(buffer);
+    const kind = view.getUint8(0);
+    if (view.getUint8(1) !== FRAME_VERSION) {
+      console.warn('[Qwen Realtime] 不支持的二进制帧版本:', view.getUint8(1));
+      return;
+    }
+    if (kind === FRAME_AUDIO_OUT && this.callbacks.onAssistantAudio) {
+      this.callbacks.onAssistantAudio(buffer.slice(FRAME_HEADER_SIZE));
+    }
+  }
+  
+  /**
+   * 组装二进制帧
+   */
+  private packFrame(kind: number, seq: number, payload: ArrayBuffer): ArrayBuffer {
+    const frame = new Uint8Array(FRAME_HEADER_SIZE + payload.byteLength);
+    const view = new DataView(frame.buffer);
+    view.setUint8(0, kind);
+    view.setUint8(1, FRAME_VERSION);
+    view.setUint32(2, seq >>> 0);
+    frame.set(new Uint8Array(payload), FRAME_HEADER_SIZE);
+    return frame.buffer;
+  }
+  
   /**
    * 处理服务器消息
    */
@@ -288,12 +337,7 @@ class QwenRealtimeService {
       return;
     }
     
-    const base64Audio = this.arrayBufferToBase64(audioData);
-    
-    this.ws.send(JSON.stringify({
-      type: 'audio',
-      audio: base64Audio
-    }));
+    this.ws.send(this.packFrame(FRAME_AUDIO_IN, this.audioSeq++, audioData));
   }
   
   /**
@@ -309,21 +353,31 @@ class QwenRealtimeService {
   }
   
   /**
-   * 发送视频帧（JPEG 格式）
+   * 会话中途更新上下文（如游戏进行到下一步），后端只在提示词变化时更新会话
+   */
+  updateContext(patch: {
+    childInfo?: Partial<RealtimeInitOptions['childInfo']>;
+    gameInfo?: Partial<RealtimeInitOptions['gameInfo']>;
+    historyInfo?: Partial<RealtimeInitOptions['historyInfo']>;
+  }): void {
+    this.sendMessage({ type: 'update', ...patch });
+  }
+  
+  /**
+   * 发送视频帧（JPEG 字节，或 data URL）
    */
-  sendImage(imageDataUrl: string): void {
+  sendImage(image: ArrayBuffer | string): void {
     if (!this.ws || this.ws.readyState !== WebSocket.OPEN) {
       console.error('[Qwen Realtime] WebSocket 未连接');
       return;
     }
     
-    // 移除 data:image/jpeg;base64, 前缀
-    const base64Image = imageDataUrl.replace(/^data:image\/\w+;base64,/, '');
+    // data URL：移除 data:image/jpeg;base64, 前缀后解码
+    const jpeg = typeof image === 'string'
+      ? this.base64ToArrayBuffer(image.replace(/^data:image\/\w+;base64,/, ''))
+      : image;
     
-    this.ws.send(JSON.stringify({
-      type: 'image',
-      image: base64Image
-    }));
+    this.ws.send(this.packFrame(FRAME_VIDEO_IN, this.videoSeq++, jpeg));
   }
   
   /**
@@ -337,19 +391,6 @@ class QwenRealtimeService {
     }
   }
   
-  /**
-   * ArrayBuffer 转 Base64
-   */
-  private arrayBufferToBase64(buffer: ArrayBuffer): string {
-    const bytes = new Uint8Array(buffer);
-    let binary = '';
-    const len = bytes.byteLength;
-    for (let i = 0; i < len; i++) {
-      binary += String.fromCharCode(bytes[i]);
-    }
-    return btoa(binary);
-  }
-  
   /**
    * Base64 转 ArrayBuffer
    */